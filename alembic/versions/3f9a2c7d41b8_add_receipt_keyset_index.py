@@ -0,0 +1,28 @@
+"""add (user_id, created_at, id) index for receipt keyset pagination
+
+Revision ID: 3f9a2c7d41b8
+Revises: fb1d61820f2b
+Create Date: 2025-03-03 11:20:41.517903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a2c7d41b8'
+down_revision: Union[str, None] = 'fb1d61820f2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_receipt_user_created_at_id', 'receipts', ['user_id', 'created_at', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_receipt_user_created_at_id', 'receipts')
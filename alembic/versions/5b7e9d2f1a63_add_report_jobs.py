@@ -0,0 +1,49 @@
+"""add report_jobs table for background reports
+
+Revision ID: 5b7e9d2f1a63
+Revises: 8d41e6b0a5c2
+Create Date: 2025-03-14 16:05:38.912044
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e9d2f1a63'
+down_revision: Union[str, None] = '8d41e6b0a5c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('report_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.Enum('export', 'daily_totals', name='report_kind'), nullable=False),
+    sa.Column('format', sa.Enum('ndjson', 'csv', name='report_format'), nullable=False),
+    sa.Column('filters', sa.JSON(), nullable=False),
+    sa.Column('status', sa.Enum('pending', 'running', 'done', 'failed', name='report_status'),
+              nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('cursor', sa.String(), nullable=True),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_report_job_status_created_at', 'report_jobs', ['status', 'created_at'])
+    op.create_index('ix_report_job_user_id', 'report_jobs', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_report_job_user_id', 'report_jobs')
+    op.drop_index('ix_report_job_status_created_at', 'report_jobs')
+    op.drop_table('report_jobs')
+    for enum in ('report_status', 'report_format', 'report_kind'):
+        sa.Enum(name=enum).drop(op.get_bind(), checkfirst=True)
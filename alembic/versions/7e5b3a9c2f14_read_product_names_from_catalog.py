@@ -0,0 +1,51 @@
+"""read product names from the catalog and drop products.name
+
+Revision ID: 7e5b3a9c2f14
+Revises: 9c2e4f7a1d36
+Create Date: 2025-04-29 10:12:08.503716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e5b3a9c2f14'
+down_revision: Union[str, None] = '9c2e4f7a1d36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Line items written before the API linked them to the catalog, if any.
+    op.execute("""
+        INSERT INTO product_catalog (name)
+        SELECT DISTINCT name FROM products WHERE catalog_id IS NULL
+        ON CONFLICT (name) DO NOTHING
+    """)
+    op.execute("""
+        UPDATE products SET catalog_id = (
+            SELECT product_catalog.id FROM product_catalog
+            WHERE product_catalog.name = products.name
+        )
+        WHERE catalog_id IS NULL
+    """)
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.alter_column('catalog_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('name')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('name', sa.String(), nullable=True))
+    op.execute("""
+        UPDATE products SET name = (
+            SELECT product_catalog.name FROM product_catalog
+            WHERE product_catalog.id = products.catalog_id
+        )
+    """)
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.alter_column('name', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('catalog_id', existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,32 @@
+"""add revoked_tokens table for single-use refresh tokens
+
+Revision ID: 8d41e6b0a5c2
+Revises: 3f9a2c7d41b8
+Create Date: 2025-03-10 09:42:17.204556
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41e6b0a5c2'
+down_revision: Union[str, None] = '3f9a2c7d41b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('revoked_tokens',
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+    sa.PrimaryKeyConstraint('jti')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('revoked_tokens')
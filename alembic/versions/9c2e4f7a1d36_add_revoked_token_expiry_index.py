@@ -0,0 +1,26 @@
+"""add index on expiry of revoked tokens
+
+Revision ID: 9c2e4f7a1d36
+Revises: b7d4e2a6c935
+Create Date: 2025-04-22 14:05:31.642917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2e4f7a1d36'
+down_revision: Union[str, None] = 'b7d4e2a6c935'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Expired revoked tokens are purged by refresh requests.
+    op.create_index('ix_revoked_token_expires_at', 'revoked_tokens', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_revoked_token_expires_at', table_name='revoked_tokens')
@@ -0,0 +1,131 @@
+"""partition receipts and products by month on postgresql
+
+Revision ID: a3c9e5d71f08
+Revises: f1e3c7a90d52
+Create Date: 2025-04-07 16:45:12.590317
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e5d71f08'
+down_revision: Union[str, None] = 'f1e3c7a90d52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+PARTITION_MONTHS_AHEAD = 3
+
+# Constraints and indexes of both tables, recreated on the new tables once
+# the old ones and their names are gone.
+RECEIPT_CONSTRAINTS = [
+    "ALTER TABLE receipts ADD CONSTRAINT receipts_user_id_fkey "
+    "FOREIGN KEY (user_id) REFERENCES users (id)",
+    "CREATE INDEX ix_receipt_user_created_at_id ON receipts (user_id, created_at, id)",
+    "CREATE INDEX ix_receipt_user_type_created_at_id ON receipts (user_id, type, created_at, id)",
+]
+PRODUCT_CONSTRAINTS = [
+    "ALTER TABLE products ADD CONSTRAINT fk_products_catalog_id "
+    "FOREIGN KEY (catalog_id) REFERENCES product_catalog (id)",
+    "CREATE INDEX ix_product_receipt_id ON products (receipt_id)",
+    "CREATE INDEX ix_product_catalog_id ON products (catalog_id)",
+]
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def rebuild_tables(partitioned: bool):
+    """
+    Recreates `receipts` and `products` as partitioned or plain tables and
+    moves their rows over, keeping their ID sequences.
+    """
+    connection = op.get_bind()
+    sequences = {
+        table: connection.scalar(sa.text(f"SELECT pg_get_serial_sequence('{table}', 'id')"))
+        for table in ('receipts', 'products')
+    }
+    for table in ('products', 'receipts'):
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+        op.execute(f"ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey")
+
+    if partitioned:
+        for table in ('receipts', 'products'):
+            op.execute(
+                f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS, "
+                f"PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"
+            )
+        first = connection.scalar(sa.text("SELECT MIN(created_at) FROM receipts_old"))
+        month = (first.date() if first else date.today()).replace(day=1)
+        last = add_months(date.today().replace(day=1), PARTITION_MONTHS_AHEAD)
+        while month <= last:
+            for table in ('receipts', 'products'):
+                op.execute(
+                    f"CREATE TABLE {table}_y{month.year}m{month.month:02d} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                )
+            month = add_months(month, 1)
+        for table in ('receipts', 'products'):
+            op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    else:
+        for table in ('receipts', 'products'):
+            op.execute(
+                f"CREATE TABLE {table} (LIKE {table}_old INCLUDING DEFAULTS, PRIMARY KEY (id))"
+            )
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN created_at DROP NOT NULL")
+
+    for table in ('receipts', 'products'):
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+        op.execute(f"ALTER SEQUENCE {sequences[table]} OWNED BY {table}.id")
+    op.execute("DROP TABLE products_old CASCADE")
+    op.execute("DROP TABLE receipts_old CASCADE")
+
+    for statement in RECEIPT_CONSTRAINTS + PRODUCT_CONSTRAINTS:
+        op.execute(statement)
+    if partitioned:
+        # A partitioned table can only be referenced through a key that
+        # includes its partition key.
+        op.execute(
+            "ALTER TABLE products ADD CONSTRAINT products_receipt_id_fkey "
+            "FOREIGN KEY (receipt_id, created_at) REFERENCES receipts (id, created_at)"
+        )
+    else:
+        op.execute(
+            "ALTER TABLE products ADD CONSTRAINT products_receipt_id_fkey "
+            "FOREIGN KEY (receipt_id) REFERENCES receipts (id)"
+        )
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    # Products are stamped with the creation time of their receipt in batches
+    # of IDs, each committed on its own.
+    connection = op.get_bind()
+    max_id = connection.scalar(sa.text("SELECT MAX(id) FROM products")) or 0
+    with op.get_context().autocommit_block():
+        for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            connection.execute(sa.text("""
+                UPDATE products SET created_at = (
+                    SELECT receipts.created_at FROM receipts
+                    WHERE receipts.id = products.receipt_id
+                )
+                WHERE id >= :start AND id < :end
+            """), {'start': start, 'end': start + BACKFILL_BATCH_SIZE})
+
+    if connection.dialect.name == 'postgresql':
+        rebuild_tables(partitioned=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        rebuild_tables(partitioned=False)
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('created_at')
@@ -0,0 +1,50 @@
+"""add user_stats table with running receipt totals
+
+Revision ID: a92f0c6e58d4
+Revises: e4c1a8b93d27
+Create Date: 2025-03-20 15:12:09.381527
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a92f0c6e58d4'
+down_revision: Union[str, None] = 'e4c1a8b93d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('receipts', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('cash_receipts', sa.Integer(), nullable=False),
+    sa.Column('cash_total', sa.Float(), nullable=False),
+    sa.Column('cashless_receipts', sa.Integer(), nullable=False),
+    sa.Column('cashless_total', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Totals of large tables can also be filled in batches after deploying
+    # with `python -m app.users.backfill_stats`.
+    op.execute("""
+        INSERT INTO user_stats (user_id, receipts, total, cash_receipts, cash_total,
+                                cashless_receipts, cashless_total)
+        SELECT user_id, COUNT(id), COALESCE(SUM(total), 0),
+               SUM(CASE WHEN type = 'cash' THEN 1 ELSE 0 END),
+               COALESCE(SUM(CASE WHEN type = 'cash' THEN total ELSE 0 END), 0),
+               SUM(CASE WHEN type = 'cashless' THEN 1 ELSE 0 END),
+               COALESCE(SUM(CASE WHEN type = 'cashless' THEN total ELSE 0 END), 0)
+        FROM receipts
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('user_stats')
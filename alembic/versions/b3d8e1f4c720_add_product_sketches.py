@@ -0,0 +1,67 @@
+"""add product_sketches table and fill it from existing line items
+
+Revision ID: b3d8e1f4c720
+Revises: a92f0c6e58d4
+Create Date: 2025-03-24 10:48:31.507216
+
+"""
+from datetime import date
+from itertools import groupby
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d8e1f4c720'
+down_revision: Union[str, None] = 'a92f0c6e58d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SKETCH_CAPACITY = 200
+INSERT_BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    product_sketches = op.create_table('product_sketches',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('metric', sa.Enum('revenue', 'quantity', name='sketch_metric'), nullable=False),
+    sa.Column('counters', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'metric')
+    )
+
+    # The exact heaviest products of a day are a valid summary: every product
+    # left out weighs no more than the lightest one kept.
+    rows = op.get_bind().execution_options(stream_results=True).execute(sa.text("""
+        SELECT receipts.user_id, DATE(receipts.created_at) AS day, products.name,
+               COALESCE(SUM(products.total), 0) AS revenue,
+               COALESCE(SUM(products.quantity), 0) AS quantity
+        FROM products JOIN receipts ON receipts.id = products.receipt_id
+        WHERE receipts.user_id IS NOT NULL
+        GROUP BY receipts.user_id, DATE(receipts.created_at), products.name
+        ORDER BY receipts.user_id, DATE(receipts.created_at)
+    """))
+    batch = []
+    for (user_id, day), products in groupby(rows, key=lambda row: (row.user_id, row.day)):
+        products = list(products)
+        for metric in ('revenue', 'quantity'):
+            heaviest = sorted(products, key=lambda row: getattr(row, metric), reverse=True)
+            batch.append({
+                'user_id': user_id, 'day': date.fromisoformat(str(day)), 'metric': metric,
+                'counters': {
+                    row.name: [getattr(row, metric), 0] for row in heaviest[:SKETCH_CAPACITY]
+                },
+            })
+        if len(batch) >= INSERT_BATCH_SIZE:
+            op.bulk_insert(product_sketches, batch)
+            batch = []
+    if batch:
+        op.bulk_insert(product_sketches, batch)
+
+
+def downgrade() -> None:
+    op.drop_table('product_sketches')
+    sa.Enum(name='sketch_metric').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,45 @@
+"""widen receipt ids for sharding
+
+Revision ID: b7d4e2a6c935
+Revises: a3c9e5d71f08
+Create Date: 2025-04-14 10:12:40.183522
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d4e2a6c935'
+down_revision: Union[str, None] = 'a3c9e5d71f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Receipt IDs carry the index of their shard in bits 40 and up.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('products', 'receipt_id', type_=sa.BigInteger())
+        op.alter_column('receipts', 'id', type_=sa.BigInteger())
+        op.execute("ALTER SEQUENCE receipts_id_seq AS bigint")
+    else:
+        # SQLite IDs are 64-bit already; AUTOINCREMENT lets a shard's range
+        # be set in sqlite_sequence.
+        with op.batch_alter_table(
+            'receipts', recreate='always', table_kwargs={'sqlite_autoincrement': True}
+        ):
+            pass
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER SEQUENCE receipts_id_seq AS integer")
+        op.alter_column('receipts', 'id', type_=sa.Integer())
+        op.alter_column('products', 'receipt_id', type_=sa.Integer())
+    else:
+        with op.batch_alter_table(
+            'receipts', recreate='always', table_kwargs={'sqlite_autoincrement': False}
+        ):
+            pass
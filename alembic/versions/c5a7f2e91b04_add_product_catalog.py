@@ -0,0 +1,64 @@
+"""add product_catalog table and link line items to it
+
+Revision ID: c5a7f2e91b04
+Revises: b3d8e1f4c720
+Create Date: 2025-03-27 09:31:46.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a7f2e91b04'
+down_revision: Union[str, None] = 'b3d8e1f4c720'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.create_table('product_catalog',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('catalog_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_products_catalog_id', 'product_catalog', ['catalog_id'], ['id']
+        )
+    op.create_index('ix_product_catalog_id', 'products', ['catalog_id'])
+
+    # Line items are linked in batches of IDs, each committed on its own, so
+    # the backfill doesn't hold locks on the whole products table.
+    # `products.name` is kept until every reader uses the catalog.
+    connection = op.get_bind()
+    max_id = connection.scalar(sa.text("SELECT MAX(id) FROM products")) or 0
+    with op.get_context().autocommit_block():
+        for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            batch = {'start': start, 'end': start + BACKFILL_BATCH_SIZE}
+            connection.execute(sa.text("""
+                INSERT INTO product_catalog (name)
+                SELECT DISTINCT name FROM products WHERE id >= :start AND id < :end
+                ON CONFLICT (name) DO NOTHING
+            """), batch)
+            connection.execute(sa.text("""
+                UPDATE products SET catalog_id = (
+                    SELECT product_catalog.id FROM product_catalog
+                    WHERE product_catalog.name = products.name
+                )
+                WHERE id >= :start AND id < :end AND catalog_id IS NULL
+            """), batch)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_product_catalog_id', 'products')
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_constraint('fk_products_catalog_id', type_='foreignkey')
+        batch_op.drop_column('catalog_id')
+    op.drop_table('product_catalog')
@@ -0,0 +1,52 @@
+"""add trigram index for product name search
+
+Revision ID: d6f2b9a04e11
+Revises: c5a7f2e91b04
+Create Date: 2025-03-31 14:03:27.845190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f2b9a04e11'
+down_revision: Union[str, None] = 'c5a7f2e91b04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX ix_product_catalog_name_trgm ON product_catalog "
+            "USING gin (name gin_trgm_ops)"
+        )
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE product_catalog_fts USING fts5("
+            "name, content='product_catalog', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER product_catalog_fts_insert AFTER INSERT ON product_catalog BEGIN "
+            "INSERT INTO product_catalog_fts (rowid, name) VALUES (new.id, new.name); END"
+        )
+        op.execute(
+            "CREATE TRIGGER product_catalog_fts_delete AFTER DELETE ON product_catalog BEGIN "
+            "INSERT INTO product_catalog_fts (product_catalog_fts, rowid, name) "
+            "VALUES ('delete', old.id, old.name); END"
+        )
+        op.execute("INSERT INTO product_catalog_fts (product_catalog_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX ix_product_catalog_name_trgm")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER product_catalog_fts_delete")
+        op.execute("DROP TRIGGER product_catalog_fts_insert")
+        op.execute("DROP TABLE product_catalog_fts")
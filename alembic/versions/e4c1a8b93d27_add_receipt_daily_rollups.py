@@ -0,0 +1,53 @@
+"""add receipt_daily_rollups table and backfill it from receipts
+
+Revision ID: e4c1a8b93d27
+Revises: 5b7e9d2f1a63
+Create Date: 2025-03-18 11:27:54.630918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4c1a8b93d27'
+down_revision: Union[str, None] = '5b7e9d2f1a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HOUR_EXPRESSIONS = {
+    'postgresql': "CAST(EXTRACT(HOUR FROM created_at) AS INTEGER)",
+    'sqlite': "CAST(strftime('%H', created_at) AS INTEGER)",
+}
+
+
+def upgrade() -> None:
+    payment_type = postgresql.ENUM('cash', 'cashless', name='payment_type', create_type=False)
+    op.create_table('receipt_daily_rollups',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('type', payment_type, nullable=False),
+    sa.Column('receipts', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'hour', 'type')
+    )
+
+    hour = HOUR_EXPRESSIONS[op.get_bind().dialect.name]
+    op.execute(f"""
+        INSERT INTO receipt_daily_rollups (user_id, day, hour, type, receipts, total, amount)
+        SELECT user_id, DATE(created_at), {hour}, type, COUNT(id),
+               COALESCE(SUM(total), 0), SUM(amount)
+        FROM receipts
+        WHERE user_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY user_id, DATE(created_at), {hour}, type
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('receipt_daily_rollups')
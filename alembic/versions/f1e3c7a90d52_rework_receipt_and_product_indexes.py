@@ -0,0 +1,38 @@
+"""index products.receipt_id and drop indexes no query uses
+
+Revision ID: f1e3c7a90d52
+Revises: d6f2b9a04e11
+Create Date: 2025-04-02 10:12:45.301842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1e3c7a90d52'
+down_revision: Union[str, None] = 'd6f2b9a04e11'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_product_receipt_id', 'products', ['receipt_id'])
+    op.create_index(
+        'ix_receipt_user_type_created_at_id', 'receipts', ['user_id', 'type', 'created_at', 'id']
+    )
+    # Every receipt query is scoped to a user, so these are superseded by the
+    # indexes leading with user_id, and the unique constraint on users.login
+    # already has an index of its own.
+    op.drop_index('ix_receipt_total', 'receipts')
+    op.drop_index('ix_receipt_created_at', 'receipts')
+    op.drop_index('ix_user_login', 'users')
+
+
+def downgrade() -> None:
+    op.create_index('ix_user_login', 'users', ['login'])
+    op.create_index('ix_receipt_created_at', 'receipts', ['created_at'])
+    op.create_index('ix_receipt_total', 'receipts', ['total'])
+    op.drop_index('ix_receipt_user_type_created_at_id', 'receipts')
+    op.drop_index('ix_product_receipt_id', 'products')
@@ -1,9 +1,17 @@
+import asyncio
+import hashlib
+import multiprocessing
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Union
 
 from dotenv import load_dotenv
-from fastapi import HTTPException
+from fastapi import HTTPException, status
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
@@ -11,13 +19,93 @@ from passlib.context import CryptContext
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
+REVOKED_TOKEN_CACHE_SIZE = int(os.getenv("REVOKED_TOKEN_CACHE_SIZE", 100000))
+REVOKED_TOKEN_PURGE_INTERVAL = float(os.getenv("REVOKED_TOKEN_PURGE_INTERVAL", 3600))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", 5))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 if not SECRET_KEY or not ALGORITHM:
     raise EnvironmentError("Environment variables SECRET_KEY and ALGORITHM must be set")
 
 
+class TokenCache:
+    """
+    A bounded LRU cache of decoded token payloads.
+
+    Entries are keyed by the SHA-256 digest of the token, so raw tokens are
+    not kept in memory, and are only served until the token's `exp` claim.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        """
+        Returns the cached payload of a token that hasn't expired yet.
+
+        Args:
+            token (str): The JWT token.
+
+        Returns:
+            dict: A copy of the decoded payload, or None on a cache miss.
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, token: str, payload: dict):
+        """
+        Caches the decoded payload of a token until its expiration time.
+
+        Payloads without an `exp` claim are not cached.
+
+        Args:
+            token (str): The JWT token.
+            payload (dict): The decoded and validated payload of the token.
+        """
+        if self.max_size <= 0 or "exp" not in payload:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(payload), payload["exp"])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+# Negative cache of used refresh token ids, keyed by `jti` instead of the token.
+revoked_token_cache = TokenCache(REVOKED_TOKEN_CACHE_SIZE)
+
+
 def create_token(data: dict, expires_delta: Union[timedelta, None] = None):
     """
     Creates a JWT token with an expiration time.
@@ -40,6 +128,22 @@ def create_token(data: dict, expires_delta: Union[timedelta, None] = None):
     return encoded_jwt
 
 
+def create_refresh_token(data: dict):
+    """
+    Creates a single-use refresh token.
+
+    Args:
+        data (dict): The claims to copy into the access tokens issued with it.
+
+    Returns:
+        str: The encoded JWT refresh token, with a unique `jti` claim.
+    """
+    return create_token(
+        {**data, "type": "refresh", "jti": uuid.uuid4().hex},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+
+
 def get_password_hash(password):
     """
     Hashes a password using the password context.
@@ -67,10 +171,100 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password, hashed_password):
+    """
+    Verifies a password and rehashes it if its hash uses outdated settings.
+
+    Args:
+        plain_password (str): The plain-text password to verify.
+        hashed_password (str): The hashed password to compare with.
+
+    Returns:
+        tuple: Whether the passwords match, and the new hash to store if the
+        current one needs an update (None otherwise).
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt work in a dedicated process pool.
+
+    Hashing is CPU bound, so it runs outside of the API process where it would
+    compete with other requests for the GIL and the threadpool. At most
+    `workers` calls are in flight; callers waiting longer than
+    `queue_timeout` seconds for a free worker get a 503 response.
+    """
+
+    def __init__(self, workers: int, queue_timeout: float):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.workers)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def run(self, func, *args):
+        """
+        Runs a password hashing function in the process pool.
+
+        Args:
+            func (Callable): A module level function such as `get_password_hash`.
+            *args: The arguments to pass to the function.
+
+        Returns:
+            Any: The return value of the function.
+
+        Raises:
+            HTTPException: If no worker becomes available within the queue timeout.
+        """
+        semaphore = self._get_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again later",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            semaphore.release()
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_TIMEOUT)
+
+
 def decode_token(token: str):
     """
     Decodes and validates a JWT token.
 
+    Payloads of valid tokens are cached until the token expires, so a token
+    presented again skips signature verification.
+
     Args:
         token (str): The JWT token to decode.
 
@@ -80,8 +274,12 @@ def decode_token(token: str):
     Raises:
         HTTPException: If the token is invalid or expired.
     """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.set(token, payload)
         return payload
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
\ No newline at end of file
@@ -0,0 +1,62 @@
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+
+class CacheBackend(ABC):
+    """
+    Interface of a key-value store for cached response bodies.
+
+    An external store such as Redis or Memcached can be plugged in by
+    implementing `get` and `set`.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the value stored under a key, or None if it isn't cached.
+        """
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes):
+        """
+        Stores a value under a key. The backend may evict it at any time.
+        """
+
+
+class LRUCacheBackend(CacheBackend):
+    """
+    An in-process cache that evicts the least recently used entries once the
+    total size of keys and values exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes):
+        entry_size = len(key) + len(value)
+        if entry_size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(key) + len(previous)
+            self._entries[key] = value
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                evicted_key, evicted_value = self._entries.popitem(last=False)
+                self.size -= len(evicted_key) + len(evicted_value)
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,5 +1,11 @@
+import base64
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
 from fastapi import HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 from app.receipts.model import Receipt
 
@@ -13,9 +19,9 @@ def create_json_response(data, status_code=status.HTTP_200_OK):
         status_code (int): The HTTP status code (default is 200).
 
     Returns:
-        JSONResponse: The JSON response with the provided data and status code.
+        ORJSONResponse: The JSON response with the provided data and status code.
     """
-    return JSONResponse(status_code=status_code, content=data)
+    return ORJSONResponse(status_code=status_code, content=data)
 
 
 def raise_not_found_exception(detail: str):
@@ -31,6 +37,104 @@ def raise_not_found_exception(detail: str):
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
 
 
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Converts a datetime to the naive UTC time the database stores.
+
+    Timezone-aware values are converted to UTC; naive ones are taken to be in
+    UTC already.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def encode_cursor(created_at: datetime, receipt_id: int) -> str:
+    """
+    Encodes a keyset pagination position into an opaque cursor string.
+
+    Args:
+        created_at (datetime): The creation time of the last receipt on the page.
+        receipt_id (int): The ID of the last receipt on the page.
+
+    Returns:
+        str: A URL-safe cursor string.
+    """
+    raw = json.dumps([created_at.isoformat(), receipt_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Decodes a cursor string created by `encode_cursor`.
+
+    Args:
+        cursor (str): The opaque cursor string.
+
+    Returns:
+        tuple: The `(created_at, receipt_id)` position encoded in the cursor.
+
+    Raises:
+        HTTPException: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, receipt_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(receipt_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    """
+    Builds an entity tag from the values that identify a representation.
+
+    Args:
+        *parts: The values the representation depends on.
+        weak (bool): Whether to build a weak validator (default is False).
+
+    Returns:
+        str: The quoted entity tag, prefixed with `W/` if it is weak.
+    """
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Checks an `If-None-Match` header against an entity tag using weak comparison.
+
+    Args:
+        if_none_match (str): The value of the `If-None-Match` request header.
+        etag (str): The current entity tag of the representation.
+
+    Returns:
+        bool: True if the client already has the current representation.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque_tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def create_not_modified_response(headers: dict):
+    """
+    Creates a 304 Not Modified response.
+
+    Args:
+        headers (dict): The validator and caching headers of the representation.
+
+    Returns:
+        Response: An empty 304 response with the provided headers.
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
 def calculate_product_total(price: float, quantity: int) -> float:
     """
     Calculates the total price for a product.
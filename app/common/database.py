@@ -1,26 +1,429 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in the environment variables")
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    """
+    Converts a database URL to the URL of its async driver.
+
+    Args:
+        database_url (str): The database URL, e.g. `postgresql://...` or `sqlite:///...`.
+
+    Returns:
+        str: The URL using asyncpg for PostgreSQL and aiosqlite for SQLite.
+        URLs of other backends are returned unchanged.
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
+
+UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def build_increment_upsert(dialect_name: str, model, key_columns: list):
+    """
+    Builds an INSERT that adds to the counters of existing rows on conflict.
+
+    Args:
+        dialect_name (str): The name of the database dialect, e.g. `postgresql`.
+        model (Base): The model of the counters table.
+        key_columns (list): The names of the columns of its primary key.
+
+    Returns:
+        Insert: The statement; every non-key column is incremented by the
+        inserted value when a row with the same key already exists.
+    """
+    statement = UPSERT_DIALECTS[dialect_name](model)
+    return statement.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={
+            column.name: column + statement.excluded[column.name]
+            for column in model.__table__.columns
+            if column.name not in key_columns
+        },
+    )
+
+
+# The sync engine is used by migrations, schema creation and command line tools.
 engine = create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(get_async_database_url(DATABASE_URL))
+
+AsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
+
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+# Receipts and everything derived from them are sharded by user across the
+# databases listed here; users, tokens and report jobs stay in DATABASE_URL.
+DATABASE_SHARD_URLS = [
+    url.strip() for url in os.getenv("DATABASE_SHARD_URLS", DATABASE_URL).split(",") if url.strip()
+]
+SHARD_RING_REPLICAS = int(os.getenv("SHARD_RING_REPLICAS", 64))
+# Receipt IDs of shard N start at N << SHARD_ID_BITS, so an ID names its shard.
+SHARD_ID_BITS = 40
+
+# Read replicas of the shards, in the order of DATABASE_SHARD_URLS: the
+# replicas of a shard are separated by commas and the shards by semicolons.
+DATABASE_REPLICA_URLS = [
+    [url.strip() for url in urls.split(",") if url.strip()]
+    for urls in os.getenv("DATABASE_REPLICA_URLS", "").split(";")
+]
+# Reads of a client within this many seconds of its last write go to the
+# primary, and replicas lagging further behind are left out.
+DATABASE_REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", 5))
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", 10))
+# Checks run inside requests, so a replica that doesn't answer in time counts as down.
+DATABASE_REPLICA_CHECK_TIMEOUT = float(os.getenv("DATABASE_REPLICA_CHECK_TIMEOUT", 1))
+
+# Seconds of WAL replay a PostgreSQL standby is behind; 0 once it replayed
+# everything it received, since the replay timestamp only moves on writes.
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def _ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def shard_id_range(shard: int) -> tuple:
+    """
+    Returns the first receipt ID of a shard and the first ID past its range.
+    """
+    return shard << SHARD_ID_BITS, (shard + 1) << SHARD_ID_BITS
+
+
+async def reset_id_sequence(db: AsyncSession, shard: int):
+    """
+    Makes a shard generate receipt IDs from its own range.
+
+    The sequence is only ever moved forward, in a single statement, so this
+    can run concurrently with writes to the shard. Users only ever move to
+    shards appended after the one they are on, whose ranges are higher, so
+    the IDs of moved receipts never push a sequence past the range of its
+    shard.
+
+    Args:
+        db (AsyncSession): A session on the shard.
+        shard (int): The index of the shard.
+
+    Raises:
+        RuntimeError: If the shard has generated IDs past its range.
+    """
+    start, end = shard_id_range(shard)
+    if db.get_bind().dialect.name == 'postgresql':
+        sequence = await db.scalar(text("SELECT pg_get_serial_sequence('receipts', 'id')"))
+        current = await db.scalar(
+            text(f"SELECT setval('{sequence}', GREATEST(last_value, :start)) FROM {sequence}"),
+            {'start': max(start, 1)}
+        )
+    else:
+        # SQLite continues after the highest of the recorded sequence and the highest ID.
+        await db.execute(text(
+            "UPDATE sqlite_sequence SET seq = :start WHERE name = 'receipts' AND seq < :start"
+        ), {'start': start})
+        await db.execute(text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'receipts', :start "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'receipts')"
+        ), {'start': start})
+        current = max(
+            await db.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = 'receipts'")),
+            await db.scalar(text("SELECT MAX(id) FROM receipts")) or 0,
+        )
+    await db.commit()
+    if current >= end:
+        raise RuntimeError(f"Receipt IDs of shard {shard} have run past its range")
+
+
+def _create_session_factory(url: str) -> async_sessionmaker:
+    if url == DATABASE_URL:
+        return AsyncSessionLocal
+    return async_sessionmaker(
+        autoflush=False, expire_on_commit=False,
+        bind=create_async_engine(get_async_database_url(url))
+    )
+
+
+class ReplicaSet:
+    """
+    The read replicas of a database, used in turn.
+
+    A replica is checked before its first use and then every
+    `check_interval` seconds. Replicas that can't be reached within
+    `check_timeout` seconds or lag more than `max_lag` seconds behind are
+    left out until a later check passes; so are replicas whose queries fail
+    to connect.
+    """
+
+    def __init__(self, session_factories: List[async_sessionmaker],
+                 max_lag: float = DATABASE_REPLICA_MAX_LAG,
+                 check_interval: float = DATABASE_REPLICA_CHECK_INTERVAL,
+                 check_timeout: float = DATABASE_REPLICA_CHECK_TIMEOUT):
+        self.session_factories = session_factories
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self._turns = itertools.count()
+        self._healthy = [False] * len(session_factories)
+        self._checked_at = [None] * len(session_factories)
+
+    def __len__(self):
+        return len(self.session_factories)
+
+    async def _measure_lag(self, replica: int) -> float:
+        async with self.session_factories[replica]() as db:
+            if db.get_bind().dialect.name == 'postgresql':
+                return await db.scalar(text(REPLICA_LAG_QUERY))
+            return await db.scalar(text("SELECT 0"))
+
+    async def check(self, replica: int) -> bool:
+        """
+        Checks that a replica answers in time and is close enough to its primary.
+        """
+        try:
+            lag = await asyncio.wait_for(self._measure_lag(replica), self.check_timeout)
+            healthy = lag <= self.max_lag
+            if not healthy:
+                logger.warning("Replica %s is %.1f seconds behind", replica, lag)
+        except asyncio.TimeoutError:
+            logger.warning("Replica %s didn't answer within %s seconds",
+                           replica, self.check_timeout)
+            healthy = False
+        except (DBAPIError, OSError):
+            logger.warning("Replica %s is unreachable", replica, exc_info=True)
+            healthy = False
+        self._healthy[replica] = healthy
+        self._checked_at[replica] = time.monotonic()
+        return healthy
+
+    def mark_down(self, replica: int):
+        self._healthy[replica] = False
+        self._checked_at[replica] = time.monotonic()
+
+    async def pick(self) -> Optional[int]:
+        """
+        Returns the next healthy replica in round-robin order, or None if
+        none is healthy.
+        """
+        for _ in range(len(self.session_factories)):
+            replica = next(self._turns) % len(self.session_factories)
+            checked_at = self._checked_at[replica]
+            if checked_at is None or time.monotonic() - checked_at >= self.check_interval:
+                await self.check(replica)
+            if self._healthy[replica]:
+                return replica
+        return None
+
+
+class ShardRouter:
+    """
+    Maps users and receipts to the database shards that hold them.
+
+    Users are placed on a consistent hash ring with `replicas` points per
+    shard, so appending a shard moves only about 1/N of the users to it.
+    Shards are identified by their position in the list, which is also
+    encoded in the receipt IDs they generate, so they can only be appended,
+    never reordered or removed.
+
+    Shards may have read replicas, which `reading` sessions are opened on.
+    """
+
+    def __init__(self, session_factories: List[async_sessionmaker],
+                 replica_sets: List[Optional[ReplicaSet]] = None,
+                 ring_replicas: int = SHARD_RING_REPLICAS):
+        self.session_factories = session_factories
+        self.replica_sets = list(replica_sets or [])
+        self.replica_sets += [None] * (len(session_factories) - len(self.replica_sets))
+        self._ring = sorted(
+            (_ring_hash(f"shard-{shard}-{replica}"), shard)
+            for shard in range(len(session_factories))
+            for replica in range(ring_replicas)
+        )
+        self._points = [point for point, _ in self._ring]
+        # The first shard's range starts at 0, so every sequence fits it.
+        self._id_ranges_checked = {0}
+        self._sync_session_factories = {}
+
+    @classmethod
+    def from_urls(cls, urls: List[str], replica_urls: List[List[str]] = (),
+                  **kwargs) -> 'ShardRouter':
+        """
+        Creates a router with an async engine per shard and replica URL,
+        reusing the main engine for DATABASE_URL.
+        """
+        replica_sets = [
+            ReplicaSet([_create_session_factory(url) for url in urls]) if urls else None
+            for urls in replica_urls
+        ]
+        return cls([_create_session_factory(url) for url in urls], replica_sets, **kwargs)
+
+    @property
+    def has_replicas(self) -> bool:
+        return any(self.replica_sets)
+
+    def __len__(self):
+        return len(self.session_factories)
+
+    def shard_for_user(self, user_id: int) -> int:
+        if len(self.session_factories) == 1:
+            return 0
+        index = bisect.bisect(self._points, _ring_hash(f"user-{user_id}")) % len(self._ring)
+        return self._ring[index][1]
+
+    def shard_for_receipt(self, receipt_id: int) -> Optional[int]:
+        """
+        Returns the shard that generated a receipt ID, or None if the ID
+        doesn't belong to any shard.
+        """
+        shard = receipt_id >> SHARD_ID_BITS
+        return shard if 0 <= shard < len(self.session_factories) else None
+
+    def receipt_lookup_order(self, receipt_id: int) -> List[int]:
+        """
+        Returns the shards to look a receipt up in: the one its ID names first,
+        then the others, which hold receipts moved there by the rebalancer.
+        """
+        shards = list(range(len(self.session_factories)))
+        shard = self.shard_for_receipt(receipt_id)
+        if shard is not None:
+            shards.remove(shard)
+            shards.insert(0, shard)
+        return shards
+
+    def session(self, shard: int) -> AsyncSession:
+        """
+        Opens a session on a shard. The shard is recorded in the session's
+        `info`, so per-shard state such as catalog IDs can be told apart.
+        """
+        db = self.session_factories[shard]()
+        db.sync_session.info.update(shard=shard, shard_router=self)
+        return db
+
+    async def ensure_id_range(self, shard: int):
+        """
+        Makes sure a shard generates receipt IDs from its own range before
+        anything is written to it, so a newly appended shard can't hand out
+        IDs that name another shard. Done once per shard and process.
+
+        Args:
+            shard (int): The index of the shard.
+
+        Raises:
+            RuntimeError: If the shard has generated IDs past its range.
+        """
+        if shard in self._id_ranges_checked:
+            return
+        async with self.session(shard) as db:
+            await reset_id_sequence(db, shard)
+        self._id_ranges_checked.add(shard)
+
+    def sync_session_factory(self, shard: int) -> sessionmaker:
+        """
+        Returns a factory of sync sessions on a shard, for command line tools.
+        The main sync engine is reused for DATABASE_URL.
+        """
+        if shard not in self._sync_session_factories:
+            url = self.session_factories[shard].kw["bind"].url
+            if url == async_engine.url:
+                factory = SessionLocal
+            else:
+                url = url.set(drivername=url.get_backend_name())
+                factory = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(url))
+            self._sync_session_factories[shard] = factory
+        return self._sync_session_factories[shard]
+
+    @asynccontextmanager
+    async def reading(self, shard: int, primary: bool = False):
+        """
+        Opens a session for reads on a healthy replica of a shard.
+
+        The shard's primary is used when `primary` is set, e.g. to read a
+        client's own recent writes, or when it has no healthy replica. A
+        replica whose connection fails during the reads is left out until
+        its next check.
+
+        Args:
+            shard (int): The index of the shard.
+            primary (bool): Whether to read from the primary.
+
+        Yields:
+            AsyncSession: The session.
+        """
+        replica_set = self.replica_sets[shard]
+        replica = None if primary or replica_set is None else await replica_set.pick()
+        if replica is None:
+            async with self.session(shard) as db:
+                yield db
+            return
+
+        db = replica_set.session_factories[replica]()
+        db.sync_session.info.update(shard=shard, shard_router=self, replica=replica)
+        async with db:
+            try:
+                yield db
+            except DBAPIError as exc:
+                if exc.connection_invalidated:
+                    replica_set.mark_down(replica)
+                raise
+
+    async def dispose(self):
+        factories = list(self.session_factories)
+        for replica_set in filter(None, self.replica_sets):
+            factories += replica_set.session_factories
+        for factory in factories:
+            await factory.kw["bind"].dispose()
+
+
+shard_router = ShardRouter.from_urls(DATABASE_SHARD_URLS, DATABASE_REPLICA_URLS)
+
+
+def get_shard_router() -> ShardRouter:
+    return shard_router
@@ -1,6 +1,60 @@
-from fastapi import Depends
+import time
+
+from fastapi import Depends, Request, Response
+from app.common.database import DATABASE_REPLICA_MAX_LAG, ShardRouter, get_shard_router
 from app.users.crud import get_current_user
+from app.users.schemas import Principal
+
+# Holds the time of the client's last write, while replicas may not have it yet.
+LAST_WRITE_COOKIE = "last_write"
+
+
+async def require_auth(user: Principal = Depends(get_current_user)):
+    return user
+
+
+def remember_write(response: Response, shards: ShardRouter):
+    """
+    Makes the client's reads go to the primaries until replicas have caught
+    up with its write.
+    """
+    if shards.has_replicas:
+        response.set_cookie(
+            LAST_WRITE_COOKIE, f"{time.time():.3f}",
+            max_age=int(DATABASE_REPLICA_MAX_LAG) + 1, httponly=True, samesite="lax"
+        )
+
+
+def read_own_writes(request: Request) -> bool:
+    """
+    Tells whether the client wrote recently enough that replicas may not
+    have its write yet.
+    """
+    try:
+        written_at = float(request.cookies.get(LAST_WRITE_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - written_at < DATABASE_REPLICA_MAX_LAG
+
+
+async def get_user_db(
+    user: Principal = Depends(require_auth), shards: ShardRouter = Depends(get_shard_router)
+):
+    """
+    Yields a session on the shard that holds the authenticated user's receipts.
+    """
+    async with shards.session(shards.shard_for_user(user.id)) as db:
+        yield db
 
 
-def require_auth(user: dict = Depends(get_current_user)):
-    return user
\ No newline at end of file
+async def get_user_read_db(
+    user: Principal = Depends(require_auth),
+    shards: ShardRouter = Depends(get_shard_router),
+    primary: bool = Depends(read_own_writes)
+):
+    """
+    Yields a session for reads of the authenticated user's receipts, on a
+    replica of their shard unless they wrote recently.
+    """
+    async with shards.reading(shards.shard_for_user(user.id), primary) as db:
+        yield db
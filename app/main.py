@@ -1,11 +1,34 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from app.common.auth_utils import password_hasher
 from app.common.database import engine, Base
 from app.users.endpoints import router as user_router
+from app.products.endpoints import router as product_router
 from app.receipts.endpoints import router as receipt_router
+from app.reports.endpoints import router as report_router
+from app.receipts.writer import receipt_writers
+from app.products.flusher import product_sketch_flusher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    product_sketch_flusher.start()
+    yield
+    # Receipts still waiting for a group commit are written before shutdown,
+    # then the product summaries of all receipts written are persisted.
+    for receipt_writer in receipt_writers:
+        await receipt_writer.stop()
+    await product_sketch_flusher.stop()
+    password_hasher.shutdown()
+
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.include_router(user_router, prefix="/users", tags=["users"])
 app.include_router(receipt_router, prefix="/receipts", tags=["receipts"])
+app.include_router(report_router, prefix="/receipts/reports", tags=["reports"])
+app.include_router(product_router, prefix="/products", tags=["products"])
 
 Base.metadata.create_all(bind=engine)
\ No newline at end of file
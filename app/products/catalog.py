@@ -0,0 +1,69 @@
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", 100000))
+
+
+class CatalogCache:
+    """
+    A bounded LRU map of product names to their catalog IDs.
+
+    Every shard has a catalog of its own, so names are cached per shard.
+    Only IDs of committed catalog rows are cached. IDs created by a
+    transaction are held in its session's `info` and cached once it commits,
+    so a rolled back insert never leaves a dangling ID behind.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, names, shard: int = 0) -> dict:
+        """
+        Returns the cached IDs of the given names, leaving out cache misses.
+        """
+        found = {}
+        with self._lock:
+            for name in names:
+                catalog_id = self._entries.get((shard, name))
+                if catalog_id is not None:
+                    self._entries.move_to_end((shard, name))
+                    found[name] = catalog_id
+        return found
+
+    def set_many(self, ids: dict, shard: int = 0):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for name, catalog_id in ids.items():
+                self._entries[(shard, name)] = catalog_id
+                self._entries.move_to_end((shard, name))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_SIZE)
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_created_catalog_ids(session):
+    created = session.info.pop("created_catalog_ids", None)
+    if created:
+        catalog_cache.set_many(created, session.info.get("shard", 0))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_created_catalog_ids(session, previous_transaction):
+    session.info.pop("created_catalog_ids", None)
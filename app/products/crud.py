@@ -0,0 +1,184 @@
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.database import UPSERT_DIALECTS
+from app.products.catalog import catalog_cache
+from app.products.model import Product, ProductCatalog, ProductSketch
+from app.products.sketch import SKETCH_METRICS, ProductSketchBuffer, SpaceSaving, product_sketches
+from app.receipts.model import Receipt
+from app.users.schemas import Principal
+
+
+async def get_or_create_catalog_ids(db: AsyncSession, names) -> dict:
+    """
+    Maps product names to the IDs of their catalog entries, creating missing ones.
+
+    Names are looked up in the in-process cache first, then in the catalog
+    table, and only names seen for the first time are inserted. The inserts
+    skip names created concurrently by another transaction, which are then
+    read back.
+
+    Args:
+        db (AsyncSession): The database session to use for the queries.
+        names (Iterable[str]): The product names.
+
+    Returns:
+        dict: The catalog ID of every name.
+    """
+    shard = db.sync_session.info.get('shard', 0)
+    ids = catalog_cache.get_many(set(names), shard)
+    missing = set(names) - ids.keys()
+    if not missing:
+        return ids
+
+    async def select_ids(names):
+        rows = await db.execute(
+            select(ProductCatalog.name, ProductCatalog.id).where(ProductCatalog.name.in_(names))
+        )
+        return dict(rows.all())
+
+    existing = await select_ids(missing)
+    catalog_cache.set_many(existing, shard)
+    ids.update(existing)
+    missing -= existing.keys()
+    if not missing:
+        return ids
+
+    created = dict((await db.execute(
+        UPSERT_DIALECTS[db.get_bind().dialect.name](ProductCatalog)
+        .on_conflict_do_nothing(index_elements=['name'])
+        .returning(ProductCatalog.name, ProductCatalog.id),
+        [{'name': name} for name in sorted(missing)]
+    )).all())
+    missing -= created.keys()
+    if missing:
+        created.update(await select_ids(missing))
+    db.sync_session.info.setdefault('created_catalog_ids', {}).update(created)
+    ids.update(created)
+    return ids
+
+
+async def merge_product_sketches(db: AsyncSession, summaries: dict, capacity: int):
+    """
+    Merges product summaries into the `product_sketches` table without committing.
+
+    Each persisted summary is locked while it is merged, so API processes
+    flushing the same user and day at once don't lose each other's counts.
+
+    Args:
+        db (AsyncSession): The database session to use for the queries.
+        summaries (dict): `SpaceSaving` summaries keyed by `(user_id, day, metric)`;
+        they are left unchanged.
+        capacity (int): The number of counters kept per persisted summary.
+    """
+    keys = sorted(summaries)
+    await db.execute(
+        UPSERT_DIALECTS[db.get_bind().dialect.name](ProductSketch).on_conflict_do_nothing(),
+        [
+            {'user_id': user_id, 'day': day, 'metric': metric, 'counters': {}}
+            for user_id, day, metric in keys
+        ]
+    )
+    for user_id, day, metric in keys:
+        row = await db.get(
+            ProductSketch, (user_id, day, metric), with_for_update=True, populate_existing=True
+        )
+        sketch = SpaceSaving(capacity, row.counters)
+        sketch.merge(summaries[(user_id, day, metric)])
+        row.counters = sketch.counters
+
+
+async def flush_product_sketches(db: AsyncSession, buffer: ProductSketchBuffer = product_sketches):
+    """
+    Merges the pending product summaries into the `product_sketches` table.
+
+    On a shard session, only the summaries of the shard's users are merged.
+    If merging fails, the summaries are put back into the buffer.
+
+    Args:
+        db (AsyncSession): The database session to use for the queries.
+        buffer (ProductSketchBuffer): The pending summaries.
+    """
+    router = db.sync_session.info.get('shard_router')
+    if router is None or len(router) == 1:
+        pending = buffer.take()
+    else:
+        shard = db.sync_session.info['shard']
+        pending = buffer.take(lambda user_id: router.shard_for_user(user_id) == shard)
+    if not pending:
+        return
+
+    try:
+        await merge_product_sketches(db, pending, buffer.capacity)
+        await db.commit()
+    except BaseException:
+        buffer.restore(pending)
+        raise
+
+
+async def get_top_products(
+    db: AsyncSession, user: Principal, metric: str, k: int, start: date = None,
+    end: date = None, exact: bool = False
+):
+    """
+    Retrieves the products of a user with the highest revenue or quantity sold.
+
+    By default the ranking is merged from the daily Space-Saving summaries,
+    without reading any line items or writing anything, so it can be served
+    by a replica. Sales are merged into the summaries in the background, so
+    the ranking lags by up to one `PRODUCT_SKETCH_FLUSH_INTERVAL`. Each count
+    may overestimate the merged sales by up to its error, and products
+    lighter than the error bounds may be missing. With `exact` the ranking
+    is computed with a GROUP BY over the catalog IDs of the line items
+    instead, and only the top `k` are joined to the catalog for their names.
+
+    Args:
+        db (AsyncSession): The database session to use for the queries.
+        user (Principal): The user whose products to rank.
+        metric (str): `revenue` or `quantity`.
+        k (int): The number of products to return.
+        start (date): Optional first day of the range.
+        end (date): Optional last day of the range, inclusive.
+        exact (bool): Whether to compute the exact ranking from line items.
+
+    Returns:
+        List[dict]: Up to `k` products with their `name`, `value` and `error`,
+        heaviest first.
+    """
+    if exact:
+        value = func.sum(getattr(Product, SKETCH_METRICS[metric])).label('value')
+        totals = (
+            select(Product.catalog_id, value)
+            .join(Receipt, Receipt.id == Product.receipt_id)
+            .where(Receipt.user_id == user.id)
+            .group_by(Product.catalog_id)
+        )
+        if start is not None:
+            totals = totals.where(Receipt.created_at >= start)
+        if end is not None:
+            totals = totals.where(Receipt.created_at < end + timedelta(days=1))
+        totals = totals.subquery()
+        rows = (await db.execute(
+            select(ProductCatalog.name, totals.c.value)
+            .join(totals, totals.c.catalog_id == ProductCatalog.id)
+            .order_by(totals.c.value.desc(), ProductCatalog.name)
+            .limit(k)
+        )).all()
+        return [{'name': name, 'value': total, 'error': 0} for name, total in rows]
+
+    query = select(ProductSketch.counters).where(
+        ProductSketch.user_id == user.id, ProductSketch.metric == metric
+    )
+    if start is not None:
+        query = query.where(ProductSketch.day >= start)
+    if end is not None:
+        query = query.where(ProductSketch.day <= end)
+
+    sketch = SpaceSaving(product_sketches.capacity)
+    for counters in await db.scalars(query):
+        sketch.merge(SpaceSaving(product_sketches.capacity, counters))
+    return [
+        {'name': name, 'value': count, 'error': error} for name, count, error in sketch.top(k)
+    ]
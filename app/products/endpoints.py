@@ -0,0 +1,45 @@
+from datetime import date
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.common_utils import create_json_response
+from app.common.dependencies import get_user_read_db, require_auth
+from app.products.crud import get_top_products
+from app.products.schemas import TopProductsSchema
+
+router = APIRouter()
+
+
+@router.get('/top', response_model=TopProductsSchema)
+async def get_top_products_endpoint(
+    metric: Literal['revenue', 'quantity'] = 'revenue',
+    k: int = Query(50, ge=1, le=100),
+    start: Optional[date] = Query(None, alias='from'),
+    end: Optional[date] = Query(None, alias='to'),
+    exact: bool = False,
+    user=Depends(require_auth),
+    db: AsyncSession = Depends(get_user_read_db)
+):
+    """
+    Retrieves the best-selling products of a user by revenue or quantity.
+
+    The approximate ranking only covers sales merged by the background
+    flusher, so it lags by up to one flush interval.
+
+    Args:
+        metric (str): `revenue` or `quantity` (default is `revenue`).
+        k (int): The number of products to return (default is 50).
+        start (date): Optional first day of the range.
+        end (date): Optional last day of the range, inclusive.
+        exact (bool): Whether to compute the exact ranking from the line items
+        instead of the approximate one from the product sketches.
+        user (Principal): The authenticated user whose products to rank.
+        db (AsyncSession): The database session to interact with the database.
+
+    Returns:
+        ORJSONResponse: The ranking, with an error bound for each value.
+    """
+    products = await get_top_products(db, user, metric, k, start, end, exact)
+    return create_json_response({'metric': metric, 'exact': exact, 'products': products})
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+
+from app.common.database import ShardRouter, shard_router
+from app.products.crud import flush_product_sketches
+from app.products.sketch import ProductSketchBuffer, product_sketches
+
+logger = logging.getLogger(__name__)
+
+
+class ProductSketchFlusher:
+    """
+    Merges the pending product summaries into every shard in the background.
+
+    Summaries are flushed every `flush_interval` seconds of the buffer and
+    once more when the flusher stops, so requests creating receipts never
+    wait for or fail on a flush. Summaries that fail to be merged stay
+    pending until the next flush.
+    """
+
+    def __init__(self, buffer: ProductSketchBuffer, shards: ShardRouter):
+        self.buffer = buffer
+        self.shards = shards
+        self._stopping = None
+        self._task = None
+        self._loop = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._stopping = asyncio.Event()
+            self._task = loop.create_task(self._run())
+            self._loop = loop
+
+    async def stop(self):
+        """
+        Flushes the pending summaries and stops the flusher.
+        """
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        self._stopping.set()
+        await self._task
+        self._task = self._stopping = self._loop = None
+
+    async def flush(self):
+        for shard in range(len(self.shards)):
+            try:
+                async with self.shards.session(shard) as db:
+                    await flush_product_sketches(db, self.buffer)
+            except Exception:
+                logger.exception("Failed to flush product summaries to shard %s", shard)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.buffer.flush_interval)
+                stopping = True
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
+product_sketch_flusher = ProductSketchFlusher(product_sketches, shard_router)
@@ -1,25 +1,84 @@
-from sqlalchemy import Column, Float, ForeignKey, Integer, String
-from sqlalchemy.orm import relationship
+from sqlalchemy import (DDL, JSON, BigInteger, Column, Date, DateTime, Enum, Float, ForeignKey,
+                        Index, Integer, String, event, select)
+from sqlalchemy.orm import column_property, relationship
 
 from app.common.database import Base
 
 
+class ProductCatalog(Base):
+    __tablename__ = 'product_catalog'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+
+
+# Product name search is served by a trigram index: pg_trgm on PostgreSQL and
+# an FTS5 table kept in sync by triggers on SQLite. Both are also created by
+# the Alembic migration that introduced them.
+for statement in (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX ix_product_catalog_name_trgm ON product_catalog "
+    "USING gin (name gin_trgm_ops)",
+):
+    event.listen(
+        ProductCatalog.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql")
+    )
+for statement in (
+    "CREATE VIRTUAL TABLE product_catalog_fts USING fts5("
+    "name, content='product_catalog', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER product_catalog_fts_insert AFTER INSERT ON product_catalog BEGIN "
+    "INSERT INTO product_catalog_fts (rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER product_catalog_fts_delete AFTER DELETE ON product_catalog BEGIN "
+    "INSERT INTO product_catalog_fts (product_catalog_fts, rowid, name) "
+    "VALUES ('delete', old.id, old.name); END",
+):
+    event.listen(
+        ProductCatalog.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    ProductCatalog.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS product_catalog_fts").execute_if(dialect="sqlite")
+)
+
+
 class Product(Base):
     __tablename__ = 'products'
 
     id = Column(Integer, primary_key=True)
-    receipt_id = Column(Integer, ForeignKey('receipts.id'))
-    name = Column(String, nullable=False)
+    receipt_id = Column(BigInteger, ForeignKey('receipts.id'))
+    catalog_id = Column(Integer, ForeignKey('product_catalog.id'), nullable=False)
+    # Names are only stored in the catalog; queries that read many line items
+    # should join it instead of loading this.
+    name = column_property(
+        select(ProductCatalog.name).where(ProductCatalog.id == catalog_id)
+        .correlate_except(ProductCatalog).scalar_subquery()
+    )
     price = Column(Float, nullable=False)
     quantity = Column(Integer)
     total = Column(Float)
+    # A copy of the receipt's creation time, which products are partitioned by.
+    created_at = Column(DateTime)
 
     receipt = relationship("Receipt", back_populates='products')
 
+    __table_args__ = (
+        Index('ix_product_receipt_id', 'receipt_id'),
+        Index('ix_product_catalog_id', 'catalog_id'),
+    )
+
     def to_dict(self):
         return {
             'name': self.name,
             'price': self.price,
             'quantity': self.quantity,
             'total': self.total,
-        }
\ No newline at end of file
+        }
+
+
+class ProductSketch(Base):
+    __tablename__ = 'product_sketches'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    metric = Column(Enum('revenue', 'quantity', name='sketch_metric'), primary_key=True)
+    counters = Column(JSON, nullable=False)
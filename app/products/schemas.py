@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -15,5 +17,16 @@ class ProductCreateSchema(ProductBaseSchema):
 
 
 class ProductSchema(ProductBaseSchema):
-    id: int
     total: float
+
+
+class TopProductSchema(BaseModel):
+    name: str
+    value: float
+    error: float
+
+
+class TopProductsSchema(BaseModel):
+    metric: str
+    exact: bool
+    products: List[TopProductSchema]
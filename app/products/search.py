@@ -0,0 +1,60 @@
+from sqlalchemy import column, select, table
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+from app.products.model import Product, ProductCatalog
+
+product_catalog_fts = table('product_catalog_fts', column('rowid'), column('name'))
+
+
+class catalog_name_like(ColumnElement):
+    """
+    Matches line items whose catalog name is LIKE a pattern, ignoring case,
+    through the dialect's trigram index: ILIKE backed by pg_trgm on
+    PostgreSQL, and a LIKE over the FTS5 trigram table on SQLite.
+    """
+    inherit_cache = False
+
+    def __init__(self, pattern: str, escape: str = None):
+        self.pattern = pattern
+        self.escape = escape
+
+
+@compiles(catalog_name_like)
+def _compile_catalog_name_like(element, compiler, **kw):
+    matches = select(ProductCatalog.id).where(
+        ProductCatalog.name.ilike(element.pattern, escape=element.escape)
+    )
+    return compiler.process(Product.catalog_id.in_(matches), **kw)
+
+
+@compiles(catalog_name_like, "sqlite")
+def _compile_catalog_name_like_sqlite(element, compiler, **kw):
+    matches = select(product_catalog_fts.c.rowid).where(
+        product_catalog_fts.c.name.like(element.pattern, escape=element.escape)
+    )
+    return compiler.process(Product.catalog_id.in_(matches), **kw)
+
+
+def receipt_ids_with_product(name: str, prefix: bool = False):
+    """
+    Builds a query of the IDs of receipts with a product whose name contains
+    or starts with the given text, ignoring case.
+
+    Names are matched in the catalog through its trigram index and line
+    items are then found through their `catalog_id`, so neither step scans
+    the products table.
+
+    Args:
+        name (str): The text to look for.
+        prefix (bool): Whether names must start with the text rather than
+        contain it.
+
+    Returns:
+        Select: The query of receipt IDs.
+    """
+    escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"{escaped}%" if prefix else f"%{escaped}%"
+    # FTS5 can't use its index with an ESCAPE clause, so it is only added when needed.
+    escape = "\\" if escaped != name else None
+    return select(Product.receipt_id).where(catalog_name_like(pattern, escape))
@@ -0,0 +1,171 @@
+import heapq
+import os
+from datetime import date
+from typing import Callable
+
+PRODUCT_SKETCH_CAPACITY = int(os.getenv("PRODUCT_SKETCH_CAPACITY", 200))
+PRODUCT_SKETCH_FLUSH_INTERVAL = float(os.getenv("PRODUCT_SKETCH_FLUSH_INTERVAL", 10))
+
+# Sketched metrics and the product column that weighs an item in each.
+SKETCH_METRICS = {
+    'revenue': 'total',
+    'quantity': 'quantity',
+}
+
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving summary of the heaviest items of a stream.
+
+    At most `capacity` counters are kept. A counter never underestimates the
+    weight of its item and overestimates it by at most its error, and every
+    item heavier than the smallest counter is guaranteed to have a counter.
+    The smallest counter is found with a min-heap of `(count, item)` entries,
+    one per counter, so evicting it takes O(log capacity).
+    """
+
+    def __init__(self, capacity: int, counters: dict = None):
+        self.capacity = capacity
+        self.counters = {item: list(counter) for item, counter in (counters or {}).items()}
+        self._heap = None
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.counters) >= self.capacity
+
+    @property
+    def min_count(self) -> float:
+        """
+        The weight an item without a counter may have at most.
+        """
+        if not self.is_full:
+            return 0
+        return self.counters[self._smallest()][0]
+
+    def _smallest(self) -> str:
+        """
+        Returns the item with the smallest counter.
+
+        Counters only grow and their heap entries are left behind when they
+        do, so outdated entries are moved down with the current count until
+        the top one is up to date.
+        """
+        if self._heap is None:
+            self._heap = [(count, item) for item, (count, _) in self.counters.items()]
+            heapq.heapify(self._heap)
+        while True:
+            count, item = self._heap[0]
+            current = self.counters[item][0]
+            if current == count:
+                return item
+            heapq.heapreplace(self._heap, (current, item))
+
+    def add(self, item: str, weight: float):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif not self.is_full:
+            self.counters[item] = [weight, 0]
+            if self._heap is not None:
+                heapq.heappush(self._heap, (weight, item))
+        else:
+            evicted = self._smallest()
+            count, _ = self.counters.pop(evicted)
+            self.counters[item] = [count + weight, count]
+            heapq.heapreplace(self._heap, (count + weight, item))
+
+    def merge(self, other: 'SpaceSaving'):
+        """
+        Adds the counts of another summary to this one.
+
+        An item missing from a full summary may have weighed up to its
+        smallest count there, which is added to both its count and its error.
+        """
+        own_min, other_min = self.min_count, other.min_count
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(item, (own_min, own_min))
+            other_count, other_error = other.counters.get(item, (other_min, other_min))
+            merged[item] = [count + other_count, error + other_error]
+
+        self.capacity = max(self.capacity, other.capacity)
+        heaviest = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)
+        self.counters = dict(heaviest[:self.capacity])
+        self._heap = None
+
+    def top(self, k: int) -> list:
+        """
+        Returns up to `k` items with the highest counts.
+
+        Returns:
+            List[tuple]: `(item, count, error)` triples, heaviest first. The
+            true weight of an item is between `count - error` and `count`.
+        """
+        heaviest = sorted(self.counters.items(), key=lambda entry: (-entry[1][0], entry[0]))
+        return [(item, count, error) for item, (count, error) in heaviest[:k]]
+
+
+class ProductSketchBuffer:
+    """
+    Space-Saving summaries of products sold since they were last persisted,
+    per user, day and metric.
+
+    Receipts are recorded in memory as they are created and merged into the
+    `product_sketches` table by `flush_product_sketches` every
+    `flush_interval` seconds, off the request path.
+    """
+
+    def __init__(self, capacity: int, flush_interval: float):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.pending = {}
+
+    def record(self, user_id: int, day: date, products: list):
+        """
+        Adds the line items of a created receipt to the pending summaries.
+
+        Args:
+            user_id (int): The ID of the user who created the receipt.
+            day (date): The day the receipt was created.
+            products (list): The column values of its products.
+        """
+        for metric, column in SKETCH_METRICS.items():
+            sketch = self.pending.get((user_id, day, metric))
+            if sketch is None:
+                sketch = self.pending[(user_id, day, metric)] = SpaceSaving(self.capacity)
+            for product in products:
+                sketch.add(product['name'], product[column])
+
+    def take(self, user_filter: Callable[[int], bool] = None) -> dict:
+        """
+        Returns the pending summaries keyed by `(user_id, day, metric)` and
+        starts new ones.
+
+        With `user_filter`, only the summaries of users it accepts are taken
+        and the others stay pending.
+        """
+        if user_filter is None:
+            pending, self.pending = self.pending, {}
+        else:
+            pending = {key: sketch for key, sketch in self.pending.items() if user_filter(key[0])}
+            self.pending = {
+                key: sketch for key, sketch in self.pending.items() if key not in pending
+            }
+        return pending
+
+    def restore(self, pending: dict):
+        """
+        Puts summaries returned by `take` back, merged with the ones recorded
+        since, e.g. after they failed to be persisted.
+        """
+        for key, sketch in pending.items():
+            recorded = self.pending.get(key)
+            if recorded is not None:
+                sketch.merge(recorded)
+            self.pending[key] = sketch
+
+    def clear(self):
+        self.pending = {}
+
+
+product_sketches = ProductSketchBuffer(PRODUCT_SKETCH_CAPACITY, PRODUCT_SKETCH_FLUSH_INTERVAL)
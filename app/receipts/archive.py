@@ -0,0 +1,186 @@
+import bisect
+import gzip
+import os
+import struct
+import threading
+from typing import Iterable, Optional
+
+import orjson
+
+RECEIPT_ARCHIVE_DIR = os.getenv("RECEIPT_ARCHIVE_DIR", "archive")
+# Receipts are compressed in blocks, so a lookup only decompresses one block.
+ARCHIVE_BLOCK_SIZE = 256
+
+ARCHIVE_SUFFIX = ".ndjson.gz"
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"RCX1"
+# The lowest and highest receipt ID in the archive.
+INDEX_HEADER = struct.Struct("<4sqq")
+# The first receipt ID of a block and the offset of the block in the archive.
+INDEX_ENTRY = struct.Struct("<qq")
+
+
+def index_path(path: str) -> str:
+    return path[:-len(ARCHIVE_SUFFIX)] + INDEX_SUFFIX
+
+
+class _DurableFile:
+    """
+    A file written under a temporary name and moved into place once synced.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(f"{path}.tmp", "wb")
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.file.name, self.path)
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.file.name)
+
+
+def write_archive(path: str, receipts: Iterable[dict], block_size: int = ARCHIVE_BLOCK_SIZE) -> int:
+    """
+    Writes receipts to an archive file and its index.
+
+    The archive is a sequence of gzip members of `block_size` receipts, one
+    JSON object per line, so `zcat` reads it as a whole. The index next to it
+    holds the first receipt ID and offset of every block. Both are written
+    under temporary names and renamed once complete, and readers only
+    consider archives that have an index, so an interrupted run leaves
+    nothing behind that could be read.
+
+    Args:
+        path (str): The path of the archive, ending in `.ndjson.gz`.
+        receipts (Iterable[dict]): The receipts ordered by ID, in the format of
+        `Receipt.to_dict` with their `user_id` added.
+        block_size (int): The number of receipts per compressed block.
+
+    Returns:
+        int: The number of receipts written.
+    """
+    archive = _DurableFile(path)
+    entries = []
+    block = []
+    written = 0
+    max_id = -1
+
+    def write_block():
+        entries.append((block[0]['id'], archive.file.tell()))
+        archive.file.write(gzip.compress(b"".join(
+            orjson.dumps(receipt, option=orjson.OPT_APPEND_NEWLINE) for receipt in block
+        )))
+        block.clear()
+
+    try:
+        for receipt in receipts:
+            block.append(receipt)
+            written += 1
+            max_id = receipt['id']
+            if len(block) == block_size:
+                write_block()
+        if block:
+            write_block()
+    except BaseException:
+        archive.discard()
+        raise
+    archive.commit()
+
+    index = _DurableFile(index_path(path))
+    min_id = entries[0][0] if entries else 0
+    index.file.write(INDEX_HEADER.pack(INDEX_MAGIC, min_id, max_id))
+    for first_id, offset in entries:
+        index.file.write(INDEX_ENTRY.pack(first_id, offset))
+    index.commit()
+    return written
+
+
+class _ArchiveIndex:
+    def __init__(self, path: str, mtime: float):
+        self.path = path
+        self.mtime = mtime
+        with open(index_path(path), "rb") as file:
+            data = file.read()
+        magic, self.min_id, self.max_id = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{index_path(path)} is not a receipt archive index")
+        entries = list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:]))
+        self.first_ids = [first_id for first_id, _ in entries]
+        self.offsets = [offset for _, offset in entries]
+
+    def find(self, receipt_id: int) -> Optional[dict]:
+        if not self.min_id <= receipt_id <= self.max_id:
+            return None
+        block = bisect.bisect_right(self.first_ids, receipt_id) - 1
+        with open(self.path, "rb") as file:
+            file.seek(self.offsets[block])
+            if block + 1 < len(self.offsets):
+                data = file.read(self.offsets[block + 1] - self.offsets[block])
+            else:
+                data = file.read()
+        for line in gzip.decompress(data).splitlines():
+            receipt = orjson.loads(line)
+            if receipt['id'] == receipt_id:
+                return receipt
+        return None
+
+
+class ReceiptArchive:
+    """
+    Reads receipts from the archive files in a directory.
+
+    The index of every archive is loaded once and kept in memory; it holds
+    one entry per block, so it stays small. A lookup reads and decompresses
+    a single block of the archive whose ID range covers the receipt.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _load_indexes(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        indexes = []
+        with self._lock:
+            for name in sorted(names):
+                if not name.endswith(INDEX_SUFFIX):
+                    continue
+                path = os.path.join(self.directory, name[:-len(INDEX_SUFFIX)] + ARCHIVE_SUFFIX)
+                mtime = os.stat(os.path.join(self.directory, name)).st_mtime
+                index = self._indexes.get(path)
+                if index is None or index.mtime != mtime:
+                    index = self._indexes[path] = _ArchiveIndex(path, mtime)
+                indexes.append(index)
+        return indexes
+
+    def get(self, receipt_id: int) -> Optional[dict]:
+        """
+        Looks up an archived receipt.
+
+        This does blocking file IO, so async callers should run it in a thread.
+
+        Args:
+            receipt_id (int): The ID of the receipt.
+
+        Returns:
+            dict: The receipt in the format of `Receipt.to_dict` with its
+            `user_id` added, or None if no archive holds it.
+        """
+        for index in self._load_indexes():
+            receipt = index.find(receipt_id)
+            if receipt is not None:
+                return receipt
+        return None
+
+
+receipt_archive = ReceiptArchive(RECEIPT_ARCHIVE_DIR)
@@ -0,0 +1,70 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+from app.common.cache import CacheBackend, LRUCacheBackend
+
+RECEIPT_CACHE_MAX_BYTES = int(os.getenv("RECEIPT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class ReceiptCache:
+    """
+    Read-through cache of rendered receipts.
+
+    Receipts never change once created, so their JSON body, their text
+    rendering for a given line width and the creation time their ETags are
+    derived from can be cached without invalidation.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    async def _get(self, key: str) -> Optional[bytes]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_json(self, receipt_id: int) -> Optional[bytes]:
+        """
+        Returns the cached JSON body of a receipt, or None on a cache miss.
+        """
+        return await self._get(f"receipt:{receipt_id}:json")
+
+    async def set_json(self, receipt_id: int, body: bytes):
+        await self.backend.set(f"receipt:{receipt_id}:json", body)
+
+    async def get_created_at(self, receipt_id: int) -> Optional[datetime]:
+        """
+        Returns the cached creation time of a receipt, or None on a cache miss.
+        """
+        value = await self.backend.get(f"receipt:{receipt_id}:created_at")
+        return datetime.fromisoformat(value.decode()) if value is not None else None
+
+    async def set_created_at(self, receipt_id: int, created_at: datetime):
+        await self.backend.set(f"receipt:{receipt_id}:created_at", created_at.isoformat().encode())
+
+    async def get_text(self, receipt_id: int, chars_per_line: int) -> Optional[bytes]:
+        """
+        Returns the cached text rendering of a receipt, or None on a cache miss.
+        """
+        return await self._get(f"receipt:{receipt_id}:txt:{chars_per_line}")
+
+    async def set_text(self, receipt_id: int, chars_per_line: int, body: bytes):
+        await self.backend.set(f"receipt:{receipt_id}:txt:{chars_per_line}", body)
+
+
+receipt_cache = ReceiptCache(LRUCacheBackend(RECEIPT_CACHE_MAX_BYTES))
+
+
+def get_receipt_cache():
+    return receipt_cache
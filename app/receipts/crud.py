@@ -1,27 +1,52 @@
-from datetime import datetime
+import asyncio
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 
-from app.products.model import Product
-from app.receipts.model import Receipt
+from app.products.crud import get_or_create_catalog_ids
+from app.products.model import Product, ProductCatalog
+from app.products.sketch import product_sketches
+from app.receipts.archive import ReceiptArchive, receipt_archive
+from app.receipts.export import receipt_to_dict
+from app.receipts.model import Receipt, ReceiptDailyRollup
 from app.receipts.schemas import ReceiptCreateSchema
-from app.users.model import User
-from app.common.common_utils import calculate_product_total
+from app.users.model import User, UserStats
+from app.users.schemas import Principal
+from app.common.database import build_increment_upsert
+from app.common.common_utils import (calculate_product_total, decode_cursor,
+                                     encode_cursor)
 
+BULK_CHUNK_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+ROLLUP_KEY = ['user_id', 'day', 'hour', 'type']
+# The receipt columns read by the ORM-free read paths, in `ReceiptRow` order.
+RECEIPT_ROW_COLUMNS = (
+    Receipt.id, Receipt.type, Receipt.amount, Receipt.total, Receipt.rest, Receipt.created_at,
+)
+USER_STATS_COUNTERS = [
+    'receipts', 'total', 'cash_receipts', 'cash_total', 'cashless_receipts', 'cashless_total',
+]
 
-def create_receipt(db: Session, user: User, receipt_data: ReceiptCreateSchema):
+
+def prepare_receipt(receipt_data: ReceiptCreateSchema):
     """
-    Creates a new receipt and associated products in the database.
+    Calculates product totals for a receipt and validates its payment.
+
+    Nothing is written to the database, so an invalid receipt can be rejected
+    before a transaction is opened.
 
     Args:
-        db (Session): The database session to use for transactions.
-        user (User): The user who is creating the receipt.
-        receipt_data (ReceiptCreateSchema): The data for creating the receipt, 
+        receipt_data (ReceiptCreateSchema): The data for creating the receipt,
         including payment and products.
 
     Returns:
-        Receipt: The created receipt object with products and total amounts.
+        tuple: The column values of the receipt and a list with the column
+        values of each of its products.
 
     Raises:
         HTTPException: If the payment amount is insufficient.
@@ -29,76 +54,592 @@ def create_receipt(db: Session, user: User, receipt_data: ReceiptCreateSchema):
     products = []
     total = 0
 
-    db_receipt = Receipt(
-        type=receipt_data.payment.type,
-        amount=receipt_data.payment.amount,
-        created_at=datetime.now(),
-        user_id=user.id
-    )
-    db.add(db_receipt)
-    db.commit()
-    db.refresh(db_receipt)
-
     for product in receipt_data.products:
         product_total = calculate_product_total(product.price, product.quantity)
-        db_product = Product(
-            name=product.name,
-            price=product.price,
-            quantity=product.quantity,
-            receipt_id=db_receipt.id,
-            total=product_total
-        )
         products.append({
             'name': product.name,
             'price': product.price,
             'quantity': product.quantity,
             'total': product_total
         })
-        db.add(db_product)
         total += product_total
 
-    if db_receipt.amount < total:
-        db.rollback() 
+    amount = receipt_data.payment.amount
+    if amount < total:
         raise HTTPException(
             status_code=400, 
-            detail=f"Insufficient payment: required {total}, but received {db_receipt.amount}"
+            detail=f"Insufficient payment: required {total}, but received {amount}"
         )
-    
-    db_receipt.total = total
-    db_receipt.rest = db_receipt.amount - total
-    db.commit()
 
-    return db_receipt
+    receipt = {
+        'type': receipt_data.payment.type,
+        'amount': amount,
+        'total': total,
+        'rest': amount - total,
+        'created_at': datetime.now(),
+    }
+    return receipt, products
+
+
+async def write_receipts(db: AsyncSession, receipts: list):
+    """
+    Inserts prepared receipts and their products without committing.
+
+    Receipts are inserted with RETURNING to learn their IDs and all of their
+    products are then written with a single bulk insert, linked to the
+    catalog entries of their names and stamped with the creation time of
+    their receipt. The hourly rollups
+    of the receipts and the running totals of their users are incremented
+    with one upsert each. Sessions opened by a `ShardRouter` first make sure
+    the shard generates IDs from its own range.
+
+    Args:
+        db (AsyncSession): The database session to use for transactions.
+        receipts (list): `(receipt_values, product_values)` pairs as returned by
+        `prepare_receipt`, with `user_id` set in the receipt values. Receipts
+        moved between shards also carry their `id`.
+
+    Returns:
+        List[int]: The IDs of the inserted receipts, in the order given.
+    """
+    router = db.sync_session.info.get('shard_router')
+    if router is not None:
+        await router.ensure_id_range(db.sync_session.info['shard'])
+
+    receipt_rows = [receipt_values for receipt_values, _ in receipts]
+    receipt_ids = (await db.scalars(
+        insert(Receipt).returning(Receipt.id, sort_by_parameter_order=True), receipt_rows
+    )).all()
+
+    catalog_ids = await get_or_create_catalog_ids(
+        db, {product['name'] for _, product_values in receipts for product in product_values}
+    )
+    product_rows = [
+        {
+            'receipt_id': receipt_id, 'catalog_id': catalog_ids[product['name']],
+            'price': product['price'], 'quantity': product['quantity'],
+            'total': product['total'], 'created_at': receipt_values['created_at'],
+        }
+        for receipt_id, (receipt_values, product_values) in zip(receipt_ids, receipts)
+        for product in product_values
+    ]
+    if product_rows:
+        await db.execute(insert(Product), product_rows)
+
+    await _increment_rollups(db, receipt_rows)
+    await _increment_user_stats(db, receipt_rows)
+
+    return receipt_ids
+
+
+async def _increment_rollups(db: AsyncSession, receipts: list):
+    rollups = defaultdict(lambda: [0, 0, 0])
+    for receipt in receipts:
+        created_at = receipt['created_at']
+        rollup = rollups[(receipt['user_id'], created_at.date(), created_at.hour, receipt['type'])]
+        rollup[0] += 1
+        rollup[1] += receipt['total']
+        rollup[2] += receipt['amount']
+
+    # Sorted so that concurrent transactions lock the rollup rows in the same order.
+    await db.execute(
+        build_increment_upsert(db.get_bind().dialect.name, ReceiptDailyRollup, ROLLUP_KEY),
+        [
+            {
+                'user_id': user_id, 'day': day, 'hour': hour, 'type': payment_type,
+                'receipts': count, 'total': total, 'amount': amount,
+            }
+            for (user_id, day, hour, payment_type), (count, total, amount)
+            in sorted(rollups.items())
+        ]
+    )
+
+
+async def _increment_user_stats(db: AsyncSession, receipts: list):
+    stats = defaultdict(lambda: defaultdict(int))
+    for receipt in receipts:
+        user_stats = stats[receipt['user_id']]
+        user_stats['receipts'] += 1
+        user_stats['total'] += receipt['total']
+        user_stats[f"{receipt['type']}_receipts"] += 1
+        user_stats[f"{receipt['type']}_total"] += receipt['total']
+
+    await db.execute(
+        build_increment_upsert(db.get_bind().dialect.name, UserStats, ['user_id']),
+        [
+            {
+                'user_id': user_id,
+                **{column: user_stats[column] for column in USER_STATS_COUNTERS},
+            }
+            for user_id, user_stats in sorted(stats.items())
+        ]
+    )
+
+
+def record_sales(receipts: list):
+    # The summaries are persisted by the product sketch flusher, never by the request.
+    for receipt_values, product_values in receipts:
+        product_sketches.record(
+            receipt_values['user_id'], receipt_values['created_at'].date(), product_values
+        )
 
 
-def get_receipts(db: Session, user: User, filters, limit: int, offset: int):
+async def create_receipt(
+    db: AsyncSession, user: Principal, receipt_data: ReceiptCreateSchema, writer=None
+):
     """
-    Retrieves a list of receipts for a specific user with optional filters.
+    Creates a new receipt and associated products in the database.
+
+    The payment is validated before anything is written. The receipt is then
+    inserted with RETURNING and its products with a single bulk insert, and
+    both are committed in one transaction. With a `writer`, the receipt is
+    instead handed to it and committed together with other queued receipts.
 
     Args:
-        db (Session): The database session to use for queries.
-        user (User): The user whose receipts to retrieve.
+        db (AsyncSession): The database session to use for transactions.
+        user (Principal): The user who is creating the receipt.
+        receipt_data (ReceiptCreateSchema): The data for creating the receipt, 
+        including payment and products.
+        writer (ReceiptWriter): Optional group-commit writer to write the
+        receipt through.
+
+    Returns:
+        Receipt: The created receipt object with products and total amounts.
+
+    Raises:
+        HTTPException: If the payment amount is insufficient.
+    """
+    receipt_values, product_values = prepare_receipt(receipt_data)
+    receipt_values['user_id'] = user.id
+
+    if writer is not None:
+        receipt_id = await writer.submit((receipt_values, product_values))
+    else:
+        receipt_id = (await write_receipts(db, [(receipt_values, product_values)]))[0]
+        await db.commit()
+        record_sales([(receipt_values, product_values)])
+
+    return Receipt(
+        id=receipt_id,
+        products=[Product(receipt_id=receipt_id, **product) for product in product_values],
+        **receipt_values
+    )
+
+
+async def create_receipts_bulk(
+    db: AsyncSession, user: Principal, receipts_data: list, chunk_size: int = None
+):
+    """
+    Creates many receipts at once, committing them in chunks.
+
+    Every receipt is validated up front and invalid ones are reported without
+    affecting the others. Valid receipts are written in transactions of
+    `chunk_size` receipts; if a chunk fails to commit, its receipts are retried
+    one by one so that a single bad row doesn't fail the whole chunk.
+
+    Args:
+        db (AsyncSession): The database session to use for transactions.
+        user (Principal): The user who is creating the receipts.
+        receipts_data (List[ReceiptCreateSchema]): The receipts to create.
+        chunk_size (int): The maximum number of receipts per transaction
+        (default is `BULK_CHUNK_SIZE`).
+
+    Returns:
+        List[dict]: One result per receipt, in the order given, with either
+        the `id` of the created receipt or the `detail` of its error.
+    """
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    results = [None] * len(receipts_data)
+    prepared = []
+
+    for index, receipt_data in enumerate(receipts_data):
+        try:
+            receipt_values, product_values = prepare_receipt(receipt_data)
+        except HTTPException as exc:
+            results[index] = {'index': index, 'status': 'failed', 'detail': exc.detail}
+            continue
+        receipt_values['user_id'] = user.id
+        prepared.append((index, (receipt_values, product_values)))
+
+    for start in range(0, len(prepared), chunk_size):
+        chunk = prepared[start:start + chunk_size]
+        try:
+            receipt_ids = await write_receipts(db, [receipt for _, receipt in chunk])
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            receipt_ids = [await _write_single_receipt(db, receipt) for _, receipt in chunk]
+        record_sales([
+            receipt for (_, receipt), receipt_id in zip(chunk, receipt_ids)
+            if receipt_id is not None
+        ])
+
+        for (index, _), receipt_id in zip(chunk, receipt_ids):
+            if receipt_id is None:
+                results[index] = {
+                    'index': index, 'status': 'failed', 'detail': "Receipt could not be saved"
+                }
+            else:
+                results[index] = {'index': index, 'status': 'created', 'id': receipt_id}
+
+    return results
+
+
+async def _write_single_receipt(db: AsyncSession, receipt):
+    try:
+        receipt_ids = await write_receipts(db, [receipt])
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        return None
+    return receipt_ids[0]
+
+
+async def get_receipts(
+    db: AsyncSession, user: Principal, filters, limit: int, offset: int, cursor: str = None
+):
+    """
+    Retrieves a page of receipts for a specific user with optional filters.
+
+    Receipts are ordered by `(created_at, id)`. When a cursor is given the page
+    starts right after the position it encodes and the offset is ignored,
+    so deep pages are served from the `(user_id, created_at, id)` index
+    instead of scanning and discarding skipped rows.
+
+    Args:
+        db (AsyncSession): The database session to use for queries.
+        user (Principal): The user whose receipts to retrieve.
         filters (Filter): The filter object to apply to the query.
         limit (int): The maximum number of receipts to retrieve.
         offset (int): The number of receipts to skip from the start.
+        cursor (str): Optional cursor returned with a previous page.
 
     Returns:
-        List[dict]: A list of receipt dictionaries.
+        tuple: A list of receipts with their products loaded and the cursor of
+        the next page, or None if there are no more receipts.
     """
-    query = filters.filter(db.query(Receipt).filter(
-        Receipt.user_id == user.id)).limit(limit).offset(offset)
-    return [receipt.to_dict() for receipt in query]
+    query = filters.filter(
+        select(Receipt)
+        .options(selectinload(Receipt.products))
+        .where(Receipt.user_id == user.id)
+    ).order_by(Receipt.created_at, Receipt.id)
+    if cursor:
+        query = query.where(tuple_(Receipt.created_at, Receipt.id) > decode_cursor(cursor))
+    else:
+        query = query.offset(offset)
+    receipts = (await db.scalars(query.limit(limit))).all()
 
+    next_cursor = None
+    if receipts and len(receipts) == limit:
+        next_cursor = encode_cursor(receipts[-1].created_at, receipts[-1].id)
+    return receipts, next_cursor
 
-def get_receipt_by_id(db: Session, receipt_id: int):
+
+class ReceiptRow:
     """
-    Retrieves a receipt by its ID.
+    A read-only receipt assembled from Core rows, without ORM instrumentation.
+
+    Has the same `to_dict` output as `Receipt`, so list endpoints can render
+    it in place of a loaded model.
+    """
+    __slots__ = ('id', 'type', 'amount', 'total', 'rest', 'created_at', 'products')
+
+    def __init__(self, id, type, amount, total, rest, created_at, products):
+        self.id = id
+        self.type = type
+        self.amount = amount
+        self.total = total
+        self.rest = rest
+        self.created_at = created_at
+        self.products = products
+
+    def to_dict(self):
+        return receipt_to_dict(self, self.products)
+
+
+async def load_products(db: AsyncSession, receipt_ids: list) -> dict:
+    products = defaultdict(list)
+    product_rows = await db.execute(
+        select(
+            Product.receipt_id, ProductCatalog.name, Product.price, Product.quantity,
+            Product.total
+        )
+        .join(ProductCatalog, ProductCatalog.id == Product.catalog_id)
+        .where(Product.receipt_id.in_(receipt_ids))
+        .order_by(Product.receipt_id, Product.id)
+    )
+    for product in product_rows:
+        products[product.receipt_id].append(product)
+    return products
+
+
+async def get_receipt_rows(
+    db: AsyncSession, user: Principal, filters, limit: int, offset: int, cursor: str = None
+):
+    """
+    Retrieves a page of receipts like `get_receipts`, without the ORM.
+
+    The page is read with one Core select and its products with a second one
+    keyed by `receipt_id`, and each receipt is assembled into a `ReceiptRow`.
+    Nothing is added to the session's identity map, which makes this the
+    cheaper choice for read-only listings.
+
+    Args:
+        db (AsyncSession): The database session to use for queries.
+        user (Principal): The user whose receipts to retrieve.
+        filters (Filter): The filter object to apply to the query.
+        limit (int): The maximum number of receipts to retrieve.
+        offset (int): The number of receipts to skip from the start.
+        cursor (str): Optional cursor returned with a previous page.
+
+    Returns:
+        tuple: A list of `ReceiptRow` objects with their products and the
+        cursor of the next page, or None if there are no more receipts.
+    """
+    query = filters.filter(
+        select(*RECEIPT_ROW_COLUMNS).where(Receipt.user_id == user.id)
+    ).order_by(Receipt.created_at, Receipt.id)
+    if cursor:
+        query = query.where(tuple_(Receipt.created_at, Receipt.id) > decode_cursor(cursor))
+    else:
+        query = query.offset(offset)
+    rows = (await db.execute(query.limit(limit))).all()
+
+    products = await load_products(db, [row.id for row in rows]) if rows else {}
+    receipts = [ReceiptRow(*row, products.get(row.id, [])) for row in rows]
+
+    next_cursor = None
+    if receipts and len(receipts) == limit:
+        next_cursor = encode_cursor(receipts[-1].created_at, receipts[-1].id)
+    return receipts, next_cursor
+
+
+async def get_receipt_by_id(db: AsyncSession, receipt_id: int):
+    """
+    Retrieves a receipt by its ID together with its products and user.
+
+    Receipts of partitions that have been archived are read from the archive.
 
     Args:
-        db (Session): The database session to use for the query.
+        db (AsyncSession): The database session to use for the query.
         receipt_id (int): The ID of the receipt to retrieve.
 
     Returns:
         Receipt: The receipt object, or None if not found.
     """
-    return db.query(Receipt).filter_by(id=receipt_id).first()
+    query = (
+        select(Receipt)
+        .options(selectinload(Receipt.products), joinedload(Receipt.user))
+        .where(Receipt.id == receipt_id)
+    )
+    receipt = (await db.scalars(query)).first()
+    if receipt is None:
+        receipt = await get_archived_receipt(db, receipt_id)
+    return receipt
+
+
+async def get_archived_receipt(
+    db: AsyncSession, receipt_id: int, archive: ReceiptArchive = receipt_archive
+):
+    """
+    Retrieves a receipt whose partition has been moved to the archive.
+
+    Args:
+        db (AsyncSession): The database session to load the receipt's user with.
+        receipt_id (int): The ID of the receipt to retrieve.
+        archive (ReceiptArchive): The archive to look the receipt up in.
+
+    Returns:
+        Receipt: A transient receipt object with its products and user, or
+        None if the receipt isn't archived either.
+    """
+    record = await asyncio.to_thread(archive.get, receipt_id)
+    if record is None:
+        return None
+    return Receipt(
+        id=record['id'],
+        type=record['payment']['type'],
+        amount=record['payment']['amount'],
+        total=record['total'],
+        rest=record['rest'],
+        created_at=datetime.fromisoformat(record['created_at']),
+        user_id=record['user_id'],
+        user=await db.get(User, record['user_id']),
+        products=[Product(receipt_id=record['id'], **product) for product in record['products']],
+    )
+
+
+async def get_receipt_created_at(db: AsyncSession, receipt_id: int):
+    """
+    Retrieves only the creation time of a receipt, without its products.
+
+    Receipts of partitions that have been archived are read from the archive.
+
+    Args:
+        db (AsyncSession): The database session to use for the query.
+        receipt_id (int): The ID of the receipt.
+
+    Returns:
+        datetime: The creation time of the receipt, or None if not found.
+    """
+    created_at = await db.scalar(select(Receipt.created_at).where(Receipt.id == receipt_id))
+    if created_at is None:
+        record = await asyncio.to_thread(receipt_archive.get, receipt_id)
+        if record is not None:
+            created_at = datetime.fromisoformat(record['created_at'])
+    return created_at
+
+
+async def get_receipts_version(db: AsyncSession, user: Principal, filters):
+    """
+    Retrieves a cheap fingerprint of the receipts matching a filter.
+
+    Receipts are never updated or deleted, so the number of matching receipts
+    and their highest ID change whenever the list changes.
+
+    Args:
+        db (AsyncSession): The database session to use for the query.
+        user (Principal): The user whose receipts to fingerprint.
+        filters (Filter): The filter object to apply to the query.
+
+    Returns:
+        tuple: The number of matching receipts and their highest ID.
+    """
+    query = filters.filter(
+        select(func.count(Receipt.id), func.max(Receipt.id)).where(Receipt.user_id == user.id)
+    )
+    return (await db.execute(query)).one()
+
+
+async def stream_receipts(db: AsyncSession, user: Principal, filters):
+    """
+    Streams the receipts of a user together with their products.
+
+    Receipts are read through a server-side cursor in batches of
+    `EXPORT_BATCH_SIZE`, and the products of each batch are loaded with a
+    single query, so memory use doesn't depend on the number of receipts.
+
+    Args:
+        db (AsyncSession): The database session to use for the queries.
+        user (Principal): The user whose receipts to stream.
+        filters (Filter): The filter object to apply to the query.
+
+    Yields:
+        tuple: The receipt row and the list of its product rows, ordered by
+        creation time.
+    """
+    query = filters.filter(
+        select(*RECEIPT_ROW_COLUMNS).where(Receipt.user_id == user.id)
+    ).order_by(Receipt.created_at, Receipt.id)
+
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for receipts in result.partitions():
+        products = await load_products(db, [receipt.id for receipt in receipts])
+        for receipt in receipts:
+            yield receipt, products[receipt.id]
+
+
+def _truncate_to_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+async def get_receipt_stats(
+    db: AsyncSession, user: Principal, group_by: str, start: datetime = None,
+    end: datetime = None
+):
+    """
+    Retrieves the number and sums of a user's receipts per day, hour or payment type.
+
+    Whole hours of the range are read from the hourly rollups. Receipts in
+    the partial hours at either end of the range are aggregated from the
+    `receipts` table, which only ever covers less than two hours of data.
+
+    Args:
+        db (AsyncSession): The database session to use for the queries.
+        user (Principal): The user whose receipts to aggregate.
+        group_by (str): `day`, `hour` or `type`.
+        start (datetime): Optional inclusive start of the range.
+        end (datetime): Optional exclusive end of the range.
+
+    Returns:
+        List[dict]: One entry per group, ordered by its key, with the key under
+        the name of the grouping and the `receipts`, `total` and `amount` sums.
+    """
+    rollup_start = rollup_end = None
+    if start is not None:
+        rollup_start = _truncate_to_hour(start)
+        if rollup_start < start:
+            rollup_start += timedelta(hours=1)
+    if end is not None:
+        rollup_end = _truncate_to_hour(end)
+
+    groups = defaultdict(lambda: [0, 0.0, 0.0])
+    partial_ranges = []
+    if start is not None and end is not None and rollup_start > rollup_end:
+        partial_ranges.append((start, end))
+    else:
+        if start is not None and start < rollup_start:
+            partial_ranges.append((start, rollup_start))
+        if end is not None and rollup_end < end:
+            partial_ranges.append((rollup_end, end))
+        await _add_rollup_stats(db, user, group_by, rollup_start, rollup_end, groups)
+
+    for range_start, range_end in partial_ranges:
+        hour = _truncate_to_hour(range_start)
+        rows = await db.execute(
+            select(
+                Receipt.type, func.count(Receipt.id), func.sum(Receipt.total),
+                func.sum(Receipt.amount)
+            )
+            .where(
+                Receipt.user_id == user.id, Receipt.created_at >= range_start,
+                Receipt.created_at < range_end
+            )
+            .group_by(Receipt.type)
+        )
+        for payment_type, count, total, amount in rows:
+            key = {
+                'day': hour.date().isoformat(), 'hour': hour.isoformat(), 'type': payment_type
+            }[group_by]
+            _add_to_group(groups[key], count, total, amount)
+
+    return [
+        {group_by: key, 'receipts': count, 'total': total, 'amount': amount}
+        for key, (count, total, amount) in sorted(groups.items())
+    ]
+
+
+async def _add_rollup_stats(
+    db: AsyncSession, user: Principal, group_by: str, start: datetime, end: datetime, groups
+):
+    if start is not None and end is not None and start == end:
+        return
+
+    rollup = ReceiptDailyRollup
+    key_columns = {
+        'day': [rollup.day],
+        'hour': [rollup.day, rollup.hour],
+        'type': [rollup.type],
+    }[group_by]
+    query = select(
+        *key_columns, func.sum(rollup.receipts), func.sum(rollup.total), func.sum(rollup.amount)
+    ).where(rollup.user_id == user.id).group_by(*key_columns)
+    if start is not None:
+        query = query.where(tuple_(rollup.day, rollup.hour) >= (start.date(), start.hour))
+    if end is not None:
+        query = query.where(tuple_(rollup.day, rollup.hour) < (end.date(), end.hour))
+
+    for row in await db.execute(query):
+        if group_by == 'day':
+            key = row[0].isoformat()
+        elif group_by == 'hour':
+            key = datetime.combine(row[0], time(row[1])).isoformat()
+        else:
+            key = row[0]
+        _add_to_group(groups[key], *row[len(key_columns):])
+
+
+def _add_to_group(group: list, count: int, total: float, amount: float):
+    group[0] += count
+    group[1] += total
+    group[2] += amount
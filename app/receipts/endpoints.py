@@ -1,109 +1,367 @@
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import PlainTextResponse
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from fastapi_filter import FilterDepends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.common.common_utils import (create_json_response, format_receipt,
-                                     raise_not_found_exception)
-from app.common.database import get_db
-from app.common.dependencies import require_auth
-from app.receipts.crud import create_receipt, get_receipt_by_id, get_receipts
+from app.common.common_utils import (create_json_response, create_not_modified_response,
+                                     etag_matches, format_receipt, make_etag,
+                                     raise_not_found_exception, to_naive_utc)
+from app.common.database import ShardRouter, get_shard_router
+from app.common.dependencies import (get_user_db, get_user_read_db, read_own_writes,
+                                     remember_write, require_auth)
+from app.receipts.cache import ReceiptCache, get_receipt_cache
+from app.receipts.crud import (create_receipt, create_receipts_bulk, get_receipt_by_id,
+                               get_receipt_created_at, get_receipt_rows, get_receipt_stats,
+                               get_receipts_version, stream_receipts)
+from app.receipts.export import EXPORT_FORMATS
 from app.receipts.filters import ReceiptFilter
-from app.receipts.schemas import ReceiptCreateSchema
+from app.receipts.schemas import ReceiptCreateSchema, ReceiptSchema
+from app.receipts.writer import ReceiptWriter, get_receipt_writer
 
 
 router = APIRouter()
 
+MAX_BULK_RECEIPTS = 5000
+RECEIPT_CACHE_CONTROL = "max-age=31536000, immutable"
+
 
-@router.post('/')
-def create_receipt_endpoint(
+@router.post('/', response_model=ReceiptSchema)
+async def create_receipt_endpoint(
     receipt: ReceiptCreateSchema,
     user=Depends(require_auth),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db),
+    shards: ShardRouter = Depends(get_shard_router),
+    writer: Optional[ReceiptWriter] = Depends(get_receipt_writer)
 ):
     """
     Creates a new receipt for a user.
 
+    When group commit is enabled, the receipt is written by the shared
+    writer together with receipts of concurrent requests, and the response
+    is sent once their transaction has committed. The client's reads go to
+    the primaries until replicas have caught up with the receipt.
+
     Args:
         receipt (ReceiptCreateSchema): The data to create the receipt.
-        user (User): The authenticated user creating the receipt.
-        db (Session): The database session to interact with the database.
+        user (Principal): The authenticated user creating the receipt.
+        db (AsyncSession): The database session to interact with the database.
+        shards (ShardRouter): The shards of the receipts.
+        writer (ReceiptWriter): The group-commit writer, or None if disabled.
+
+    Returns:
+        ORJSONResponse: The created receipt data in JSON format.
+    """
+    db_receipt = await create_receipt(db, user, receipt, writer)
+    response = create_json_response(db_receipt.to_dict())
+    remember_write(response, shards)
+    return response
+
+
+@router.post('/bulk')
+async def create_receipts_bulk_endpoint(
+    receipts: List[ReceiptCreateSchema] = Body(..., max_length=MAX_BULK_RECEIPTS),
+    user=Depends(require_auth),
+    db: AsyncSession = Depends(get_user_db),
+    shards: ShardRouter = Depends(get_shard_router)
+):
+    """
+    Creates many receipts for a user in one request.
+
+    Each receipt is validated on its own, so an invalid receipt is reported in
+    its result without preventing the others from being created.
+
+    Args:
+        receipts (List[ReceiptCreateSchema]): The receipts to create.
+        user (Principal): The authenticated user creating the receipts.
+        db (AsyncSession): The database session to interact with the database.
+        shards (ShardRouter): The shards of the receipts.
 
     Returns:
-        JSONResponse: The created receipt data in JSON format.
+        JSONResponse: One result per receipt, in the order they were sent.
     """
-    db_receipt = create_receipt(db, user, receipt)
-    return create_json_response(db_receipt.to_dict())
+    results = await create_receipts_bulk(db, user, receipts)
+    response = create_json_response(results)
+    remember_write(response, shards)
+    return response
 
 
-@router.get('/')
-def receipts_list(
+@router.get('/', response_model=List[ReceiptSchema])
+async def receipts_list(
+    request: Request,
     user=Depends(require_auth),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_user_read_db),
     filters: ReceiptFilter = FilterDepends(ReceiptFilter),
     limit: int = Query(100, ge=0),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Retrieves a list of receipts for a specific user with optional filters and pagination.
 
+    When more receipts are available, the cursor of the next page is returned
+    in the `X-Next-Cursor` response header. The response carries a weak ETag
+    derived from the number of matching receipts and their highest ID, so
+    polling clients sending `If-None-Match` get a 304 until a receipt is added.
+
     Args:
-        user (User): The authenticated user whose receipts to retrieve.
-        db (Session): The database session to interact with the database.
+        request (Request): The incoming request.
+        user (Principal): The authenticated user whose receipts to retrieve.
+        db (AsyncSession): The database session to interact with the database.
         filters (ReceiptFilter): Optional filter object to filter the receipts.
         limit (int): The maximum number of receipts to retrieve (default is 100).
         offset (int): The number of receipts to skip from the start (default is 0).
+        cursor (str): The cursor of the page to retrieve; takes precedence over offset.
+        if_none_match (str): The ETags of the list the client already has.
+
+    Returns:
+        ORJSONResponse: A list of receipts in JSON format.
+    """
+    count, max_id = await get_receipts_version(db, user, filters)
+    headers = {
+        "ETag": make_etag(user.id, count, max_id, sorted(request.query_params.multi_items()),
+                          weak=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return create_not_modified_response(headers)
+
+    receipts, next_cursor = await get_receipt_rows(db, user, filters, limit, offset, cursor)
+    response = create_json_response([receipt.to_dict() for receipt in receipts])
+    response.headers.update(headers)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@router.get('/stats')
+async def get_receipt_stats_endpoint(
+    group_by: Literal['day', 'hour', 'type'] = 'day',
+    start: Optional[datetime] = Query(None, alias='from'),
+    end: Optional[datetime] = Query(None, alias='to'),
+    user=Depends(require_auth),
+    db: AsyncSession = Depends(get_user_read_db)
+):
+    """
+    Retrieves the number and sums of a user's receipts per day, hour or payment type.
+
+    Answered from hourly rollups, so the cost doesn't grow with the number
+    of receipts in the range. Bounds with a timezone are converted to UTC;
+    bounds without one are taken to be in UTC.
+
+    Args:
+        group_by (str): `day`, `hour` or `type` (default is `day`).
+        start (datetime): Optional inclusive start of the range.
+        end (datetime): Optional exclusive end of the range.
+        user (Principal): The authenticated user whose receipts to aggregate.
+        db (AsyncSession): The database session to interact with the database.
 
     Returns:
-        JSONResponse: A list of receipts in JSON format.
+        ORJSONResponse: One entry per group with the number of receipts and
+        the sums of their totals and payment amounts.
+
+    Raises:
+        HTTPException: If the range doesn't end after it starts.
     """
-    receipts = get_receipts(db, user, filters, limit, offset)
-    return create_json_response(receipts)
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="`from` must be before `to`"
+        )
+    return create_json_response(await get_receipt_stats(db, user, group_by, start, end))
 
 
-@router.get('/{receipt_id}')
-def get_receipt_endpoint(
+@router.get('/export')
+async def export_receipts(
+    user=Depends(require_auth),
+    shards: ShardRouter = Depends(get_shard_router),
+    primary: bool = Depends(read_own_writes),
+    filters: ReceiptFilter = FilterDepends(ReceiptFilter),
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format')
+):
+    """
+    Streams all receipts of a user matching the filters.
+
+    Receipts are read through a server-side cursor and written out as they
+    arrive, so memory use stays flat regardless of how many receipts the user has.
+    The stream opens its own session on the user's shard, as it outlives the
+    request's dependencies.
+
+    Args:
+        user (Principal): The authenticated user whose receipts to export.
+        shards (ShardRouter): The shards of the receipts.
+        primary (bool): Whether the client wrote recently, so that reads
+        skip the replicas.
+        filters (ReceiptFilter): Optional filter object to filter the receipts.
+        export_format (str): `ndjson` for one receipt per line, or `csv` for
+        one line per product (default is `ndjson`).
+
+    Returns:
+        StreamingResponse: The receipts in the requested format.
+    """
+    render, media_type = EXPORT_FORMATS[export_format]
+
+    async def content():
+        async with shards.reading(shards.shard_for_user(user.id), primary) as db:
+            async for chunk in render(stream_receipts(db, user, filters)):
+                yield chunk
+
+    return StreamingResponse(content(), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="receipts.{export_format}"'
+    })
+
+
+async def find_on_shards(shards: ShardRouter, receipt_id: int, lookup, primary: bool = False):
+    """
+    Runs a lookup of a receipt on the shards that may hold it.
+
+    The shard named by the receipt ID is tried first. Receipts of users moved
+    by the rebalancer keep their IDs, so the other shards are tried next.
+    Each shard is read from a replica, and from its primary when the replica
+    doesn't have the receipt (yet).
+
+    Args:
+        shards (ShardRouter): The shards of the receipts.
+        receipt_id (int): The ID of the receipt.
+        lookup (Callable): Called with a session and the receipt ID; returns
+        None when the receipt isn't found.
+        primary (bool): Whether to read from the primaries only.
+
+    Returns:
+        The first result that isn't None, or None.
+    """
+    for shard in shards.receipt_lookup_order(receipt_id):
+        async with shards.reading(shard, primary) as db:
+            result = await lookup(db, receipt_id)
+        if result is None and not primary and shards.replica_sets[shard]:
+            async with shards.session(shard) as db:
+                result = await lookup(db, receipt_id)
+        if result is not None:
+            return result
+    return None
+
+
+async def get_receipt_version(
+    shards: ShardRouter, cache: ReceiptCache, receipt_id: int, primary: bool = False
+):
+    """
+    Retrieves the creation time of a receipt, which its ETags are derived from.
+
+    This also checks that the receipt exists without loading it.
+
+    Args:
+        shards (ShardRouter): The shards of the receipts.
+        cache (ReceiptCache): The cache of rendered receipts.
+        receipt_id (int): The ID of the receipt.
+        primary (bool): Whether to read from the primaries only.
+
+    Returns:
+        datetime: The creation time of the receipt.
+
+    Raises:
+        HTTPException: If the receipt is not found.
+    """
+    created_at = await cache.get_created_at(receipt_id)
+    if created_at is None:
+        created_at = await find_on_shards(shards, receipt_id, get_receipt_created_at, primary)
+        if created_at is None:
+            raise_not_found_exception(f"Receipt with id {receipt_id} doesn't exist")
+        await cache.set_created_at(receipt_id, created_at)
+    return created_at
+
+
+@router.get('/{receipt_id}', response_model=ReceiptSchema)
+async def get_receipt_endpoint(
     receipt_id: int, 
     user=Depends(require_auth), 
-    db: Session = Depends(get_db)
+    shards: ShardRouter = Depends(get_shard_router),
+    primary: bool = Depends(read_own_writes),
+    cache: ReceiptCache = Depends(get_receipt_cache),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Retrieves a specific receipt by its ID.
 
+    Receipts never change, so the response has a strong ETag and is marked
+    immutable. A matching `If-None-Match` is answered with a 304 before the
+    receipt and its products are loaded.
+
     Args:
         receipt_id (int): The ID of the receipt to retrieve.
-        user (User): The authenticated user making the request.
-        db (Session): The database session to interact with the database.
+        user (Principal): The authenticated user making the request.
+        shards (ShardRouter): The shards of the receipts.
+        primary (bool): Whether the client wrote recently, so that reads
+        skip the replicas.
+        cache (ReceiptCache): The cache of rendered receipts.
+        if_none_match (str): The ETags of the receipt the client already has.
 
     Returns:
-        JSONResponse: The requested receipt data in JSON format.
+        Response: The requested receipt data in JSON format.
 
     Raises:
         HTTPException: If the receipt is not found.
     """
-    receipt = get_receipt_by_id(db, receipt_id)
-    if not receipt:
-        return raise_not_found_exception(f"Receipt with id {receipt_id} doesn't exist")
-    return create_json_response(receipt.to_dict())
+    created_at = await get_receipt_version(shards, cache, receipt_id, primary)
+    headers = {
+        "ETag": make_etag(receipt_id, created_at.isoformat()),
+        "Cache-Control": f"private, {RECEIPT_CACHE_CONTROL}",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return create_not_modified_response(headers)
+
+    body = await cache.get_json(receipt_id)
+    if body is None:
+        receipt = await find_on_shards(shards, receipt_id, get_receipt_by_id, primary)
+        body = create_json_response(receipt.to_dict()).body
+        await cache.set_json(receipt_id, body)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get('/receipt-txt/{receipt_id}', response_class=PlainTextResponse)
-def get_receipt(receipt_id: int, chars_per_line: int = 32, db: Session = Depends(get_db)):
+async def get_receipt(
+    receipt_id: int,
+    chars_per_line: int = 32,
+    shards: ShardRouter = Depends(get_shard_router),
+    primary: bool = Depends(read_own_writes),
+    cache: ReceiptCache = Depends(get_receipt_cache),
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Retrieves a formatted text version of a specific receipt.
 
+    The response has a strong ETag that depends on the line width and is
+    marked immutable. A matching `If-None-Match` is answered with a 304
+    before the receipt and its products are loaded.
+
     Args:
         receipt_id (int): The ID of the receipt to retrieve in text format.
         chars_per_line (int): The number of characters per line for formatting (default is 32).
-        db (Session): The database session to interact with the database.
+        shards (ShardRouter): The shards of the receipts.
+        primary (bool): Whether the client wrote recently, so that reads
+        skip the replicas.
+        cache (ReceiptCache): The cache of rendered receipts.
+        if_none_match (str): The ETags of the receipt the client already has.
 
     Returns:
-        str: The receipt data in a formatted plain text version.
+        PlainTextResponse: The receipt data in a formatted plain text version.
 
     Raises:
         HTTPException: If the receipt is not found.
     """
-    receipt = get_receipt_by_id(db, receipt_id)
-    if not receipt:
-        return raise_not_found_exception(f"Receipt with id {receipt_id} doesn't exist")
-    return format_receipt(receipt, chars_per_line)
\ No newline at end of file
+    created_at = await get_receipt_version(shards, cache, receipt_id, primary)
+    headers = {
+        "ETag": make_etag(receipt_id, created_at.isoformat(), chars_per_line),
+        "Cache-Control": f"public, {RECEIPT_CACHE_CONTROL}",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return create_not_modified_response(headers)
+
+    body = await cache.get_text(receipt_id, chars_per_line)
+    if body is None:
+        receipt = await find_on_shards(shards, receipt_id, get_receipt_by_id, primary)
+        body = format_receipt(receipt, chars_per_line).encode()
+        await cache.set_text(receipt_id, chars_per_line, body)
+    return PlainTextResponse(content=body, headers=headers)
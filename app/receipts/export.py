@@ -0,0 +1,139 @@
+import csv
+import io
+
+import orjson
+
+EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = [
+    'receipt_id', 'created_at', 'payment_type', 'payment_amount', 'total', 'rest',
+    'product_name', 'product_price', 'product_quantity', 'product_total',
+]
+
+
+def receipt_to_dict(receipt, products):
+    """
+    Builds the dictionary representation of an exported receipt.
+
+    Args:
+        receipt (Row): The receipt row.
+        products (List[Row]): The product rows of the receipt.
+
+    Returns:
+        dict: The receipt in the same format as `Receipt.to_dict`.
+    """
+    return {
+        'id': receipt.id,
+        'products': [
+            {
+                'name': product.name,
+                'price': product.price,
+                'quantity': product.quantity,
+                'total': product.total,
+            }
+            for product in products
+        ],
+        'payment': {'type': receipt.type, 'amount': receipt.amount},
+        'total': receipt.total,
+        'rest': receipt.rest,
+        'created_at': receipt.created_at.isoformat(),
+    }
+
+
+def render_ndjson(receipts) -> bytes:
+    """
+    Renders receipts as newline-delimited JSON, one receipt per line.
+
+    Args:
+        receipts (Iterable[tuple]): Receipts with their products, as returned
+        by `stream_receipts`. ORM receipts paired with `receipt.products` work too.
+
+    Returns:
+        bytes: The rendered lines.
+    """
+    return b"".join(
+        orjson.dumps(receipt_to_dict(receipt, products), option=orjson.OPT_APPEND_NEWLINE)
+        for receipt, products in receipts
+    )
+
+
+def render_csv(receipts, header: bool = False) -> bytes:
+    """
+    Renders receipts as CSV with one line per product.
+
+    Receipts without products are rendered as a single line with empty
+    product columns.
+
+    Args:
+        receipts (Iterable[tuple]): Receipts with their products, as returned
+        by `stream_receipts`. ORM receipts paired with `receipt.products` work too.
+        header (bool): Whether to start with the line of column names.
+
+    Returns:
+        bytes: The rendered lines.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for receipt, products in receipts:
+        columns = [
+            receipt.id, receipt.created_at.isoformat(), receipt.type, receipt.amount,
+            receipt.total, receipt.rest,
+        ]
+        if not products:
+            writer.writerow(columns + [None] * 4)
+        for product in products:
+            writer.writerow(
+                columns + [product.name, product.price, product.quantity, product.total]
+            )
+    return buffer.getvalue().encode()
+
+
+async def export_ndjson(receipts):
+    """
+    Streams receipts as newline-delimited JSON.
+
+    Args:
+        receipts (AsyncIterable[tuple]): Receipts with their products, as
+        returned by `stream_receipts`.
+
+    Yields:
+        bytes: Chunks of up to `EXPORT_CHUNK_SIZE` receipts.
+    """
+    batch = []
+    async for receipt in receipts:
+        batch.append(receipt)
+        if len(batch) >= EXPORT_CHUNK_SIZE:
+            yield render_ndjson(batch)
+            batch = []
+    if batch:
+        yield render_ndjson(batch)
+
+
+async def export_csv(receipts):
+    """
+    Streams receipts as CSV with one line per product.
+
+    Args:
+        receipts (AsyncIterable[tuple]): Receipts with their products, as
+        returned by `stream_receipts`.
+
+    Yields:
+        bytes: The header line, then chunks of up to `EXPORT_CHUNK_SIZE` receipts.
+    """
+    yield render_csv([], header=True)
+    batch = []
+    async for receipt in receipts:
+        batch.append(receipt)
+        if len(batch) >= EXPORT_CHUNK_SIZE:
+            yield render_csv(batch)
+            batch = []
+    if batch:
+        yield render_csv(batch)
+
+
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'csv': (export_csv, 'text/csv'),
+}
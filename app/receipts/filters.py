@@ -3,8 +3,14 @@ from typing import Optional
 
 from fastapi_filter.contrib.sqlalchemy import Filter
 
+from app.products.search import receipt_ids_with_product
 from app.receipts.model import Receipt
 
+PRODUCT_NAME_FIELDS = {
+    'product_name': False,
+    'product_name__prefix': True,
+}
+
 
 class ReceiptFilter(Filter):
     total__gt: Optional[float] = None
@@ -12,6 +18,30 @@ class ReceiptFilter(Filter):
     type: Optional[str] = None
     created_at__gt: Optional[datetime] = None
     created_at__lt: Optional[datetime] = None
+    product_name: Optional[str] = None
+    product_name__prefix: Optional[str] = None
 
     class Constants(Filter.Constants):
-        model = Receipt
\ No newline at end of file
+        model = Receipt
+
+    @property
+    def filtering_fields(self):
+        return [
+            (field_name, value) for field_name, value in super().filtering_fields
+            if field_name not in PRODUCT_NAME_FIELDS
+        ]
+
+    def filter(self, query):
+        """
+        Applies the filters to a query of receipts.
+
+        `product_name` keeps receipts with a product whose name contains the
+        given text, and `product_name__prefix` those with a product whose name
+        starts with it, ignoring case.
+        """
+        query = super().filter(query)
+        for field_name, prefix in PRODUCT_NAME_FIELDS.items():
+            value = getattr(self, field_name)
+            if value:
+                query = query.where(Receipt.id.in_(receipt_ids_with_product(value, prefix)))
+        return query
@@ -1,4 +1,4 @@
-from sqlalchemy import (Column, DateTime, Enum, Float, ForeignKey, Index,
+from sqlalchemy import (BigInteger, Column, Date, DateTime, Enum, Float, ForeignKey, Index,
                         Integer)
 from sqlalchemy.orm import relationship
 
@@ -8,7 +8,9 @@ from app.common.database import Base
 class Receipt(Base):
     __tablename__ = 'receipts'
 
-    id = Column(Integer, primary_key=True)
+    # IDs encode the shard the receipt was created on, see `ShardRouter`.
+    # SQLite only generates IDs for INTEGER primary keys, which are 64-bit anyway.
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
     type = Column(Enum('cash', 'cashless', name='payment_type'), nullable=False)
     amount = Column(Float, nullable=False)
     total = Column(Float)
@@ -20,19 +22,39 @@ class Receipt(Base):
     products = relationship("Product", back_populates='receipt')
 
     __table_args__ = (
-        Index('ix_receipt_total', 'total'),  
-        Index('ix_receipt_created_at', 'created_at'),  
+        Index('ix_receipt_user_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_receipt_user_type_created_at_id', 'user_id', 'type', 'created_at', 'id'),
+        # Keeps SQLite from reusing IDs and lets a shard's ID range be set in
+        # sqlite_sequence.
+        {'sqlite_autoincrement': True},
     )
 
+    @property
+    def payment(self):
+        return {'type': self.type, 'amount': self.amount}
+
     def to_dict(self):
         return {
             'id': self.id,
             'products': [product.to_dict() for product in self.products],
-            'payment': {
-                'type': self.type,
-                'amount': self.amount
-            },
+            'payment': self.payment,
             'total': self.total,
             'rest': self.rest,
             'created_at': self.created_at.isoformat(),
-        }
\ No newline at end of file
+        }
+
+
+class ReceiptDailyRollup(Base):
+    """
+    Number and sums of a user's receipts per hour and payment type, kept up to
+    date by `write_receipts` in the same transaction as the receipts.
+    """
+    __tablename__ = 'receipt_daily_rollups'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    type = Column(Enum('cash', 'cashless', name='payment_type'), primary_key=True)
+    receipts = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    amount = Column(Float, nullable=False)
@@ -0,0 +1,223 @@
+"""
+Manages the monthly partitions of `receipts` and `products` on PostgreSQL:
+
+    python -m app.receipts.partitions create --months-ahead 3
+    python -m app.receipts.partitions archive --retention-months 24
+
+`create` adds the partitions of the coming months ahead of time, so new
+receipts never land in the default partitions; run it at least once a month,
+e.g. from cron. `archive` writes every month older than the retention window
+to compressed files in RECEIPT_ARCHIVE_DIR, then detaches and drops its
+partitions. Archived receipts are still served by `GET /receipts/{id}`.
+Both commands work on every shard in DATABASE_SHARD_URLS.
+"""
+import argparse
+import logging
+import os
+import re
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import DateTime, column, select, table, text
+
+from app.common.database import SessionLocal, ShardRouter, shard_router
+from app.receipts.archive import (ARCHIVE_BLOCK_SIZE, ARCHIVE_SUFFIX, RECEIPT_ARCHIVE_DIR,
+                                  write_archive)
+from app.receipts.export import receipt_to_dict
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_PARTITION_MONTHS_AHEAD = int(os.getenv("RECEIPT_PARTITION_MONTHS_AHEAD", 3))
+RECEIPT_RETENTION_MONTHS = int(os.getenv("RECEIPT_RETENTION_MONTHS", 24))
+
+# Products are partitioned by the creation time of their receipt, so both
+# partitions of a month are always created, archived and dropped together.
+PARTITIONED_TABLES = ('receipts', 'products')
+PARTITION_NAME = re.compile(r'^receipts_y(\d{4})m(\d{2})$')
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_y{month.year}m{month.month:02d}"
+
+
+def archive_name(shard: int, month: date) -> str:
+    return f"receipts_shard{shard}_y{month.year}m{month.month:02d}"
+
+
+def _require_postgresql(db):
+    if db.get_bind().dialect.name != 'postgresql':
+        raise RuntimeError("Receipt partitions are only supported on PostgreSQL")
+
+
+def create_partitions(session_factory=SessionLocal, months_ahead: int = None, today: date = None):
+    """
+    Creates the partitions of the current month and the following ones.
+
+    Existing partitions are left as they are, so this can run any number of times.
+
+    Args:
+        session_factory (sessionmaker): The factory of database sessions.
+        months_ahead (int): The number of months after the current one to
+        create partitions for (default is `RECEIPT_PARTITION_MONTHS_AHEAD`).
+        today (date): The current date, for tests.
+
+    Returns:
+        List[date]: The first day of every month that has partitions.
+    """
+    if months_ahead is None:
+        months_ahead = RECEIPT_PARTITION_MONTHS_AHEAD
+    current = (today or date.today()).replace(day=1)
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    with session_factory() as db:
+        _require_postgresql(db)
+        for month in months:
+            for table_name in PARTITIONED_TABLES:
+                db.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(table_name, month)} "
+                    f"PARTITION OF {table_name} "
+                    f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                ))
+        db.commit()
+    return months
+
+
+def list_partition_months(db) -> list:
+    """
+    Returns the first day of every month that has a receipts partition, in order.
+    """
+    names = db.scalars(text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'receipts'
+    """))
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def iter_partition_receipts(db, month: date, batch_size: int = ARCHIVE_BLOCK_SIZE):
+    """
+    Reads the receipts of a month's partitions with their products, ordered by ID.
+
+    Args:
+        db (Session): The database session to read with.
+        month (date): The first day of the month.
+        batch_size (int): The number of receipts whose products are loaded at once.
+
+    Yields:
+        dict: The receipt in the format of `Receipt.to_dict` with its
+        `user_id` added.
+    """
+    receipts = table(
+        partition_name('receipts', month), column('id'), column('type'), column('amount'),
+        column('total'), column('rest'), column('created_at', DateTime), column('user_id'),
+    )
+    products = table(
+        partition_name('products', month), column('id'), column('receipt_id'),
+        column('catalog_id'), column('price'), column('quantity'), column('total'),
+    )
+    catalog = table('product_catalog', column('id'), column('name'))
+    result = db.execute(
+        select(receipts).order_by(receipts.c.id).execution_options(yield_per=batch_size)
+    )
+    for batch in result.partitions():
+        receipt_products = defaultdict(list)
+        for product in db.execute(
+            select(
+                products.c.receipt_id, catalog.c.name, products.c.price, products.c.quantity,
+                products.c.total
+            )
+            .join(catalog, catalog.c.id == products.c.catalog_id)
+            .where(products.c.receipt_id.in_([receipt.id for receipt in batch]))
+            .order_by(products.c.receipt_id, products.c.id)
+        ):
+            receipt_products[product.receipt_id].append(product)
+        for receipt in batch:
+            yield {**receipt_to_dict(receipt, receipt_products[receipt.id]),
+                   'user_id': receipt.user_id}
+
+
+def archive_partitions(
+    session_factory=SessionLocal, retention_months: int = None,
+    directory: str = RECEIPT_ARCHIVE_DIR, today: date = None, shard: int = 0
+):
+    """
+    Moves the partitions of months older than the retention window to the archive.
+
+    Each month is written to `<directory>/receipts_shardN_yYYYYmMM.ndjson.gz`
+    and synced to disk before its partitions are detached and dropped, so a
+    run that is interrupted can simply be repeated. The archives of
+    different shards never overwrite each other.
+
+    Args:
+        session_factory (sessionmaker): The factory of database sessions on the shard.
+        retention_months (int): The number of past months to keep in the
+        database besides the current one (default is `RECEIPT_RETENTION_MONTHS`).
+        directory (str): The directory to write archives to.
+        today (date): The current date, for tests.
+        shard (int): The index of the shard.
+
+    Returns:
+        List[date]: The first day of every month that was archived.
+    """
+    if retention_months is None:
+        retention_months = RECEIPT_RETENTION_MONTHS
+    cutoff = add_months((today or date.today()).replace(day=1), -retention_months)
+    os.makedirs(directory, exist_ok=True)
+
+    archived = []
+    with session_factory() as db:
+        _require_postgresql(db)
+        months = [month for month in list_partition_months(db) if month < cutoff]
+        db.commit()
+
+    for month in months:
+        with session_factory() as db:
+            path = os.path.join(directory, archive_name(shard, month) + ARCHIVE_SUFFIX)
+            written = write_archive(path, iter_partition_receipts(db, month))
+            # Products reference receipts, so their partition goes first.
+            for table_name in reversed(PARTITIONED_TABLES):
+                name = partition_name(table_name, month)
+                db.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+                db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+        logger.info("Archived %s receipts of %s on shard %s to %s",
+                    written, month.strftime("%Y-%m"), shard, path)
+        archived.append(month)
+    return archived
+
+
+def main(argv: Optional[list] = None, shards: ShardRouter = shard_router):
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="create the partitions of the coming months")
+    create.add_argument("--months-ahead", type=int, default=RECEIPT_PARTITION_MONTHS_AHEAD)
+    archive = commands.add_parser("archive", help="archive partitions past the retention window")
+    archive.add_argument("--retention-months", type=int, default=RECEIPT_RETENTION_MONTHS)
+    archive.add_argument("--directory", default=RECEIPT_ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    for shard in range(len(shards)):
+        session_factory = shards.sync_session_factory(shard)
+        if args.command == "create":
+            months = create_partitions(session_factory, months_ahead=args.months_ahead)
+            logger.info("Partitions of shard %s exist up to %s",
+                        shard, months[-1].strftime("%Y-%m"))
+        else:
+            archive_partitions(session_factory, retention_months=args.retention_months,
+                               directory=args.directory, shard=shard)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Prepares the receipt shards and moves users to the shard they belong on:
+
+    python -m app.receipts.rebalance --batch-size 1000
+
+Run it after appending a URL to DATABASE_SHARD_URLS (with migrations applied
+to the new database). It first checks that the receipt ID sequence of every
+shard is within the ID range of the shard, which the API also ensures before
+writing to a shard, then moves every user whose receipts are on a
+shard other than the one the hash ring assigns them to, together with their
+totals and product summaries. New receipts go to the new shard as soon as
+the API runs with the new list, so a moving user's receipt list is
+incomplete until their receipts have been moved.
+
+Receipts are moved in batches, each committed on the target before it is
+deleted from the source, so the tool can be interrupted and run again.
+"""
+import argparse
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from app.common.database import ShardRouter, reset_id_sequence, shard_router
+from app.products.crud import merge_product_sketches
+from app.products.model import Product, ProductSketch
+from app.products.sketch import PRODUCT_SKETCH_CAPACITY, ProductSketchBuffer
+from app.receipts.crud import load_products, write_receipts
+from app.receipts.model import Receipt, ReceiptDailyRollup
+from app.users.crud import add_user_to_shard
+from app.users.model import User, UserStats
+
+logger = logging.getLogger(__name__)
+
+SHARD_REBALANCE_BATCH_SIZE = 1000
+
+
+async def move_user(
+    shards: ShardRouter, user_id: int, source: int, target: int,
+    batch_size: int = SHARD_REBALANCE_BATCH_SIZE
+) -> int:
+    """
+    Moves the receipts of a user from one shard to another.
+
+    Receipts keep their IDs. The hourly rollups, running totals and product
+    summaries of the user are rebuilt on the target from the moved receipts,
+    in the transaction of each batch, and deleted from the source once all
+    receipts are moved. Receipts the target already has, from an
+    interrupted run, are only deleted from the source.
+
+    Args:
+        shards (ShardRouter): The shards of the receipts.
+        user_id (int): The ID of the user.
+        source (int): The shard the user's receipts are on.
+        target (int): The shard to move them to.
+        batch_size (int): The number of receipts moved per transaction.
+
+    Returns:
+        int: The number of receipts moved.
+    """
+    moved = 0
+    async with shards.session(source) as source_db, shards.session(target) as target_db:
+        user = await source_db.get(User, user_id)
+        if user is not None:
+            await add_user_to_shard(target_db, user)
+        sales = ProductSketchBuffer(PRODUCT_SKETCH_CAPACITY, float("inf"))
+
+        while True:
+            receipts = (await source_db.execute(
+                select(Receipt.__table__).where(Receipt.user_id == user_id)
+                .order_by(Receipt.id).limit(batch_size)
+            )).all()
+            if not receipts:
+                break
+            receipt_ids = [receipt.id for receipt in receipts]
+            products = await load_products(source_db, receipt_ids)
+            existing = set(await target_db.scalars(
+                select(Receipt.id).where(Receipt.id.in_(receipt_ids))
+            ))
+
+            batch = [
+                (dict(receipt._mapping), [
+                    {'name': product.name, 'price': product.price,
+                     'quantity': product.quantity, 'total': product.total}
+                    for product in products[receipt.id]
+                ])
+                for receipt in receipts if receipt.id not in existing
+            ]
+            if batch:
+                await write_receipts(target_db, batch)
+                for receipt_values, product_values in batch:
+                    sales.record(user_id, receipt_values['created_at'].date(), product_values)
+                # Summarized in the same transaction, so a rerun never misses their sales.
+                await merge_product_sketches(target_db, sales.take(), sales.capacity)
+                await target_db.commit()
+
+            await source_db.execute(delete(Product).where(Product.receipt_id.in_(receipt_ids)))
+            await source_db.execute(delete(Receipt).where(Receipt.id.in_(receipt_ids)))
+            await source_db.commit()
+            moved += len(receipts)
+
+        for model in (ReceiptDailyRollup, UserStats, ProductSketch):
+            await source_db.execute(delete(model).where(model.user_id == user_id))
+        await source_db.commit()
+    return moved
+
+
+async def rebalance(shards: ShardRouter = shard_router,
+                    batch_size: int = SHARD_REBALANCE_BATCH_SIZE) -> int:
+    """
+    Moves every user whose receipts are on the wrong shard to their own shard.
+
+    Args:
+        shards (ShardRouter): The shards of the receipts.
+        batch_size (int): The number of receipts moved per transaction.
+
+    Returns:
+        int: The number of users moved.
+    """
+    for shard in range(len(shards)):
+        async with shards.session(shard) as db:
+            await reset_id_sequence(db, shard)
+
+    moved_users = 0
+    for source in range(len(shards)):
+        async with shards.session(source) as db:
+            user_ids = (await db.scalars(
+                select(UserStats.user_id)
+                .union(select(Receipt.user_id).where(Receipt.user_id.is_not(None)))
+            )).all()
+        for user_id in sorted(user_ids):
+            target = shards.shard_for_user(user_id)
+            if target == source:
+                continue
+            moved = await move_user(shards, user_id, source, target, batch_size)
+            logger.info("Moved %s receipts of user %s from shard %s to shard %s",
+                        moved, user_id, source, target)
+            moved_users += 1
+
+    for shard in range(len(shards)):
+        async with shards.session(shard) as db:
+            await reset_id_sequence(db, shard)
+    return moved_users
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=SHARD_REBALANCE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        try:
+            moved = await rebalance(batch_size=args.batch_size)
+            logger.info("Moved %s users across %s shards", moved, len(shard_router))
+        finally:
+            await shard_router.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -28,12 +28,11 @@ class ReceiptCreateSchema(ReceiptBaseSchema):
 class ReceiptSchema(ReceiptBaseSchema):
     id: int
     products: List[ProductSchema]
+    payment: PaymentSchema
     total: float
     rest: float
     created_at: datetime
-    type: str
-    amount: float
 
 
 class PersonalReceipts(BaseModel):
-    receipts: List[ReceiptSchema]
\ No newline at end of file
+    receipts: List[ReceiptSchema]
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+from functools import partial
+
+from fastapi import Depends
+
+from app.common.database import shard_router
+from app.common.dependencies import require_auth
+from app.receipts.crud import record_sales, write_receipts
+from app.users.schemas import Principal
+
+logger = logging.getLogger(__name__)
+
+# Group commit is off unless a batch window is configured.
+RECEIPT_GROUP_COMMIT_WINDOW_MS = float(os.getenv("RECEIPT_GROUP_COMMIT_WINDOW_MS", 0))
+RECEIPT_GROUP_COMMIT_MAX_SIZE = int(os.getenv("RECEIPT_GROUP_COMMIT_MAX_SIZE", 200))
+
+
+class ReceiptWriter:
+    """
+    Writes receipts submitted by concurrent requests in shared transactions.
+
+    The first receipt submitted opens a batch, which is written and committed
+    once it holds `max_size` receipts or `window` seconds have passed. One
+    commit then covers every receipt of the batch, so the cost of flushing the
+    transaction to disk is shared instead of paid by every request.
+
+    A request is only answered once the transaction holding its receipt has
+    committed. If the batch fails, its receipts are retried one per
+    transaction, so each request gets the error of its own receipt only.
+    """
+
+    def __init__(self, session_factory, window: float, max_size: int):
+        self.session_factory = session_factory
+        self.window = window
+        self.max_size = max_size
+        self._queue = None
+        self._full = None
+        self._task = None
+        self._loop = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._full = asyncio.Event()
+            self._task = loop.create_task(self._run())
+            self._loop = loop
+
+    async def submit(self, receipt) -> int:
+        """
+        Queues a prepared receipt and waits until it is committed.
+
+        Args:
+            receipt (tuple): The receipt and product values as returned by
+            `prepare_receipt`, with `user_id` set in the receipt values.
+
+        Returns:
+            int: The ID of the created receipt.
+
+        Raises:
+            Exception: The error that prevented the receipt from being written.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((receipt, future))
+        # The writer holds the first receipt of a batch outside of the queue.
+        if self._queue.qsize() + 1 >= self.max_size:
+            self._full.set()
+        return await future
+
+    async def stop(self):
+        """
+        Writes the receipts still queued and stops the writer.
+        """
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        self._queue.put_nowait(None)
+        self._full.set()
+        await self._task
+        self._task = self._queue = self._full = self._loop = None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                return
+            self._full.clear()
+            if self._queue.qsize() + 1 < self.max_size:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [item]
+            while len(batch) < self.max_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: list):
+        # Receipts whose request was cancelled while queued are not written.
+        batch = [(receipt, future) for receipt, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            async with self.session_factory() as db:
+                results = await self._write(db, [receipt for receipt, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                record_sales([
+                    receipt for (receipt, _), result in zip(batch, results)
+                    if not isinstance(result, Exception)
+                ])
+        except Exception as exc:
+            logger.exception("Failed to write a batch of %s receipts", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+
+    @staticmethod
+    async def _write(db, receipts: list) -> list:
+        try:
+            receipt_ids = await write_receipts(db, receipts)
+            await db.commit()
+            return receipt_ids
+        except Exception as exc:
+            await db.rollback()
+            if len(receipts) == 1:
+                return [exc]
+
+        results = []
+        for receipt in receipts:
+            try:
+                receipt_ids = await write_receipts(db, [receipt])
+                await db.commit()
+                results.append(receipt_ids[0])
+            except Exception as exc:
+                await db.rollback()
+                results.append(exc)
+        return results
+
+
+# Transactions can't span databases, so every shard has a writer of its own.
+receipt_writers = []
+if RECEIPT_GROUP_COMMIT_WINDOW_MS > 0:
+    receipt_writers = [
+        ReceiptWriter(
+            partial(shard_router.session, shard),
+            RECEIPT_GROUP_COMMIT_WINDOW_MS / 1000, RECEIPT_GROUP_COMMIT_MAX_SIZE
+        )
+        for shard in range(len(shard_router))
+    ]
+
+
+def get_receipt_writer(user: Principal = Depends(require_auth)):
+    if not receipt_writers:
+        return None
+    return receipt_writers[shard_router.shard_for_user(user.id)]
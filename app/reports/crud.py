@@ -0,0 +1,62 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.common_utils import raise_not_found_exception
+from app.reports.model import ReportJob
+from app.users.schemas import Principal
+
+
+async def create_report_job(
+    db: AsyncSession, user: Principal, kind: str, report_format: str, filters
+):
+    """
+    Enqueues a report job for a user.
+
+    Args:
+        db (AsyncSession): The database session to use for the query.
+        user (Principal): The user requesting the report.
+        kind (str): `export` for all matching receipts, or `daily_totals` for
+        per-day sums by payment type.
+        report_format (str): `ndjson` or `csv`.
+        filters (ReceiptFilter): The filter the report's receipts must match.
+
+    Returns:
+        ReportJob: The pending job.
+    """
+    job = ReportJob(
+        id=uuid.uuid4().hex,
+        user_id=user.id,
+        kind=kind,
+        format=report_format,
+        filters=filters.model_dump(mode='json', exclude_none=True),
+        status='pending',
+        processed=0,
+        size=0,
+        created_at=datetime.now(),
+    )
+    db.add(job)
+    await db.commit()
+    return job
+
+
+async def get_report_job(db: AsyncSession, user: Principal, job_id: str):
+    """
+    Retrieves a report job of a user.
+
+    Args:
+        db (AsyncSession): The database session to use for the query.
+        user (Principal): The user who requested the report.
+        job_id (str): The ID of the job.
+
+    Returns:
+        ReportJob: The job.
+
+    Raises:
+        HTTPException: If the job doesn't exist or belongs to another user.
+    """
+    job = await db.get(ReportJob, job_id)
+    if job is None or job.user_id != user.id:
+        raise_not_found_exception(f"Report with id {job_id} doesn't exist")
+    return job
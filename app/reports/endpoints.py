@@ -0,0 +1,96 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from fastapi_filter import FilterDepends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.common_utils import create_json_response
+from app.common.database import get_db
+from app.common.dependencies import require_auth
+from app.receipts.filters import ReceiptFilter
+from app.reports.crud import create_report_job, get_report_job
+from app.reports.jobs import report_path
+from app.reports.schemas import ReportCreateSchema, ReportJobSchema
+
+router = APIRouter()
+
+
+@router.post('', response_model=ReportJobSchema, status_code=status.HTTP_202_ACCEPTED)
+async def create_report(
+    report: ReportCreateSchema,
+    user=Depends(require_auth),
+    db: AsyncSession = Depends(get_db),
+    filters: ReceiptFilter = FilterDepends(ReceiptFilter)
+):
+    """
+    Enqueues a report over the receipts of a user matching the filters.
+
+    The report is built by the background worker (`python -m app.worker`).
+
+    Args:
+        report (ReportCreateSchema): The kind and format of the report.
+        user (Principal): The authenticated user requesting the report.
+        db (AsyncSession): The database session to interact with the database.
+        filters (ReceiptFilter): Optional filter object to filter the receipts.
+
+    Returns:
+        ORJSONResponse: The pending job, with status 202.
+    """
+    job = await create_report_job(db, user, report.kind, report.format, filters)
+    return create_json_response(
+        ReportJobSchema.model_validate(job).model_dump(mode='json'),
+        status_code=status.HTTP_202_ACCEPTED
+    )
+
+
+@router.get('/{job_id}', response_model=ReportJobSchema)
+async def get_report(job_id: str, user=Depends(require_auth), db: AsyncSession = Depends(get_db)):
+    """
+    Retrieves the status and progress of a report job.
+
+    Args:
+        job_id (str): The ID of the job.
+        user (Principal): The authenticated user who requested the report.
+        db (AsyncSession): The database session to interact with the database.
+
+    Returns:
+        ORJSONResponse: The job, including the number of processed receipts.
+
+    Raises:
+        HTTPException: If the job doesn't exist.
+    """
+    job = await get_report_job(db, user, job_id)
+    return create_json_response(ReportJobSchema.model_validate(job).model_dump(mode='json'))
+
+
+@router.get('/{job_id}/download')
+async def download_report(
+    job_id: str, user=Depends(require_auth), db: AsyncSession = Depends(get_db)
+):
+    """
+    Serves the gzip-compressed file of a finished report.
+
+    `Range` requests are supported, so interrupted downloads can be resumed.
+
+    Args:
+        job_id (str): The ID of the job.
+        user (Principal): The authenticated user who requested the report.
+        db (AsyncSession): The database session to interact with the database.
+
+    Returns:
+        FileResponse: The report file.
+
+    Raises:
+        HTTPException: If the job doesn't exist or hasn't finished yet.
+    """
+    job = await get_report_job(db, user, job_id)
+    path = report_path(job)
+    if job.status != 'done' or not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Report with id {job_id} is not ready, its status is {job.status}"
+        )
+    return FileResponse(
+        path, media_type="application/gzip", filename=f"receipts-{job.kind}.{job.format}.gz"
+    )
@@ -0,0 +1,247 @@
+import csv
+import gzip
+import io
+import logging
+import os
+from datetime import datetime, time, timedelta
+from typing import Optional
+
+import orjson
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.database import AsyncSessionLocal, SessionLocal, ShardRouter, shard_router
+from app.receipts.crud import get_receipt_rows, get_receipts_version
+from app.receipts.export import render_csv, render_ndjson
+from app.receipts.filters import ReceiptFilter
+from app.receipts.model import Receipt
+from app.reports.model import ReportJob
+from app.users.model import User
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", 5000))
+REPORT_WINDOW_DAYS = int(os.getenv("REPORT_WINDOW_DAYS", 31))
+
+DAILY_TOTALS_COLUMNS = ['day', 'payment_type', 'receipts', 'total', 'amount']
+
+
+def report_path(job: ReportJob) -> str:
+    """
+    Returns the path of the gzip-compressed file a report job writes to.
+    """
+    return os.path.join(REPORTS_DIR, f"{job.id}.{job.format}.gz")
+
+
+def append_chunk(path: str, offset: int, data: bytes) -> int:
+    """
+    Appends a chunk to a report file as a separate gzip member.
+
+    Anything after `offset` was written by a run that didn't get to record
+    its progress, so it's discarded first. Concatenated gzip members
+    decompress as a single stream.
+
+    Args:
+        path (str): The path of the report file.
+        offset (int): The size of the file as of the last recorded chunk.
+        data (bytes): The uncompressed chunk.
+
+    Returns:
+        int: The size of the file after the chunk was written.
+    """
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+        file.truncate(offset)
+        file.seek(offset)
+        file.write(gzip.compress(data, compresslevel=6))
+        file.flush()
+        os.fsync(file.fileno())
+        return file.tell()
+
+
+async def export_chunk(db: AsyncSession, user: User, job: ReportJob, filters):
+    """
+    Renders the next page of receipts of an export report.
+
+    Returns:
+        tuple: The rendered chunk, the number of receipts in it and the cursor
+        of the next chunk, or None if this was the last one.
+    """
+    receipts, cursor = await get_receipt_rows(
+        db, user, filters, REPORT_CHUNK_SIZE, 0, job.cursor
+    )
+    pairs = [(receipt, receipt.products) for receipt in receipts]
+    if job.format == 'csv':
+        data = render_csv(pairs, header=job.size == 0)
+    else:
+        data = render_ndjson(pairs)
+    return data, len(receipts), cursor
+
+
+async def daily_totals_chunk(db: AsyncSession, user: User, job: ReportJob, filters):
+    """
+    Aggregates the next `REPORT_WINDOW_DAYS` days of a daily totals report.
+
+    The cursor is the start of the next window, so each chunk is a single
+    GROUP BY over a bounded range of the `(user_id, created_at)` index. Empty
+    stretches between receipts are skipped.
+
+    Returns:
+        tuple: The rendered chunk, the number of receipts in it and the cursor
+        of the next chunk, or None if this was the last one.
+    """
+    def matching(query):
+        return filters.filter(query.where(Receipt.user_id == user.id))
+
+    if job.cursor is None:
+        first = await db.scalar(matching(select(func.min(Receipt.created_at))))
+        start = datetime.combine(first.date(), time.min) if first else None
+    else:
+        start = datetime.fromisoformat(job.cursor)
+
+    rows = []
+    cursor = None
+    if start is not None:
+        end = start + timedelta(days=REPORT_WINDOW_DAYS)
+        day = func.date(Receipt.created_at)
+        rows = (await db.execute(
+            matching(
+                select(
+                    day, Receipt.type, func.count(Receipt.id), func.sum(Receipt.total),
+                    func.sum(Receipt.amount)
+                ).where(Receipt.created_at >= start, Receipt.created_at < end)
+            ).group_by(day, Receipt.type).order_by(day, Receipt.type)
+        )).all()
+        following = await db.scalar(
+            matching(select(func.min(Receipt.created_at)).where(Receipt.created_at >= end))
+        )
+        if following is not None:
+            cursor = datetime.combine(following.date(), time.min).isoformat()
+
+    rows = [[str(row[0]), *row[1:]] for row in rows]
+    if job.format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if job.size == 0:
+            writer.writerow(DAILY_TOTALS_COLUMNS)
+        writer.writerows(rows)
+        data = buffer.getvalue().encode()
+    else:
+        data = b"".join(
+            orjson.dumps(dict(zip(DAILY_TOTALS_COLUMNS, row)), option=orjson.OPT_APPEND_NEWLINE)
+            for row in rows
+        )
+    return data, sum(row[2] for row in rows), cursor
+
+
+REPORT_KINDS = {
+    'export': export_chunk,
+    'daily_totals': daily_totals_chunk,
+}
+
+
+async def run_report_job(
+    job_id: str, session_factory=AsyncSessionLocal, shards: ShardRouter = None
+):
+    """
+    Runs a claimed report job to completion, one chunk at a time.
+
+    After each chunk the file size, the cursor of the next chunk and the
+    progress are committed, so a job interrupted by a restart resumes from
+    its last recorded chunk instead of starting over.
+
+    Args:
+        job_id (str): The ID of a job in the `running` state.
+        session_factory (async_sessionmaker): The factory of sessions on the
+        main database, which holds the jobs.
+        shards (ShardRouter): The shards of the receipts (default is `shard_router`).
+    """
+    shards = shards or shard_router
+    async with session_factory() as db:
+        job = await db.get(ReportJob, job_id)
+        if job is None or job.status != 'running':
+            return
+        shard_db = shards.session(shards.shard_for_user(job.user_id))
+        try:
+            filters = ReceiptFilter(**job.filters)
+            user = await db.get(User, job.user_id)
+            if job.total is None:
+                job.total = (await get_receipts_version(shard_db, user, filters))[0]
+                await db.commit()
+
+            run_chunk = REPORT_KINDS[job.kind]
+            while True:
+                data, processed, cursor = await run_chunk(shard_db, user, job, filters)
+                # Ends the chunk's read transaction, so the shard doesn't keep a
+                # snapshot open for the whole job.
+                await shard_db.rollback()
+                job.size = append_chunk(report_path(job), job.size, data)
+                job.processed += processed
+                job.cursor = cursor
+                if cursor is None:
+                    job.status = 'done'
+                    job.finished_at = datetime.now()
+                await db.commit()
+                if cursor is None:
+                    return
+        except Exception as exc:
+            logger.exception("Report job %s failed", job_id)
+            await db.rollback()
+            await db.execute(
+                update(ReportJob).where(ReportJob.id == job_id)
+                .values(status='failed', error=str(exc)[:500], finished_at=datetime.now())
+            )
+            await db.commit()
+        finally:
+            await shard_db.close()
+
+
+def claim_next_job(session_factory=SessionLocal) -> Optional[str]:
+    """
+    Moves the oldest pending job to the `running` state.
+
+    The conditional update makes claiming safe when several worker
+    processes poll the same table.
+
+    Args:
+        session_factory (sessionmaker): The factory of database sessions.
+
+    Returns:
+        str: The ID of the claimed job, or None if there are no pending jobs.
+    """
+    with session_factory() as db:
+        while True:
+            job_id = db.scalar(
+                select(ReportJob.id).where(ReportJob.status == 'pending')
+                .order_by(ReportJob.created_at).limit(1)
+            )
+            if job_id is None:
+                return None
+            claimed = db.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job_id, ReportJob.status == 'pending')
+                .values(status='running')
+            ).rowcount
+            db.commit()
+            if claimed:
+                return job_id
+
+
+def requeue_interrupted_jobs(session_factory=SessionLocal) -> int:
+    """
+    Moves jobs left in the `running` state by a stopped worker back to `pending`.
+
+    Must only be called while no other worker is running jobs.
+
+    Args:
+        session_factory (sessionmaker): The factory of database sessions.
+
+    Returns:
+        int: The number of requeued jobs.
+    """
+    with session_factory() as db:
+        requeued = db.execute(
+            update(ReportJob).where(ReportJob.status == 'running').values(status='pending')
+        ).rowcount
+        db.commit()
+        return requeued
@@ -0,0 +1,29 @@
+from sqlalchemy import (JSON, BigInteger, Column, DateTime, Enum, ForeignKey, Index,
+                        Integer, String)
+
+from app.common.database import Base
+
+
+class ReportJob(Base):
+    __tablename__ = 'report_jobs'
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    kind = Column(Enum('export', 'daily_totals', name='report_kind'), nullable=False)
+    format = Column(Enum('ndjson', 'csv', name='report_format'), nullable=False)
+    filters = Column(JSON, nullable=False)
+    status = Column(
+        Enum('pending', 'running', 'done', 'failed', name='report_status'), nullable=False
+    )
+    total = Column(Integer)
+    processed = Column(Integer, nullable=False, default=0)
+    cursor = Column(String)
+    size = Column(BigInteger, nullable=False, default=0)
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_report_job_status_created_at', 'status', 'created_at'),
+        Index('ix_report_job_user_id', 'user_id'),
+    )
@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+
+class ReportCreateSchema(BaseModel):
+    kind: Literal['export', 'daily_totals'] = 'export'
+    format: Literal['ndjson', 'csv'] = 'ndjson'
+
+
+class ReportJobSchema(BaseModel):
+    id: str
+    kind: str
+    format: str
+    status: str
+    processed: int
+    total: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
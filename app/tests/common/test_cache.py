@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from app.common.cache import CacheBackend, LRUCacheBackend
+
+
+def test_lru_cache_evicts_by_size():
+    cache = LRUCacheBackend(max_bytes=25)
+
+    async def fill():
+        await cache.set("a", b"x" * 9)
+        await cache.set("b", b"x" * 9)
+        await cache.get("a")
+        await cache.set("c", b"x" * 9)
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    a, b, c = asyncio.run(fill())
+    assert b is None
+    assert a == c == b"x" * 9
+    assert cache.size == 20
+
+
+def test_lru_cache_skips_values_larger_than_the_cache():
+    cache = LRUCacheBackend(max_bytes=10)
+    asyncio.run(cache.set("big", b"x" * 10))
+    assert len(cache) == 0
+
+
+def test_cache_backend_must_implement_set():
+    class ReadOnlyBackend(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()
@@ -1,6 +1,10 @@
+import time
+from datetime import timedelta
+
 import pytest
+from fastapi import HTTPException
 from unittest.mock import patch
-from app.common.auth_utils import create_token
+from app.common.auth_utils import TokenCache, create_token, decode_token, token_cache
 
 
 SECRET_KEY = "test-secret"
@@ -19,4 +23,40 @@ def test_create_token(mock_encode):
     token = create_token(data)
     assert isinstance(token, str)
     assert token == "mocked-token"
-    mock_encode.assert_called_once()
\ No newline at end of file
+    mock_encode.assert_called_once()
+
+
+@pytest.fixture
+def empty_token_cache():
+    token_cache.clear()
+    yield token_cache
+    token_cache.clear()
+
+
+def test_decode_token_uses_cache(empty_token_cache):
+    token = create_token({"sub": "test@example.com"})
+    assert decode_token(token)["sub"] == "test@example.com"
+    assert decode_token(token)["sub"] == "test@example.com"
+    assert empty_token_cache.misses == 1
+    assert empty_token_cache.hits == 1
+
+
+def test_decode_token_rejects_expired_cached_token(empty_token_cache):
+    token = create_token({"sub": "test@example.com"}, expires_delta=timedelta(seconds=-1))
+    empty_token_cache.set(token, {"sub": "test@example.com", "exp": time.time() - 1})
+    with pytest.raises(HTTPException) as exc_info:
+        decode_token(token)
+    assert exc_info.value.status_code == 401
+    assert empty_token_cache.hits == 0
+
+
+def test_token_cache_evicts_least_recently_used():
+    cache = TokenCache(max_size=2)
+    expires_at = time.time() + 60
+    for token in ("first", "second"):
+        cache.set(token, {"sub": token, "exp": expires_at})
+    cache.get("first")
+    cache.set("third", {"sub": "third", "exp": expires_at})
+    assert cache.get("second") is None
+    assert cache.get("first")["sub"] == "first"
+    assert cache.get("third")["sub"] == "third"
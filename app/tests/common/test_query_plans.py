@@ -0,0 +1,194 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from app.products.crud import flush_product_sketches, get_or_create_catalog_ids, get_top_products
+from app.products.sketch import product_sketches
+from app.receipts.crud import (get_receipt_by_id, get_receipt_created_at, get_receipt_rows,
+                               get_receipt_stats, get_receipts, get_receipts_version,
+                               stream_receipts, write_receipts)
+from app.receipts.filters import ReceiptFilter
+from app.reports.crud import create_report_job, get_report_job
+from app.reports.jobs import claim_next_job, daily_totals_chunk, export_chunk
+from app.reports.model import ReportJob
+from app.tests.conftest import TestingAsyncSessionLocal, TestingSessionLocal, async_engine, engine
+from app.users.crud import get_user, get_user_stats
+from app.users.model import User
+from app.users.schemas import Principal
+
+USERS = 5
+RECEIPTS_PER_USER = 400
+PRODUCT_NAMES = [f"Product {i}" for i in range(50)]
+FIRST_DAY = datetime(2025, 3, 1)
+
+
+@pytest.fixture
+def seeded_user(db_session):
+    """
+    Seeds several users with receipts spread over two weeks, analyzes the
+    database so the planner sees realistic statistics, and returns one of
+    the users.
+    """
+    users = [User(username=f"user {i}", login=f"login_{i}", password="-") for i in range(USERS)]
+    db_session.add_all(users)
+    db_session.commit()
+
+    receipts = []
+    for user in users:
+        for i in range(RECEIPTS_PER_USER):
+            receipts.append(({
+                'user_id': user.id, 'type': ('cash', 'cashless')[i % 2], 'total': 3.0,
+                'amount': 5.0, 'rest': 2.0, 'created_at': FIRST_DAY + timedelta(minutes=50 * i),
+            }, [
+                {'name': PRODUCT_NAMES[(i + j) % len(PRODUCT_NAMES)], 'price': 1.0,
+                 'quantity': 1, 'total': 1.0}
+                for j in range(3)
+            ]))
+            product_sketches.record(user.id, receipts[-1][0]['created_at'].date(), receipts[-1][1])
+
+    async def seed():
+        async with TestingAsyncSessionLocal() as db:
+            await write_receipts(db, receipts)
+            await flush_product_sketches(db)
+            await db.commit()
+
+    asyncio.run(seed())
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    product_sketches.clear()
+    user = users[0]
+    return Principal(id=user.id, login=user.login, username=user.username)
+
+
+async def list_receipts(db, user, **filters):
+    for read_page in (get_receipts, get_receipt_rows):
+        receipts, cursor = await read_page(db, user, ReceiptFilter(**filters), 50, 0)
+        await read_page(db, user, ReceiptFilter(**filters), 50, 0, cursor)
+
+
+async def export_receipts(db, user):
+    async for _ in stream_receipts(db, user, ReceiptFilter(type="cash")):
+        pass
+
+
+async def run_report_chunks(db, user):
+    job = await create_report_job(db, user, 'export', 'ndjson', ReceiptFilter())
+    await get_report_job(db, user, job.id)
+    await export_chunk(db, user, job, ReceiptFilter(type="cash"))
+    await daily_totals_chunk(db, user, job, ReceiptFilter())
+
+
+async def get_stats(db, user):
+    for group_by in ('day', 'hour', 'type'):
+        await get_receipt_stats(
+            db, user, group_by, FIRST_DAY + timedelta(minutes=30), FIRST_DAY + timedelta(days=3)
+        )
+
+
+async def get_receipt(db, user):
+    await get_receipt_by_id(db, 1)
+    await get_receipt_created_at(db, 1)
+
+
+async def get_user_with_stats(db, user):
+    await get_user(db, user)
+    await get_user_stats(db, user)
+
+
+# Every crud query, with the temporary sorts it is allowed to use. Sorts are
+# only allowed where rows are ordered or grouped by a computed value that no
+# index can provide, or where the rows are found through another index first.
+CRUD_QUERIES = {
+    "list receipts": (lambda db, user: list_receipts(db, user), set()),
+    "list receipts by type": (lambda db, user: list_receipts(db, user, type="cash"), set()),
+    "list receipts by total": (lambda db, user: list_receipts(db, user, total__gt=1.0), set()),
+    "list receipts by date": (
+        lambda db, user: list_receipts(db, user, created_at__gt=FIRST_DAY + timedelta(days=3)),
+        set()
+    ),
+    "list receipts by product": (
+        lambda db, user: list_receipts(db, user, product_name="Product 1"),
+        {"USE TEMP B-TREE FOR ORDER BY"}
+    ),
+    "receipts version": (
+        lambda db, user: get_receipts_version(db, user, ReceiptFilter(type="cashless")), set()
+    ),
+    "get receipt": (get_receipt, set()),
+    "export receipts": (export_receipts, set()),
+    "receipt stats": (get_stats, {"USE TEMP B-TREE FOR GROUP BY"}),
+    "top products": (
+        lambda db, user: get_top_products(db, user, 'revenue', 5, date(2025, 3, 2)), set()
+    ),
+    "exact top products": (
+        lambda db, user: get_top_products(db, user, 'revenue', 5, exact=True),
+        {"USE TEMP B-TREE FOR GROUP BY", "USE TEMP B-TREE FOR ORDER BY"}
+    ),
+    "catalog ids": (
+        lambda db, user: get_or_create_catalog_ids(db, ["Product 1", "New product"]), set()
+    ),
+    "user": (get_user_with_stats, set()),
+    "report jobs": (run_report_chunks, {"USE TEMP B-TREE FOR GROUP BY"}),
+}
+
+
+def explain(statement: str, parameters) -> list:
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in rows]
+
+
+def capture_statements(run, bind=async_engine.sync_engine) -> list:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters))
+
+    event.listen(bind, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(bind, "before_cursor_execute", capture)
+    return statements
+
+
+@pytest.mark.parametrize("name", CRUD_QUERIES)
+def test_crud_queries_use_indexes(seeded_user, name):
+    query, allowed_sorts = CRUD_QUERIES[name]
+
+    async def run_query():
+        async with TestingAsyncSessionLocal() as db:
+            await query(db, seeded_user)
+
+    statements = capture_statements(lambda: asyncio.run(run_query()))
+
+    assert statements
+    for statement, parameters in statements:
+        plan = explain(statement, parameters)
+        # Scanning a subquery's already filtered rows doesn't scan a table.
+        subqueries = {step.split()[1] for step in plan if step.startswith("MATERIALIZE ")}
+        full_scans = [
+            step for step in plan
+            if step.startswith("SCAN ") and "VIRTUAL TABLE" not in step
+            and step.split()[1] not in subqueries
+        ]
+        sorts = [step for step in plan if step.startswith("USE TEMP B-TREE")]
+        assert not full_scans, f"{statement}\n{plan}"
+        assert set(sorts) <= allowed_sorts, f"{statement}\n{plan}"
+
+
+def test_claim_next_job_uses_index(seeded_user):
+    with TestingSessionLocal() as db:
+        db.add(ReportJob(
+            id="a" * 32, user_id=seeded_user.id, kind='export', format='csv', filters={},
+            status='pending', processed=0, size=0, created_at=datetime.now()
+        ))
+        db.commit()
+
+    statements = capture_statements(lambda: claim_next_job(TestingSessionLocal), engine)
+
+    for statement, parameters in statements:
+        plan = explain(statement, parameters)
+        assert not any(step.startswith(("SCAN ", "USE TEMP B-TREE")) for step in plan), plan
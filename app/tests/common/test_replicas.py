@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.common.database import (Base, ReplicaSet, ShardRouter, get_async_database_url,
+                                 get_shard_router)
+from app.common.dependencies import LAST_WRITE_COOKIE
+from app.main import app
+from app.tests.conftest import TestingAsyncSessionLocal
+from app.tests.test_helpers import get_jwt
+
+
+def create_replica(path, schema=True):
+    # A stand-in for a replica that hasn't received any write yet.
+    url = f"sqlite:///{path}"
+    if schema:
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        engine.dispose()
+    return async_sessionmaker(
+        autoflush=False, expire_on_commit=False,
+        bind=create_async_engine(get_async_database_url(url), poolclass=NullPool)
+    )
+
+
+def use_replicas(*replica_factories):
+    router = ShardRouter([TestingAsyncSessionLocal], [ReplicaSet(list(replica_factories))])
+    app.dependency_overrides[get_shard_router] = lambda: router
+    return router
+
+
+@pytest.fixture
+def headers(test_client):
+    payload = {"login": "reader", "username": "Reader", "password": "secret"}
+    return {"Authorization": f"Bearer {get_jwt(payload, test_client)}"}
+
+
+def test_reads_follow_own_writes_to_the_primary(test_client, headers, receipt_payload, tmp_path):
+    use_replicas(create_replica(tmp_path / "replica.db"))
+
+    created = test_client.post("/receipts/", headers=headers, json=receipt_payload)
+    receipt_id = created.json()["id"]
+    assert LAST_WRITE_COOKIE in created.cookies
+
+    listed = test_client.get("/receipts/", headers=headers).json()
+    assert [receipt["id"] for receipt in listed] == [receipt_id]
+
+    # Without the cookie the list comes from the replica, which lags behind.
+    test_client.cookies.clear()
+    assert test_client.get("/receipts/", headers=headers).json() == []
+    assert test_client.get("/users/me/stats", headers=headers).json()["receipts"] == 0
+
+
+def test_receipts_missing_on_replica_are_read_from_primary(
+    test_client, headers, receipt_payload, tmp_path
+):
+    use_replicas(create_replica(tmp_path / "replica.db"))
+    receipt_id = test_client.post("/receipts/", headers=headers, json=receipt_payload).json()["id"]
+    test_client.cookies.clear()
+
+    by_id = test_client.get(f"/receipts/{receipt_id}", headers=headers)
+    text = test_client.get(f"/receipts/receipt-txt/{receipt_id}")
+
+    assert by_id.status_code == 200
+    assert by_id.json()["id"] == receipt_id
+    assert "Apple" in text.text
+
+
+def test_old_writes_are_read_from_replica(test_client, headers, receipt_payload, tmp_path):
+    use_replicas(create_replica(tmp_path / "replica.db"))
+    test_client.post("/receipts/", headers=headers, json=receipt_payload)
+
+    test_client.cookies.set(LAST_WRITE_COOKIE, str(time.time() - 60))
+
+    assert test_client.get("/receipts/", headers=headers).json() == []
+
+
+def test_unhealthy_replicas_are_skipped(test_client, headers, receipt_payload, tmp_path):
+    router = use_replicas(create_replica(tmp_path / "missing" / "replica.db", schema=False))
+    test_client.post("/receipts/", headers=headers, json=receipt_payload)
+    test_client.cookies.clear()
+
+    listed = test_client.get("/receipts/", headers=headers).json()
+
+    assert len(listed) == 1
+    assert asyncio.run(router.replica_sets[0].pick()) is None
+
+
+def test_replicas_are_used_in_turn(tmp_path):
+    replicas = ReplicaSet([create_replica(tmp_path / f"replica{index}.db") for index in (0, 1)])
+
+    async def picks(count):
+        return [await replicas.pick() for _ in range(count)]
+
+    assert asyncio.run(picks(4)) == [0, 1, 0, 1]
+    replicas.mark_down(0)
+    assert asyncio.run(picks(3)) == [1, 1, 1]
+
+
+class StalledSession:
+    # Stands in for a replica that silently drops packets.
+    async def __aenter__(self):
+        await asyncio.sleep(60)
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+def test_stalled_replicas_time_out():
+    replicas = ReplicaSet([StalledSession], check_timeout=0.05)
+    started = time.monotonic()
+
+    assert asyncio.run(replicas.pick()) is None
+    assert time.monotonic() - started < 1
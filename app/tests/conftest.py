@@ -1,49 +1,87 @@
+import os
+import tempfile
+
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 
-from app.common.database import Base, get_db
+from app.common.auth_utils import password_hasher
+from app.common.database import Base, ShardRouter, get_async_database_url, get_db, get_shard_router
 from app.main import app
+from app.products.catalog import catalog_cache
+from app.products.flusher import product_sketch_flusher
+from app.products.sketch import product_sketches
+from app.receipts.cache import ReceiptCache, get_receipt_cache
+from app.tests.test_helpers import FakeCacheBackend
 
-TEST_DATABASE_URL = "sqlite://"
+# The app talks to the database through aiosqlite while the tests inspect it
+# with a sync session, so both need to see the same file-backed database.
+TEST_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
 
-engine = create_engine(
-    TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
+engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+
+async_engine = create_async_engine(get_async_database_url(TEST_DATABASE_URL), poolclass=NullPool)
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False, expire_on_commit=False, bind=async_engine
+)
+
+# The test database is the only shard.
+test_shard_router = ShardRouter([TestingAsyncSessionLocal])
+
 Base.metadata.create_all(bind=engine)
 
 
 @pytest.fixture(scope="function")
 def db_session():
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    session = TestingSessionLocal()
     yield session
     session.close()
-    transaction.rollback()
-    connection.close()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture(scope="function")
+def receipt_cache():
+    return ReceiptCache(FakeCacheBackend())
 
 
 @pytest.fixture(scope="function")
-def test_client(db_session):
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            db_session.close()
+def test_client(db_session, receipt_cache, monkeypatch):
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_shard_router] = lambda: test_shard_router
+    app.dependency_overrides[get_receipt_cache] = lambda: receipt_cache
+    monkeypatch.setattr(product_sketch_flusher, "shards", test_shard_router)
+    # Spawning the password hashing workers again for every test is slow.
+    monkeypatch.setattr(password_hasher, "shutdown", lambda: None)
+    product_sketches.clear()
+    catalog_cache.clear()
     with TestClient(app) as client:
         yield client
 
 
+@pytest.fixture
+def query_counter():
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+
 @pytest.fixture
 def user_payload():
     return {
@@ -0,0 +1,59 @@
+import asyncio
+
+from app.products.catalog import catalog_cache
+from app.products.crud import get_or_create_catalog_ids
+from app.products.model import Product, ProductCatalog
+from app.tests.conftest import TestingAsyncSessionLocal
+from app.tests.test_helpers import create_receipt
+
+
+def get_or_create(names, commit):
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            ids = await get_or_create_catalog_ids(db, names)
+            if commit:
+                await db.commit()
+            else:
+                await db.rollback()
+            return ids
+
+    return asyncio.run(run())
+
+
+def test_products_share_catalog_entries(test_client, db_session, user_payload, receipt_payload):
+    for _ in range(2):
+        response = create_receipt(user_payload, test_client, receipt_payload)
+
+    catalog = {entry.name: entry.id for entry in db_session.query(ProductCatalog)}
+    products = db_session.query(Product).all()
+
+    assert response.json()["products"][0] == {
+        "name": "Apple", "price": 1.5, "quantity": 10, "total": 15.0
+    }
+    assert set(catalog) == {"Apple", "Banana"}
+    assert len(products) == 4
+    assert all(product.catalog_id == catalog[product.name] for product in products)
+    assert catalog_cache.get_many(catalog) == catalog
+
+
+def test_catalog_ids_are_cached_only_after_commit(test_client, db_session):
+    get_or_create({"Apple"}, commit=False)
+
+    assert catalog_cache.get_many({"Apple"}) == {}
+    assert db_session.query(ProductCatalog).count() == 0
+
+    ids = get_or_create({"Apple"}, commit=True)
+
+    assert catalog_cache.get_many({"Apple"}) == ids
+    assert db_session.query(ProductCatalog).one().id == ids["Apple"]
+
+
+def test_catalog_reuses_existing_entries(test_client, db_session):
+    db_session.add(ProductCatalog(name="Apple"))
+    db_session.commit()
+    existing_id = db_session.query(ProductCatalog).one().id
+
+    ids = get_or_create({"Apple", "Banana"}, commit=True)
+
+    assert ids["Apple"] == existing_id
+    assert db_session.query(ProductCatalog).count() == 2
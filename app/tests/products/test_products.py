@@ -0,0 +1,159 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.common.database import ShardRouter
+from app.products.flusher import ProductSketchFlusher
+from app.products.model import ProductSketch
+from app.products.sketch import ProductSketchBuffer, SpaceSaving, product_sketches
+from app.tests.conftest import test_shard_router
+from app.tests.test_helpers import create_receipt, get_jwt
+from app.users.model import User
+
+
+def get_top(test_client, token, **params):
+    # Sales reach the summaries through the background flusher.
+    asyncio.run(ProductSketchFlusher(product_sketches, test_shard_router).flush())
+    response = test_client.get(
+        "/products/top", headers={"Authorization": f"Bearer {token}"}, params=params
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def assert_bounds(sketch, weights):
+    for item, count, error in sketch.top(sketch.capacity):
+        assert count - error <= weights[item] <= count
+    for item, weight in weights.items():
+        if weight > sketch.min_count:
+            assert item in sketch.counters
+
+
+def test_space_saving_bounds():
+    stream = random.Random(1)
+    weights = Counter()
+    sketch = SpaceSaving(capacity=10)
+    for _ in range(2000):
+        item = f"item-{int(stream.paretovariate(1.2))}"
+        weights[item] += 1
+        sketch.add(item, 1)
+
+    assert len(sketch.counters) == 10
+    assert sketch.top(1)[0][0] == "item-1"
+    assert_bounds(sketch, weights)
+
+
+def test_space_saving_merge_bounds():
+    stream = random.Random(2)
+    weights = Counter()
+    merged = SpaceSaving(capacity=10)
+    for _ in range(5):
+        sketch = SpaceSaving(capacity=10)
+        for _ in range(500):
+            item = f"item-{int(stream.paretovariate(1.2))}"
+            weight = stream.randint(1, 5)
+            weights[item] += weight
+            sketch.add(item, weight)
+        merged.merge(sketch)
+
+    assert_bounds(merged, weights)
+
+
+def test_space_saving_evicts_smallest_counter():
+    stream = random.Random(3)
+    sketch = SpaceSaving(capacity=10)
+    for step in range(2000):
+        if step == 1000:
+            sketch.merge(SpaceSaving(10, sketch.counters))
+        item = f"item-{stream.randint(1, 30)}"
+        smallest = min(count for count, _ in sketch.counters.values()) if sketch.is_full else 0
+        evicts = item not in sketch.counters
+        sketch.add(item, stream.randint(1, 5))
+        if evicts:
+            assert sketch.counters[item][1] == smallest
+
+
+def test_top_products(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    create_receipt(user_payload, test_client, receipt_payload)
+    receipt_payload["products"] = [{"name": "Banana", "price": 1.2, "quantity": 20}]
+    create_receipt(user_payload, test_client, receipt_payload)
+
+    approximate = get_top(test_client, token, k=1)
+    exact = get_top(test_client, token, k=1, exact=True)
+    by_quantity = get_top(test_client, token, metric="quantity")
+
+    assert approximate == {
+        "metric": "revenue", "exact": False,
+        "products": [{"name": "Banana", "value": 30.0, "error": 0}],
+    }
+    assert exact["products"] == approximate["products"]
+    assert by_quantity["products"] == [
+        {"name": "Banana", "value": 25, "error": 0},
+        {"name": "Apple", "value": 10, "error": 0},
+    ]
+
+
+def test_top_products_merges_persisted_sketches(
+    test_client, db_session, user_payload, receipt_payload
+):
+    token = get_jwt(user_payload, test_client)
+    create_receipt(user_payload, test_client, receipt_payload)
+    get_top(test_client, token)
+    create_receipt(user_payload, test_client, receipt_payload)
+
+    products = get_top(test_client, token)["products"]
+
+    assert products == [
+        {"name": "Apple", "value": 30.0, "error": 0},
+        {"name": "Banana", "value": 12.0, "error": 0},
+    ]
+
+
+def test_top_products_date_range(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    create_receipt(user_payload, test_client, receipt_payload)
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+
+    for exact in (False, True):
+        assert get_top(test_client, token, exact=exact, **{"from": tomorrow})["products"] == []
+        assert len(get_top(test_client, token, exact=exact, to=tomorrow)["products"]) == 2
+
+
+def record_apples(buffer, user_id, quantity):
+    buffer.record(user_id, date.today(), [{"name": "Apple", "quantity": quantity, "total": 1.0}])
+
+
+def test_failed_flush_keeps_summaries(tmp_path):
+    buffer = ProductSketchBuffer(10, float("inf"))
+    unreachable = async_sessionmaker(bind=create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'shard.db'}"
+    ))
+    record_apples(buffer, 1, 2)
+
+    asyncio.run(ProductSketchFlusher(buffer, ShardRouter([unreachable])).flush())
+    record_apples(buffer, 1, 3)
+
+    sketch = buffer.pending[(1, date.today(), "quantity")]
+    assert sketch.top(1) == [("Apple", 5, 0)]
+
+
+def test_summaries_are_flushed_on_stop(test_client, db_session, user_payload):
+    get_jwt(user_payload, test_client)
+    user_id = db_session.query(User.id).scalar()
+    buffer = ProductSketchBuffer(10, float("inf"))
+    flusher = ProductSketchFlusher(buffer, test_shard_router)
+
+    async def run():
+        flusher.start()
+        record_apples(buffer, user_id, 2)
+        await flusher.stop()
+
+    asyncio.run(run())
+
+    assert buffer.pending == {}
+    row = db_session.get(ProductSketch, (user_id, date.today(), "quantity"))
+    assert row.counters == {"Apple": [2, 0]}
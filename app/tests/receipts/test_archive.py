@@ -0,0 +1,113 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.receipts.archive import ReceiptArchive, receipt_archive, write_archive
+from app.receipts.model import Receipt
+from app.receipts.partitions import (add_months, archive_name, iter_partition_receipts,
+                                     partition_name)
+from app.products.model import Product
+from app.tests.test_helpers import create_receipt, get_jwt
+
+
+def make_receipt(receipt_id):
+    return {
+        'id': receipt_id,
+        'products': [{'name': f"Product {receipt_id}", 'price': 2.0, 'quantity': 3, 'total': 6.0}],
+        'payment': {'type': 'cash', 'amount': 10.0},
+        'total': 6.0,
+        'rest': 4.0,
+        'created_at': "2023-01-05T10:00:00",
+        'user_id': 1,
+    }
+
+
+def test_add_months():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert add_months(date(2024, 1, 1), -24) == date(2022, 1, 1)
+
+
+def test_partition_name():
+    assert partition_name('receipts', date(2025, 3, 1)) == 'receipts_y2025m03'
+
+
+def test_archives_of_shards_are_kept_apart(tmp_path):
+    month = date(2023, 1, 1)
+    for shard, receipt_id in ((0, 5), (1, (1 << 40) + 5)):
+        path = str(tmp_path / (archive_name(shard, month) + ".ndjson.gz"))
+        write_archive(path, [make_receipt(receipt_id)])
+    archive = ReceiptArchive(str(tmp_path))
+
+    assert archive_name(1, month) == 'receipts_shard1_y2023m01'
+    assert archive.get(5) == make_receipt(5)
+    assert archive.get((1 << 40) + 5) == make_receipt((1 << 40) + 5)
+
+
+def test_archive_lookup(tmp_path):
+    ids = list(range(10, 1000, 3))
+    path = str(tmp_path / "receipts_y2023m01.ndjson.gz")
+
+    written = write_archive(path, (make_receipt(receipt_id) for receipt_id in ids), block_size=16)
+    archive = ReceiptArchive(str(tmp_path))
+
+    assert written == len(ids)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "receipts_y2023m01.idx", "receipts_y2023m01.ndjson.gz"
+    ]
+    for receipt_id in (10, 13, 58, 997):
+        assert archive.get(receipt_id) == make_receipt(receipt_id)
+    for receipt_id in (1, 11, 998, 5000):
+        assert archive.get(receipt_id) is None
+
+
+def test_interrupted_archive_is_not_read(tmp_path):
+    def failing_receipts():
+        yield make_receipt(1)
+        raise RuntimeError("connection lost")
+
+    with pytest.raises(RuntimeError):
+        write_archive(str(tmp_path / "receipts_y2023m01.ndjson.gz"), failing_receipts())
+
+    assert list(tmp_path.iterdir()) == []
+    assert ReceiptArchive(str(tmp_path)).get(1) is None
+
+
+def test_archived_receipt_is_served(
+    test_client, db_session, user_payload, receipt_payload, tmp_path, monkeypatch
+):
+    token = get_jwt(user_payload, test_client)
+    receipt_id = create_receipt(user_payload, test_client, receipt_payload).json()["id"]
+    expected = test_client.get(
+        f"/receipts/{receipt_id}", headers={"Authorization": f"Bearer {token}"}
+    ).json()
+
+    # SQLite has no partitions, so copies of the tables stand in for those of a month.
+    month = date(2023, 1, 1)
+    for table_name in ('receipts', 'products'):
+        db_session.execute(text(
+            f"CREATE TABLE {partition_name(table_name, month)} AS SELECT * FROM {table_name}"
+        ))
+    try:
+        write_archive(
+            str(tmp_path / "receipts_y2023m01.ndjson.gz"),
+            iter_partition_receipts(db_session, month)
+        )
+    finally:
+        for table_name in ('receipts', 'products'):
+            db_session.execute(text(f"DROP TABLE {partition_name(table_name, month)}"))
+    db_session.query(Product).delete()
+    db_session.query(Receipt).delete()
+    db_session.commit()
+    monkeypatch.setattr(receipt_archive, "directory", str(tmp_path))
+
+    response = test_client.get(
+        f"/receipts/{receipt_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    text_response = test_client.get(f"/receipts/receipt-txt/{receipt_id}")
+
+    assert response.status_code == 200
+    assert response.json() == expected
+    assert text_response.status_code == 200
+    assert receipt_payload["products"][0]["name"] in text_response.text
@@ -1,4 +1,18 @@
+import asyncio
+import csv
+import io
+import json
+
+from sqlalchemy import select, text
+
+from app.products.model import Product
+from app.receipts.crud import get_receipt_rows, get_receipts
+from app.receipts.filters import ReceiptFilter
+from app.receipts.model import Receipt
+from app.tests.conftest import TestingAsyncSessionLocal
 from app.tests.test_helpers import get_jwt, create_receipt
+from app.users.model import User
+from app.users.schemas import Principal
 
 
 def test_create_receipt_endpoint(test_client, db_session, user_payload, receipt_payload):
@@ -16,6 +30,39 @@ def test_receipts_list(test_client, db_session, user_payload, receipt_payload):
     assert len(response.json()) > 0
 
 
+def test_receipts_list_query_count_is_flat(
+    test_client, db_session, user_payload, receipt_payload, query_counter
+):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    create_receipt(user_payload, test_client, receipt_payload)
+
+    query_counter.clear()
+    response = test_client.get("/receipts/", headers=headers)
+    assert len(response.json()) == 1
+    single_page_queries = len(query_counter)
+
+    for _ in range(9):
+        create_receipt(user_payload, test_client, receipt_payload)
+
+    query_counter.clear()
+    response = test_client.get("/receipts/", headers=headers)
+    assert len(response.json()) == 10
+    assert len(query_counter) == single_page_queries
+
+
+def test_get_receipt_text_query_count(test_client, db_session, user_payload, receipt_payload,
+                                      query_counter):
+    create_response = create_receipt(user_payload, test_client, receipt_payload)
+    receipt_id = create_response.json()["id"]
+
+    query_counter.clear()
+    response = test_client.get(f"/receipts/receipt-txt/{receipt_id}")
+
+    assert response.status_code == 200
+    assert len(query_counter) == 3
+
+
 def test_get_receipt_endpoint(test_client, db_session, user_payload, receipt_payload):
     token = get_jwt(user_payload, test_client)
     create_response = create_receipt(user_payload, test_client, receipt_payload)
@@ -55,4 +102,312 @@ def test_receipt_text_with_custom_width(test_client, db_session, user_payload, r
     response = test_client.get(f"/receipts/receipt-txt/{receipt_id}?chars_per_line=40")
 
     assert response.status_code == 200
-    assert "=" * 40 in response.text
\ No newline at end of file
+    assert "=" * 40 in response.text
+
+
+def test_receipts_list_cursor_pagination(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    created_ids = [
+        create_receipt(user_payload, test_client, receipt_payload).json()["id"] for _ in range(5)
+    ]
+
+    first_page = test_client.get("/receipts/?limit=2", headers=headers)
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = test_client.get(f"/receipts/?limit=2&cursor={cursor}", headers=headers)
+    cursor = second_page.headers["X-Next-Cursor"]
+    last_page = test_client.get(f"/receipts/?limit=2&cursor={cursor}", headers=headers)
+
+    page_ids = [receipt["id"] for page in (first_page, second_page, last_page)
+                for receipt in page.json()]
+    assert page_ids == created_ids
+    assert "X-Next-Cursor" not in last_page.headers
+
+
+def test_receipts_list_cursor_with_filters(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    create_receipt(user_payload, test_client, receipt_payload)
+    receipt_payload["payment"]["type"] = "cashless"
+    cashless_ids = [
+        create_receipt(user_payload, test_client, receipt_payload).json()["id"] for _ in range(2)
+    ]
+
+    first_page = test_client.get("/receipts/?limit=1&type=cashless", headers=headers)
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = test_client.get(
+        f"/receipts/?limit=1&type=cashless&cursor={cursor}", headers=headers
+    )
+
+    assert [first_page.json()[0]["id"], second_page.json()[0]["id"]] == cashless_ids
+
+
+def test_receipts_list_invalid_cursor(test_client, db_session, user_payload):
+    token = get_jwt(user_payload, test_client)
+    response = test_client.get(
+        "/receipts/?cursor=not-a-cursor", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_create_receipt_statement_count_is_flat(
+    test_client, db_session, user_payload, receipt_payload, query_counter
+):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    # The first receipt also adds its product names to the catalog.
+    test_client.post("/receipts/", headers=headers, json=receipt_payload)
+
+    query_counter.clear()
+    test_client.post("/receipts/", headers=headers, json=receipt_payload)
+    small_basket_statements = len(query_counter)
+
+    receipt_payload["products"] = receipt_payload["products"] * 5
+    query_counter.clear()
+    response = test_client.post("/receipts/", headers=headers, json=receipt_payload)
+
+    assert response.status_code == 200
+    assert len(response.json()["products"]) == 10
+    assert len(query_counter) == small_basket_statements
+
+
+def test_create_receipt_insufficient_payment_writes_nothing(
+    test_client, db_session, user_payload, receipt_payload
+):
+    receipt_payload["payment"]["amount"] = 1.0
+    response = create_receipt(user_payload, test_client, receipt_payload)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient payment: required 21.0, but received 1.0"
+    assert db_session.query(Receipt).count() == 0
+    assert db_session.query(Product).count() == 0
+
+
+def test_create_receipts_bulk(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    underpaid_payload = {**receipt_payload, "payment": {"type": "cash", "amount": 1.0}}
+
+    response = test_client.post(
+        "/receipts/bulk",
+        headers={"Authorization": f"Bearer {token}"},
+        json=[receipt_payload, underpaid_payload, receipt_payload]
+    )
+
+    results = response.json()
+    assert response.status_code == 200
+    assert [result["status"] for result in results] == ["created", "failed", "created"]
+    assert results[1]["detail"] == "Insufficient payment: required 21.0, but received 1.0"
+    assert db_session.query(Receipt).count() == 2
+    assert db_session.query(Product).filter(
+        Product.receipt_id == results[2]["id"]
+    ).count() == len(receipt_payload["products"])
+
+
+def test_create_receipts_bulk_commits_in_chunks(
+    test_client, db_session, user_payload, receipt_payload, monkeypatch
+):
+    monkeypatch.setattr("app.receipts.crud.BULK_CHUNK_SIZE", 2)
+    token = get_jwt(user_payload, test_client)
+
+    response = test_client.post(
+        "/receipts/bulk",
+        headers={"Authorization": f"Bearer {token}"},
+        json=[receipt_payload] * 5
+    )
+
+    ids = [result["id"] for result in response.json()]
+    assert len(set(ids)) == 5
+    assert db_session.query(Receipt).count() == 5
+
+
+def test_get_receipt_is_served_from_cache(
+    test_client, db_session, user_payload, receipt_payload, receipt_cache, query_counter
+):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    receipt_id = create_receipt(user_payload, test_client, receipt_payload).json()["id"]
+
+    first_response = test_client.get(f"/receipts/{receipt_id}", headers=headers)
+    query_counter.clear()
+    second_response = test_client.get(f"/receipts/{receipt_id}", headers=headers)
+
+    assert second_response.json() == first_response.json()
+    assert query_counter == []
+    assert (receipt_cache.hits, receipt_cache.misses) == (1, 1)
+    assert receipt_cache.hit_ratio == 0.5
+
+
+def test_get_receipt_text_is_cached_per_width(
+    test_client, db_session, user_payload, receipt_payload, receipt_cache
+):
+    receipt_id = create_receipt(user_payload, test_client, receipt_payload).json()["id"]
+
+    narrow = test_client.get(f"/receipts/receipt-txt/{receipt_id}")
+    wide = test_client.get(f"/receipts/receipt-txt/{receipt_id}?chars_per_line=40")
+    cached_wide = test_client.get(f"/receipts/receipt-txt/{receipt_id}?chars_per_line=40")
+
+    assert narrow.text != wide.text
+    assert cached_wide.text == wide.text
+    assert cached_wide.headers["content-type"] == "text/plain; charset=utf-8"
+    assert {key for key in receipt_cache.backend.values if ":txt:" in key} == {
+        f"receipt:{receipt_id}:txt:32", f"receipt:{receipt_id}:txt:40"
+    }
+    assert (receipt_cache.hits, receipt_cache.misses) == (1, 2)
+
+
+def test_get_receipt_conditional_request(
+    test_client, db_session, user_payload, receipt_payload, receipt_cache, query_counter
+):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    receipt_id = create_receipt(user_payload, test_client, receipt_payload).json()["id"]
+
+    response = test_client.get(f"/receipts/{receipt_id}", headers=headers)
+    etag = response.headers["ETag"]
+    assert "immutable" in response.headers["Cache-Control"]
+
+    query_counter.clear()
+    receipt_cache.backend.values.clear()
+    response = test_client.get(
+        f"/receipts/{receipt_id}", headers={**headers, "If-None-Match": etag}
+    )
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert len(query_counter) == 1
+    assert "products" not in query_counter[0]
+
+
+def test_get_receipt_text_etag_depends_on_width(
+    test_client, db_session, user_payload, receipt_payload
+):
+    receipt_id = create_receipt(user_payload, test_client, receipt_payload).json()["id"]
+    etag = test_client.get(f"/receipts/receipt-txt/{receipt_id}").headers["ETag"]
+
+    same_width = test_client.get(
+        f"/receipts/receipt-txt/{receipt_id}", headers={"If-None-Match": etag}
+    )
+    other_width = test_client.get(
+        f"/receipts/receipt-txt/{receipt_id}?chars_per_line=40", headers={"If-None-Match": etag}
+    )
+
+    assert same_width.status_code == 304
+    assert other_width.status_code == 200
+    assert other_width.headers["ETag"] != etag
+
+
+def test_receipts_list_weak_etag(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    create_receipt(user_payload, test_client, receipt_payload)
+
+    etag = test_client.get("/receipts/", headers=headers).headers["ETag"]
+    unchanged = test_client.get("/receipts/", headers={**headers, "If-None-Match": etag})
+    create_receipt(user_payload, test_client, receipt_payload)
+    changed = test_client.get("/receipts/", headers={**headers, "If-None-Match": etag})
+
+    assert etag.startswith('W/"')
+    assert unchanged.status_code == 304
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+
+
+def test_receipt_response_shape(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    receipt_id = create_receipt(user_payload, test_client, receipt_payload).json()["id"]
+
+    response = test_client.get(
+        f"/receipts/{receipt_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    receipt = db_session.get(Receipt, receipt_id)
+
+    assert response.json() == receipt.to_dict()
+
+
+def test_export_receipts_ndjson(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    create_receipt(user_payload, test_client, receipt_payload)
+    receipt_payload["payment"]["type"] = "cashless"
+    create_receipt(user_payload, test_client, receipt_payload)
+
+    response = test_client.get(
+        "/receipts/export?type=cashless", headers={"Authorization": f"Bearer {token}"}
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    receipt = db_session.get(Receipt, lines[0]["id"])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert lines == [receipt.to_dict()]
+
+
+def test_export_receipts_csv(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    for _ in range(2):
+        create_receipt(user_payload, test_client, receipt_payload)
+
+    response = test_client.get(
+        "/receipts/export?format=csv", headers={"Authorization": f"Bearer {token}"}
+    )
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert len(rows) == 2 * len(receipt_payload["products"])
+    assert [row["product_name"] for row in rows] == ["Apple", "Banana"] * 2
+    assert rows[0]["receipt_id"] == rows[1]["receipt_id"] != rows[2]["receipt_id"]
+
+
+def test_filter_receipts_by_product_name(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    names = ["Banana", "Green banana", "Apple", "50%_off"]
+    for name in names:
+        receipt_payload["products"] = [{"name": name, "price": 1.0, "quantity": 1}]
+        create_receipt(user_payload, test_client, receipt_payload)
+
+    def search(**params):
+        response = test_client.get(
+            "/receipts/", headers={"Authorization": f"Bearer {token}"}, params=params
+        )
+        return [receipt["products"][0]["name"] for receipt in response.json()]
+
+    assert search(product_name="BANANA") == ["Banana", "Green banana"]
+    assert search(product_name__prefix="ban") == ["Banana"]
+    assert search(product_name="%_") == ["50%_off"]
+    assert search(product_name="an", type="cashless") == []
+
+
+def test_product_name_filter_uses_text_index(db_session):
+    query = ReceiptFilter(product_name="banana").filter(select(Receipt.id))
+    sql = str(query.compile(db_session.bind, compile_kwargs={"literal_binds": True}))
+
+    plan = [row[3] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+    assert any("product_catalog_fts VIRTUAL TABLE INDEX 0:L" in step for step in plan)
+    assert not any(step.startswith("SCAN products") for step in plan)
+
+
+def test_receipt_rows_match_orm_receipts(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    test_client.post("/receipts/bulk", headers={"Authorization": f"Bearer {token}"}, json=[
+        receipt_payload,
+        {**receipt_payload, "payment": {"type": "cashless", "amount": 21.0}},
+        {**receipt_payload, "products": [{"name": "Cherry", "price": 2.0, "quantity": 1}]},
+        {**receipt_payload, "products": []},
+    ])
+    user = db_session.query(User).one()
+    user = Principal(id=user.id, login=user.login, username=user.username)
+
+    async def read_pages(read_page, filters):
+        async with TestingAsyncSessionLocal() as db:
+            first, cursor = await read_page(db, user, filters, 2, 0)
+            rest, _ = await read_page(db, user, filters, 10, 0, cursor)
+            return [receipt.to_dict() for receipt in first + rest], cursor
+
+    for filters in [
+        ReceiptFilter(), ReceiptFilter(type="cashless"), ReceiptFilter(total__lt=10.0),
+        ReceiptFilter(product_name="cherry"),
+    ]:
+        expected = asyncio.run(read_pages(get_receipts, filters))
+        assert asyncio.run(read_pages(get_receipt_rows, filters)) == expected
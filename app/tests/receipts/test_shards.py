@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.common.database import Base, ShardRouter, get_async_database_url, get_shard_router
+from app.main import app
+from app.products.flusher import ProductSketchFlusher
+from app.products.sketch import product_sketches
+from app.receipts.model import Receipt
+from app.products.model import ProductSketch
+from app.receipts import rebalance as rebalance_module
+from app.receipts.rebalance import move_user, rebalance
+from app.tests.conftest import TestingAsyncSessionLocal
+from app.tests.test_helpers import get_jwt
+from app.users.model import User
+
+
+def create_shard(path):
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    return async_sessionmaker(
+        autoflush=False, expire_on_commit=False,
+        bind=create_async_engine(get_async_database_url(url), poolclass=NullPool)
+    )
+
+
+@pytest.fixture
+def shard_factories(tmp_path):
+    # The test database doubles as the first shard, like DATABASE_URL does by default.
+    return [TestingAsyncSessionLocal] + [
+        create_shard(tmp_path / f"shard{shard}.db") for shard in (1, 2)
+    ]
+
+
+def use_shards(router, rebalanced=True):
+    if rebalanced:
+        asyncio.run(rebalance(router))
+    app.dependency_overrides[get_shard_router] = lambda: router
+
+
+def sign_up(test_client, db_session, count):
+    users = []
+    for index in range(count):
+        payload = {"login": f"user{index}", "username": f"User {index}", "password": "secret"}
+        token = get_jwt(payload, test_client)
+        user_id = db_session.scalar(select(User.id).where(User.login == payload["login"]))
+        users.append(({"Authorization": f"Bearer {token}"}, user_id))
+    return users
+
+
+def count_receipts(factory):
+    async def count():
+        async with factory() as db:
+            return await db.scalar(select(func.count(Receipt.id)))
+    return asyncio.run(count())
+
+
+def create_receipts(test_client, headers, receipt_payload, count):
+    return [
+        test_client.post("/receipts/", headers=headers, json=receipt_payload).json()["id"]
+        for _ in range(count)
+    ]
+
+
+def test_receipts_are_written_to_the_shard_of_their_user(
+    test_client, db_session, shard_factories, receipt_payload
+):
+    router = ShardRouter(shard_factories)
+    use_shards(router)
+    users = sign_up(test_client, db_session, 6)
+
+    for headers, user_id in users:
+        receipt_id = create_receipts(test_client, headers, receipt_payload, 1)[0]
+
+        listed = test_client.get("/receipts/", headers=headers).json()
+        by_id = test_client.get(f"/receipts/{receipt_id}", headers=headers)
+        text = test_client.get(f"/receipts/receipt-txt/{receipt_id}")
+
+        assert [receipt["id"] for receipt in listed] == [receipt_id]
+        assert by_id.status_code == 200
+        assert text.status_code == 200
+        assert "Apple" in text.text
+        assert router.shard_for_receipt(receipt_id) == router.shard_for_user(user_id)
+
+    assert len({router.shard_for_user(user_id) for _, user_id in users}) > 1
+    assert sum(count_receipts(factory) for factory in shard_factories) == len(users)
+
+
+def test_new_shards_use_their_id_range_before_rebalancing(
+    test_client, db_session, shard_factories, receipt_payload
+):
+    router = ShardRouter(shard_factories)
+    use_shards(router, rebalanced=False)
+    users = sign_up(test_client, db_session, 6)
+
+    receipt_ids = []
+    for headers, user_id in users:
+        receipt_id = create_receipts(test_client, headers, receipt_payload, 1)[0]
+        receipt_ids.append(receipt_id)
+
+        assert router.shard_for_receipt(receipt_id) == router.shard_for_user(user_id)
+
+    assert len(set(receipt_ids)) == len(users)
+
+
+def test_rebalance_moves_users_to_new_shards(
+    test_client, db_session, shard_factories, receipt_payload
+):
+    use_shards(ShardRouter(shard_factories[:1]))
+    users = sign_up(test_client, db_session, 6)
+    created = {
+        headers["Authorization"]: create_receipts(test_client, headers, receipt_payload, 3)
+        for headers, _ in users
+    }
+    assert count_receipts(shard_factories[0]) == 18
+
+    router = ShardRouter(shard_factories)
+    use_shards(router)
+
+    assert sum(count_receipts(factory) for factory in shard_factories) == 18
+    assert count_receipts(shard_factories[0]) < 18
+    for headers, user_id in users:
+        receipt_ids = created[headers["Authorization"]]
+        listed = test_client.get("/receipts/", headers=headers).json()
+        stats = test_client.get("/users/me/stats", headers=headers).json()
+        asyncio.run(ProductSketchFlusher(product_sketches, router).flush())
+        top = test_client.get("/products/top", headers=headers).json()
+        # Receipts keep their IDs, which still name the first shard.
+        by_id = test_client.get(f"/receipts/{receipt_ids[0]}", headers=headers)
+        new_id = create_receipts(test_client, headers, receipt_payload, 1)[0]
+
+        assert sorted(receipt["id"] for receipt in listed) == sorted(receipt_ids)
+        assert stats["receipts"] == 3
+        assert top["products"][0]["name"] == "Apple"
+        assert by_id.status_code == 200
+        assert by_id.json()["id"] == receipt_ids[0]
+        assert router.shard_for_receipt(new_id) == router.shard_for_user(user_id)
+
+
+def test_interrupted_move_keeps_product_summaries(
+    test_client, db_session, shard_factories, receipt_payload, monkeypatch
+):
+    router = ShardRouter(shard_factories[:2])
+    use_shards(ShardRouter(shard_factories[:1]))
+    headers, user_id = sign_up(test_client, db_session, 1)[0]
+    create_receipts(test_client, headers, receipt_payload, 3)
+    write_receipts = rebalance_module.write_receipts
+    batches = []
+
+    async def interrupted_write_receipts(db, receipts):
+        batches.append(receipts)
+        if len(batches) == 2:
+            raise RuntimeError("connection lost")
+        return await write_receipts(db, receipts)
+
+    monkeypatch.setattr(rebalance_module, "write_receipts", interrupted_write_receipts)
+    with pytest.raises(RuntimeError):
+        asyncio.run(move_user(router, user_id, 0, 1, batch_size=1))
+    monkeypatch.setattr(rebalance_module, "write_receipts", write_receipts)
+    asyncio.run(move_user(router, user_id, 0, 1, batch_size=1))
+
+    async def apples_sold():
+        async with shard_factories[1]() as db:
+            counters = await db.scalars(select(ProductSketch.counters).where(
+                ProductSketch.user_id == user_id, ProductSketch.metric == "quantity"
+            ))
+            return sum(counter["Apple"][0] for counter in counters)
+
+    assert count_receipts(shard_factories[1]) == 3
+    assert asyncio.run(apples_sold()) == 30
@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.receipts.crud import write_receipts
+from app.receipts.model import ReceiptDailyRollup
+from app.tests.conftest import TestingAsyncSessionLocal
+from app.tests.test_helpers import create_receipt, get_jwt
+from app.users.model import User
+
+RECEIPTS = [
+    ("2025-03-01T10:15:00", "cash", 10.0, 20.0),
+    ("2025-03-01T10:45:00", "cashless", 5.0, 5.0),
+    ("2025-03-01T11:30:00", "cash", 7.0, 10.0),
+    ("2025-03-02T09:00:00", "cash", 3.0, 3.0),
+]
+
+
+@pytest.fixture
+def stats_headers(test_client, db_session, user_payload):
+    token = get_jwt(user_payload, test_client)
+    user_id = db_session.query(User).one().id
+    receipts = [
+        ({
+            'user_id': user_id, 'type': payment_type, 'total': total, 'amount': amount,
+            'rest': amount - total, 'created_at': datetime.fromisoformat(created_at),
+        }, [])
+        for created_at, payment_type, total, amount in RECEIPTS
+    ]
+
+    async def seed():
+        async with TestingAsyncSessionLocal() as db:
+            await write_receipts(db, receipts)
+            await db.commit()
+
+    asyncio.run(seed())
+    return {"Authorization": f"Bearer {token}"}
+
+
+def get_stats(test_client, headers, **params):
+    response = test_client.get("/receipts/stats", headers=headers, params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_stats_by_day(test_client, stats_headers):
+    assert get_stats(test_client, stats_headers) == [
+        {"day": "2025-03-01", "receipts": 3, "total": 22.0, "amount": 35.0},
+        {"day": "2025-03-02", "receipts": 1, "total": 3.0, "amount": 3.0},
+    ]
+
+
+def test_stats_by_hour_with_partial_hours(test_client, stats_headers):
+    stats = get_stats(
+        test_client, stats_headers, group_by="hour",
+        **{"from": "2025-03-01T10:30:00", "to": "2025-03-01T11:45:00"}
+    )
+
+    assert stats == [
+        {"hour": "2025-03-01T10:00:00", "receipts": 1, "total": 5.0, "amount": 5.0},
+        {"hour": "2025-03-01T11:00:00", "receipts": 1, "total": 7.0, "amount": 10.0},
+    ]
+
+
+def test_stats_by_type_over_range(test_client, stats_headers):
+    stats = get_stats(
+        test_client, stats_headers, group_by="type",
+        **{"from": "2025-03-01T10:30:00", "to": "2025-03-03T00:00:00"}
+    )
+
+    assert stats == [
+        {"type": "cash", "receipts": 2, "total": 10.0, "amount": 13.0},
+        {"type": "cashless", "receipts": 1, "total": 5.0, "amount": 5.0},
+    ]
+
+
+def test_stats_within_one_hour(test_client, stats_headers):
+    stats = get_stats(
+        test_client, stats_headers, **{"from": "2025-03-01T10:10:00", "to": "2025-03-01T10:20:00"}
+    )
+
+    assert stats == [{"day": "2025-03-01", "receipts": 1, "total": 10.0, "amount": 20.0}]
+
+
+def test_stats_with_timezone_bounds(test_client, stats_headers):
+    stats = get_stats(
+        test_client, stats_headers, group_by="hour",
+        **{"from": "2025-03-01T12:30:00+02:00", "to": "2025-03-01T11:45:00Z"}
+    )
+
+    assert stats == [
+        {"hour": "2025-03-01T10:00:00", "receipts": 1, "total": 5.0, "amount": 5.0},
+        {"hour": "2025-03-01T11:00:00", "receipts": 1, "total": 7.0, "amount": 10.0},
+    ]
+
+
+def test_stats_with_empty_range(test_client, stats_headers):
+    response = test_client.get("/receipts/stats", headers=stats_headers, params={
+        "from": "2025-01-02T00:00:00Z", "to": "2025-01-02T00:00:00"
+    })
+
+    assert response.status_code == 400
+
+
+def test_rollups_follow_created_receipts(
+    test_client, db_session, user_payload, receipt_payload
+):
+    token = get_jwt(user_payload, test_client)
+    for _ in range(2):
+        create_receipt(user_payload, test_client, receipt_payload)
+    test_client.post(
+        "/receipts/bulk", headers={"Authorization": f"Bearer {token}"},
+        json=[receipt_payload] * 3
+    )
+
+    rollups = db_session.query(ReceiptDailyRollup).all()
+
+    assert sum(rollup.receipts for rollup in rollups) == 5
+    assert sum(rollup.total for rollup in rollups) == 5 * 21.0
+    assert {rollup.type for rollup in rollups} == {"cash"}
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from app.products.sketch import product_sketches
+from app.receipts.crud import create_receipt, prepare_receipt
+from app.receipts.model import Receipt
+from app.receipts.schemas import ReceiptCreateSchema
+from app.receipts.writer import ReceiptWriter, get_receipt_writer
+from app.main import app
+from app.tests.conftest import TestingAsyncSessionLocal, async_engine
+from app.tests.test_helpers import create_receipt as post_receipt
+from app.tests.test_helpers import get_jwt
+from app.users.model import User
+from app.users.schemas import Principal
+
+
+@pytest.fixture
+def user(test_client, db_session, user_payload):
+    get_jwt(user_payload, test_client)
+    user = db_session.query(User).one()
+    return Principal(id=user.id, login=user.login, username=user.username)
+
+
+@pytest.fixture
+def commit_counter(monkeypatch):
+    # Product sketches are flushed in transactions of their own.
+    monkeypatch.setattr(product_sketches, "flush_interval", float("inf"))
+    commits = []
+
+    def count_commit(conn):
+        commits.append(conn)
+
+    event.listen(async_engine.sync_engine, "commit", count_commit)
+    yield commits
+    event.remove(async_engine.sync_engine, "commit", count_commit)
+
+
+def test_concurrent_receipts_share_a_commit(db_session, user, receipt_payload, commit_counter):
+    writer = ReceiptWriter(TestingAsyncSessionLocal, window=0.05, max_size=100)
+    receipt_data = ReceiptCreateSchema(**receipt_payload)
+
+    async def create_concurrently():
+        try:
+            return await asyncio.gather(*[
+                create_receipt(None, user, receipt_data, writer) for _ in range(10)
+            ])
+        finally:
+            await writer.stop()
+
+    commit_counter.clear()
+    receipts = asyncio.run(create_concurrently())
+
+    assert len(commit_counter) == 1
+    assert len({receipt.id for receipt in receipts}) == 10
+    assert db_session.query(Receipt).count() == 10
+    assert all(len(receipt.products) == 2 for receipt in receipts)
+
+
+def test_batch_is_written_when_full(db_session, user, receipt_payload, commit_counter):
+    writer = ReceiptWriter(TestingAsyncSessionLocal, window=60, max_size=4)
+    receipt_data = ReceiptCreateSchema(**receipt_payload)
+
+    async def create_concurrently():
+        try:
+            return await asyncio.wait_for(asyncio.gather(*[
+                create_receipt(None, user, receipt_data, writer) for _ in range(8)
+            ]), timeout=10)
+        finally:
+            await writer.stop()
+
+    commit_counter.clear()
+    asyncio.run(create_concurrently())
+
+    assert len(commit_counter) == 2
+
+
+def test_failed_receipt_does_not_fail_its_batch(db_session, user, receipt_payload):
+    writer = ReceiptWriter(TestingAsyncSessionLocal, window=0.05, max_size=100)
+    valid = prepare_receipt(ReceiptCreateSchema(**receipt_payload))
+    invalid = prepare_receipt(ReceiptCreateSchema(**receipt_payload))
+    for receipt_values, _ in (valid, invalid):
+        receipt_values['user_id'] = user.id
+    # Catalog names can't be NULL, so this receipt can't be written.
+    invalid[1][0]['name'] = None
+
+    async def submit_concurrently():
+        try:
+            return await asyncio.gather(
+                writer.submit(valid), writer.submit(invalid), writer.submit(valid),
+                return_exceptions=True
+            )
+        finally:
+            await writer.stop()
+
+    first, failed, second = asyncio.run(submit_concurrently())
+
+    assert isinstance(failed, Exception)
+    assert {first, second} == {receipt.id for receipt in db_session.query(Receipt)}
+
+
+def test_create_receipt_endpoint_with_group_commit(
+    test_client, db_session, user_payload, receipt_payload
+):
+    writer = ReceiptWriter(TestingAsyncSessionLocal, window=0.001, max_size=100)
+    app.dependency_overrides[get_receipt_writer] = lambda: writer
+    try:
+        response = post_receipt(user_payload, test_client, receipt_payload)
+    finally:
+        del app.dependency_overrides[get_receipt_writer]
+
+    assert response.status_code == 200
+    assert db_session.get(Receipt, response.json()["id"]).total == 21.0
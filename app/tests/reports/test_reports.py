@@ -0,0 +1,154 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from app.receipts.model import Receipt
+from app.reports import jobs
+from app.reports.model import ReportJob
+from app.tests.conftest import TestingAsyncSessionLocal, TestingSessionLocal, test_shard_router
+from app.tests.test_helpers import create_receipt, get_jwt
+
+
+@pytest.fixture(autouse=True)
+def reports_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "REPORTS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def run_worker():
+    job_id = jobs.claim_next_job(TestingSessionLocal)
+    asyncio.run(jobs.run_report_job(job_id, TestingAsyncSessionLocal, test_shard_router))
+    return job_id
+
+
+def request_report(test_client, token, payload, query=""):
+    return test_client.post(
+        f"/receipts/reports{query}", headers={"Authorization": f"Bearer {token}"}, json=payload
+    )
+
+
+def download(test_client, token, job_id, **headers):
+    return test_client.get(
+        f"/receipts/reports/{job_id}/download",
+        headers={"Authorization": f"Bearer {token}", **headers}
+    )
+
+
+def test_export_report(test_client, db_session, user_payload, receipt_payload, monkeypatch):
+    monkeypatch.setattr(jobs, "REPORT_CHUNK_SIZE", 2)
+    token = get_jwt(user_payload, test_client)
+    for _ in range(3):
+        create_receipt(user_payload, test_client, receipt_payload)
+
+    response = request_report(test_client, token, {"format": "ndjson"})
+    assert response.status_code == 202
+    assert response.json()["status"] == "pending"
+
+    job_id = run_worker()
+    status = test_client.get(
+        f"/receipts/reports/{job_id}", headers={"Authorization": f"Bearer {token}"}
+    ).json()
+    response = download(test_client, token, job_id)
+    lines = [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+    receipts = db_session.query(Receipt).order_by(Receipt.id).all()
+
+    assert status["status"] == "done"
+    assert status["processed"] == status["total"] == 3
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert lines == [receipt.to_dict() for receipt in receipts]
+
+
+def test_report_download_supports_ranges(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    create_receipt(user_payload, test_client, receipt_payload)
+    request_report(test_client, token, {"format": "csv"})
+    job_id = run_worker()
+
+    full = download(test_client, token, job_id).content
+    response = download(test_client, token, job_id, Range="bytes=10-")
+
+    assert response.status_code == 206
+    assert response.content == full[10:]
+
+
+def test_report_daily_totals(test_client, db_session, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    for _ in range(2):
+        create_receipt(user_payload, test_client, receipt_payload)
+    receipt_payload["payment"]["type"] = "cashless"
+    create_receipt(user_payload, test_client, receipt_payload)
+
+    request_report(test_client, token, {"kind": "daily_totals", "format": "csv"}, "?type=cash")
+    job_id = run_worker()
+    rows = list(csv.DictReader(io.StringIO(
+        gzip.decompress(download(test_client, token, job_id).content).decode()
+    )))
+    day = db_session.query(Receipt).first().created_at.date().isoformat()
+
+    assert rows == [
+        {"day": day, "payment_type": "cash", "receipts": "2", "total": "42.0", "amount": "400.0"}
+    ]
+
+
+def test_report_not_ready(test_client, db_session, user_payload):
+    token = get_jwt(user_payload, test_client)
+    job_id = request_report(test_client, token, {}).json()["id"]
+
+    assert download(test_client, token, job_id).status_code == 409
+
+
+def test_report_of_another_user(test_client, db_session, user_payload):
+    token = get_jwt(user_payload, test_client)
+    job_id = request_report(test_client, token, {}).json()["id"]
+    other_token = get_jwt({**user_payload, "login": "other_login"}, test_client)
+
+    response = test_client.get(
+        f"/receipts/reports/{job_id}", headers={"Authorization": f"Bearer {other_token}"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_interrupted_report_resumes(
+    test_client, db_session, user_payload, receipt_payload, monkeypatch
+):
+    monkeypatch.setattr(jobs, "REPORT_CHUNK_SIZE", 1)
+    token = get_jwt(user_payload, test_client)
+    for _ in range(3):
+        create_receipt(user_payload, test_client, receipt_payload)
+    job_id = request_report(test_client, token, {"format": "csv"}).json()["id"]
+
+    export_chunk = jobs.export_chunk
+    calls = []
+
+    async def interrupted_chunk(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise SystemExit
+        return await export_chunk(*args)
+
+    monkeypatch.setitem(jobs.REPORT_KINDS, "export", interrupted_chunk)
+    with pytest.raises(SystemExit):
+        run_worker()
+    job = db_session.get(ReportJob, job_id)
+    # A chunk written after the last recorded one must be discarded on resume.
+    with open(jobs.report_path(job), "ab") as file:
+        file.write(gzip.compress(b"partial chunk\r\n"))
+
+    assert job.status == "running"
+    assert job.processed == 1
+    assert jobs.requeue_interrupted_jobs(TestingSessionLocal) == 1
+
+    run_worker()
+    rows = list(csv.DictReader(io.StringIO(
+        gzip.decompress(download(test_client, token, job_id).content).decode()
+    )))
+    receipt_ids = [receipt.id for receipt in db_session.query(Receipt).order_by(Receipt.id)]
+
+    assert [int(row["receipt_id"]) for row in rows[::2]] == receipt_ids
+    assert len(rows) == 3 * len(receipt_payload["products"])
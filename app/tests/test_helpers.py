@@ -1,3 +1,24 @@
+from app.common.cache import CacheBackend
+
+
+class FakeCacheBackend(CacheBackend):
+    """
+    Stands in for an external key-value store and records every call.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.calls = []
+
+    async def get(self, key):
+        self.calls.append(("get", key))
+        return self.values.get(key)
+
+    async def set(self, key, value):
+        self.calls.append(("set", key))
+        self.values[key] = value
+
+
 def signup_request(user_payload, test_client):
     return test_client.post("users/sign-up/", json=user_payload)
 
@@ -1,6 +1,18 @@
-from app.common.auth_utils import decode_token
+import asyncio
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app.common.auth_utils import (BCRYPT_ROUNDS, PasswordHasher, create_token, decode_token,
+                                   get_password_hash, pwd_context, revoked_token_cache)
+from app import main
+from app.products.flusher import product_sketch_flusher
+from app.tests.conftest import test_shard_router
 from app.tests.test_helpers import login_request, signup_request
-from app.users.model import User
+from app.users import crud
+from app.users.model import RevokedToken, User
 
 
 def test_registration(test_client, db_session, user_payload):
@@ -29,3 +41,135 @@ def test_wrong_authorization_credentials(test_client, db_session, user_payload):
     response = login_request({'login': 'wronglogin', 'password': 'wrongpasswd'}, test_client)
     assert response.status_code == 400
     assert response.json()['detail'] == "User doesn't exist"
+
+
+def test_token_carries_user_claims(test_client, db_session, user_payload):
+    signup_request(user_payload, test_client)
+    response = login_request(user_payload, test_client)
+    payload = decode_token(response.json()['token'])
+    user = db_session.query(User).filter_by(login=user_payload['login']).first()
+    assert payload['uid'] == user.id
+    assert payload['username'] == user_payload['username']
+
+
+def test_authenticated_request_does_not_query_users(
+    test_client, db_session, user_payload, query_counter
+):
+    signup_request(user_payload, test_client)
+    token = login_request(user_payload, test_client).json()['token']
+
+    query_counter.clear()
+    response = test_client.get("/receipts/", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert not [statement for statement in query_counter if 'FROM users' in statement]
+
+
+def test_token_without_user_id_claim(test_client, db_session, user_payload):
+    signup_request(user_payload, test_client)
+    token = create_token(data={"sub": user_payload['login']})
+    response = test_client.get("/receipts/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+
+def test_token_of_unknown_user(test_client, db_session):
+    token = create_token(data={"sub": "unknown"})
+    response = test_client.get("/receipts/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+
+def test_login_rehashes_outdated_password_hash(test_client, db_session, user_payload):
+    signup_request(user_payload, test_client)
+    user = db_session.query(User).filter_by(login=user_payload['login']).first()
+    user.password = pwd_context.hash(user_payload['password'], rounds=4)
+    db_session.commit()
+
+    response = login_request(user_payload, test_client)
+
+    db_session.refresh(user)
+    assert response.status_code == 200
+    assert user.password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert pwd_context.verify(user_payload['password'], user.password)
+
+
+def test_password_hasher_rejects_when_busy():
+    hasher = PasswordHasher(workers=1, queue_timeout=0.01)
+
+    async def hash_while_busy():
+        await hasher._get_semaphore().acquire()
+        with pytest.raises(HTTPException) as exc_info:
+            await hasher.run(get_password_hash, "testpassword")
+        return exc_info.value
+
+    exc = asyncio.run(hash_while_busy())
+    assert exc.status_code == 503
+    assert exc.headers["Retry-After"] == "1"
+
+
+def test_shutdown_stops_password_hash_workers(monkeypatch):
+    hasher = PasswordHasher(workers=1, queue_timeout=1)
+    monkeypatch.setattr(main, "password_hasher", hasher)
+    monkeypatch.setattr(product_sketch_flusher, "shards", test_shard_router)
+    hasher._get_executor()
+
+    with TestClient(main.app):
+        pass
+
+    assert hasher._executor is None
+
+
+def refresh_request(refresh_token, test_client):
+    return test_client.post("users/refresh/", json={"refresh_token": refresh_token})
+
+
+def test_refresh_token_issues_new_tokens(test_client, db_session, user_payload):
+    signup_request(user_payload, test_client)
+    tokens = login_request(user_payload, test_client).json()
+
+    response = refresh_request(tokens['refresh_token'], test_client)
+
+    assert response.status_code == 200
+    assert decode_token(response.json()['token'])['sub'] == user_payload['login']
+    assert response.json()['refresh_token'] != tokens['refresh_token']
+    assert test_client.get(
+        "/receipts/", headers={"Authorization": f"Bearer {response.json()['token']}"}
+    ).status_code == 200
+
+
+def test_refresh_token_is_single_use(test_client, db_session, user_payload):
+    signup_request(user_payload, test_client)
+    refresh_token = login_request(user_payload, test_client).json()['refresh_token']
+    refresh_request(refresh_token, test_client)
+
+    response = refresh_request(refresh_token, test_client)
+    assert response.status_code == 401
+
+    revoked_token_cache.clear()
+    response = refresh_request(refresh_token, test_client)
+    assert response.status_code == 401
+    assert db_session.query(RevokedToken).count() == 1
+
+
+def test_refresh_purges_expired_revoked_tokens(
+    test_client, db_session, user_payload, monkeypatch
+):
+    signup_request(user_payload, test_client)
+    user = db_session.query(User).one()
+    db_session.add(RevokedToken(jti="expired", user_id=user.id, expires_at=datetime(2020, 1, 1)))
+    db_session.commit()
+    refresh_token = login_request(user_payload, test_client).json()['refresh_token']
+    monkeypatch.setattr(crud, "_revoked_tokens_purged_at", None)
+
+    assert refresh_request(refresh_token, test_client).status_code == 200
+    db_session.expire_all()
+    assert db_session.query(RevokedToken.jti).all() == [(decode_token(refresh_token)['jti'],)]
+
+
+def test_access_and_refresh_tokens_are_not_interchangeable(test_client, db_session, user_payload):
+    signup_request(user_payload, test_client)
+    tokens = login_request(user_payload, test_client).json()
+
+    assert refresh_request(tokens['token'], test_client).status_code == 401
+    assert test_client.get(
+        "/receipts/", headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+    ).status_code == 401
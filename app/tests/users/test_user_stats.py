@@ -0,0 +1,70 @@
+from app.tests.conftest import TestingSessionLocal, test_shard_router
+from app.tests.test_helpers import create_receipt, get_jwt
+from app.users.backfill_stats import recompute_shard_user_stats, recompute_user_stats
+from app.users.model import User, UserStats
+
+
+def get_my_stats(test_client, token):
+    response = test_client.get("/users/me/stats", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def create_receipts(test_client, user_payload, receipt_payload):
+    token = get_jwt(user_payload, test_client)
+    create_receipt(user_payload, test_client, receipt_payload)
+    test_client.post(
+        "/receipts/bulk", headers={"Authorization": f"Bearer {token}"},
+        json=[{**receipt_payload, "payment": {"type": "cashless", "amount": 21.0}}] * 2
+    )
+    return token
+
+
+def test_my_stats(test_client, db_session, user_payload, receipt_payload, query_counter):
+    token = create_receipts(test_client, user_payload, receipt_payload)
+
+    query_counter.clear()
+    stats = get_my_stats(test_client, token)
+
+    assert stats == {
+        "receipts": 3, "total": 63.0,
+        "cash_receipts": 1, "cash_total": 21.0,
+        "cashless_receipts": 2, "cashless_total": 42.0,
+    }
+    assert len(query_counter) == 1
+
+
+def test_my_stats_without_receipts(test_client, db_session, user_payload):
+    token = get_jwt(user_payload, test_client)
+
+    assert get_my_stats(test_client, token)["receipts"] == 0
+
+
+def test_recompute_user_stats(test_client, db_session, user_payload, receipt_payload):
+    token = create_receipts(test_client, user_payload, receipt_payload)
+    get_jwt({**user_payload, "login": "other_login"}, test_client)
+    expected = get_my_stats(test_client, token)
+    db_session.query(UserStats).update({"receipts": 100, "cash_total": 0})
+    db_session.commit()
+
+    assert recompute_user_stats(TestingSessionLocal, batch_size=1) == 2
+    assert get_my_stats(test_client, token) == expected
+    other_user = db_session.query(User).filter_by(login="other_login").one()
+    db_session.expire_all()
+    assert db_session.get(UserStats, other_user.id).receipts == 0
+
+
+def test_recompute_user_stats_of_other_shards_is_skipped(
+    test_client, db_session, user_payload, receipt_payload
+):
+    create_receipts(test_client, user_payload, receipt_payload)
+    db_session.query(UserStats).delete()
+    db_session.commit()
+    user = db_session.query(User).filter_by(login=user_payload["login"]).one()
+
+    assert recompute_user_stats(
+        TestingSessionLocal, user_filter=lambda user_id: user_id != user.id
+    ) == 0
+    assert db_session.query(UserStats).count() == 0
+    assert recompute_shard_user_stats(test_shard_router) == 1
+    assert db_session.get(UserStats, user.id).receipts == 3
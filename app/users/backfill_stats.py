@@ -0,0 +1,136 @@
+"""
+Recomputes the running receipt totals of every user from the receipts table:
+
+    python -m app.users.backfill_stats --batch-size 500
+
+Use it to fill `user_stats` for receipts created before it existed, or to
+repair totals after receipts were changed by hand. Every shard is processed
+for the users it holds, in batches of users, each in its own short transaction.
+"""
+import argparse
+import logging
+from typing import Callable
+
+from sqlalchemy import case, func, select
+
+from app.common.database import UPSERT_DIALECTS, SessionLocal, ShardRouter, shard_router
+from app.receipts.crud import USER_STATS_COUNTERS
+from app.receipts.model import Receipt
+from app.users.model import User, UserStats
+
+logger = logging.getLogger(__name__)
+
+USER_STATS_BATCH_SIZE = 500
+
+
+def recompute_user_stats(
+    session_factory=SessionLocal, batch_size: int = USER_STATS_BATCH_SIZE,
+    user_filter: Callable[[int], bool] = None
+):
+    """
+    Overwrites the running totals of all users with totals computed from receipts.
+
+    The existing totals of a batch are locked before its receipts are
+    aggregated, so receipts created concurrently wait and are counted exactly
+    once, either by the aggregate or by their own increment afterwards.
+
+    Args:
+        session_factory (sessionmaker): The factory of database sessions.
+        batch_size (int): The number of users recomputed per transaction.
+        user_filter (Callable): Optional predicate on user IDs selecting the
+        users to recompute; the main database lists the users of all shards.
+
+    Returns:
+        int: The number of users whose totals were written.
+    """
+    last_user_id = 0
+    updated = 0
+    while True:
+        with session_factory() as db:
+            user_ids = db.scalars(
+                select(User.id).where(User.id > last_user_id).order_by(User.id).limit(batch_size)
+            ).all()
+            if not user_ids:
+                return updated
+            last_user_id = user_ids[-1]
+            if user_filter is not None:
+                user_ids = [user_id for user_id in user_ids if user_filter(user_id)]
+                if not user_ids:
+                    continue
+
+            db.execute(
+                select(UserStats.user_id).where(UserStats.user_id.in_(user_ids))
+                .order_by(UserStats.user_id).with_for_update()
+            ).all()
+
+            def count(payment_type):
+                return func.sum(case((Receipt.type == payment_type, 1), else_=0))
+
+            def total(payment_type):
+                return func.sum(case((Receipt.type == payment_type, Receipt.total), else_=0))
+
+            totals = {
+                row.user_id: row for row in db.execute(
+                    select(
+                        Receipt.user_id,
+                        func.count(Receipt.id).label('receipts'),
+                        func.coalesce(func.sum(Receipt.total), 0).label('total'),
+                        count('cash').label('cash_receipts'),
+                        total('cash').label('cash_total'),
+                        count('cashless').label('cashless_receipts'),
+                        total('cashless').label('cashless_total'),
+                    )
+                    .where(Receipt.user_id.in_(user_ids))
+                    .group_by(Receipt.user_id)
+                )
+            }
+
+            values = []
+            for user_id in user_ids:
+                row = totals.get(user_id)
+                values.append({'user_id': user_id, **{
+                    column: getattr(row, column) if row else 0 for column in USER_STATS_COUNTERS
+                }})
+
+            statement = UPSERT_DIALECTS[db.get_bind().dialect.name](UserStats)
+            db.execute(
+                statement.on_conflict_do_update(
+                    index_elements=['user_id'],
+                    set_={column: statement.excluded[column] for column in USER_STATS_COUNTERS},
+                ),
+                values
+            )
+            db.commit()
+
+        updated += len(user_ids)
+        logger.info("Recomputed receipt totals of %s users", updated)
+
+
+def recompute_shard_user_stats(
+    shards: ShardRouter = shard_router, batch_size: int = USER_STATS_BATCH_SIZE
+) -> int:
+    """
+    Recomputes the running totals of every user on the shard that holds them.
+
+    Args:
+        shards (ShardRouter): The shards of the receipts.
+        batch_size (int): The number of users recomputed per transaction.
+
+    Returns:
+        int: The number of users whose totals were written.
+    """
+    updated = 0
+    for shard in range(len(shards)):
+        updated += recompute_user_stats(
+            shards.sync_session_factory(shard), batch_size,
+            lambda user_id, shard=shard: shards.shard_for_user(user_id) == shard
+        )
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=USER_STATS_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    recompute_shard_user_stats(batch_size=args.batch_size)
@@ -1,18 +1,28 @@
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
-
-from app.common.auth_utils import (create_token, get_password_hash,
-                                   verify_password)
-from app.common.database import get_db
-from app.users.model import User
+from datetime import datetime, timezone
+import time
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.auth_utils import (REVOKED_TOKEN_PURGE_INTERVAL, create_refresh_token,
+                                   create_token, get_password_hash, password_hasher,
+                                   revoked_token_cache, verify_and_update_password)
+from app.common.database import UPSERT_DIALECTS, get_db
+from app.users.model import RevokedToken, User, UserStats
+from app.users.schemas import Principal
 from app.common.auth_utils import decode_token
 
 
 security = HTTPBearer()
 
+# When this process last purged expired revoked tokens, by time.monotonic().
+_revoked_tokens_purged_at = None
+
 
-def create_user(username: str, login: str, password: str, db: Session):
+async def create_user(username: str, login: str, password: str, db: AsyncSession):
     """
     Creates a new user in the database.
 
@@ -20,7 +30,7 @@ def create_user(username: str, login: str, password: str, db: Session):
         username (str): The username of the new user.
         login (str): The unique login of the new user.
         password (str): The password of the new user.
-        db (Session): The database session to interact with the database.
+        db (AsyncSession): The database session to interact with the database.
 
     Returns:
         User: The created user object.
@@ -28,7 +38,7 @@ def create_user(username: str, login: str, password: str, db: Session):
     Raises:
         HTTPException: If a user with the same login already exists.
     """
-    if db.query(User).filter_by(login=login).first():
+    if (await db.scalars(select(User).filter_by(login=login))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already exists"
@@ -37,57 +47,197 @@ def create_user(username: str, login: str, password: str, db: Session):
     user = User(
         username=username,
         login=login,
-        password=get_password_hash(password), 
+        password=await password_hasher.run(get_password_hash, password),
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-def authenticate_user(login: str, password: str, db: Session):
+async def add_user_to_shard(db: AsyncSession, user: User):
     """
-    Authenticates a user by their login and password, and returns a JWT token if valid.
+    Copies a user to the shard that holds their receipts.
+
+    Receipts and their totals reference the user, and rendered receipts show
+    their username, so every shard has the rows of its users. The copy
+    leaves out the password hash, which only the main database keeps. Users
+    already on the shard, e.g. when it is the main database, are skipped.
+
+    Args:
+        db (AsyncSession): A session on the user's shard.
+        user (User): The user to copy.
+    """
+    await db.execute(
+        UPSERT_DIALECTS[db.get_bind().dialect.name](User).on_conflict_do_nothing(),
+        [{'id': user.id, 'username': user.username, 'login': user.login}]
+    )
+    await db.commit()
+
+
+async def authenticate_user(login: str, password: str, db: AsyncSession):
+    """
+    Authenticates a user by their login and password, and returns JWT tokens if valid.
+
+    A password hash made with outdated bcrypt settings is replaced by a fresh
+    one on successful login.
 
     Args:
         login (str): The login of the user.
         password (str): The password of the user.
-        db (Session): The database session to interact with the database.
+        db (AsyncSession): The database session to interact with the database.
 
     Returns:
-        str: A JWT token for the authenticated user.
+        tuple: An access token and a refresh token for the authenticated user.
 
     Raises:
         HTTPException: If the login or password is incorrect or the user does not exist.
     """
-    user = db.query(User).filter_by(login=login).first()
-    if not user or not verify_password(password, user.password):  
+    user = (await db.scalars(select(User).filter_by(login=login))).first()
+    if user:
+        verified, new_hash = await password_hasher.run(
+            verify_and_update_password, password, user.password
+        )
+    if not user or not verified:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User doesn't exist"
         )
 
-    return create_token(data={"sub": user.login})  
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
+    claims = {"sub": user.login, "uid": user.id, "username": user.username}
+    return create_token(data=claims), create_refresh_token(data=claims)
+
+
+async def purge_revoked_tokens(db: AsyncSession) -> int:
+    """
+    Deletes the revoked refresh tokens that have expired, without committing.
+
+    Expired tokens fail validation anyway, so their ids no longer need to be kept.
+
+    Args:
+        db (AsyncSession): The database session to interact with the database.
+
+    Returns:
+        int: The number of tokens deleted.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    result = await db.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+    return result.rowcount
+
+
+async def refresh_tokens(refresh_token: str, db: AsyncSession):
+    """
+    Exchanges a refresh token for a new access token and refresh token.
+
+    Refresh tokens are single use: the presented token's id is stored in the
+    revocation table before new tokens are issued, and the unique key on that
+    table rejects a token that was already used. Recently used ids are also
+    kept in memory so replays are rejected without a database round-trip.
+    Every `REVOKED_TOKEN_PURGE_INTERVAL` seconds, a refresh also deletes the
+    revoked tokens that have expired, so the table only holds live ones.
+
+    Args:
+        refresh_token (str): The refresh token issued at login or by a previous refresh.
+        db (AsyncSession): The database session to interact with the database.
 
+    Returns:
+        tuple: A new access token and refresh token.
 
-def get_current_user(
+    Raises:
+        HTTPException: If the refresh token is invalid, expired or already used.
+    """
+    payload = decode_token(refresh_token)
+    if payload.get('type') != 'refresh' or revoked_token_cache.get(payload['jti']):
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    global _revoked_tokens_purged_at
+    purge_due = (
+        _revoked_tokens_purged_at is None
+        or time.monotonic() - _revoked_tokens_purged_at >= REVOKED_TOKEN_PURGE_INTERVAL
+    )
+    if purge_due:
+        await purge_revoked_tokens(db)
+    db.add(RevokedToken(
+        jti=payload['jti'],
+        user_id=payload['uid'],
+        expires_at=datetime.fromtimestamp(payload['exp'], timezone.utc).replace(tzinfo=None)
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        revoked_token_cache.set(payload['jti'], {'exp': payload['exp']})
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    revoked_token_cache.set(payload['jti'], {'exp': payload['exp']})
+    if purge_due:
+        _revoked_tokens_purged_at = time.monotonic()
+
+    claims = {"sub": payload['sub'], "uid": payload['uid'], "username": payload.get('username')}
+    return create_token(data=claims), create_refresh_token(data=claims)
+
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Security(security), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Retrieves the current authenticated user based on the provided token.
 
+    The principal is built from the token claims, so no query is made for
+    tokens that carry the user id. Tokens issued before the `uid` claim was
+    added are resolved through the database.
+
     Args:
         credentials (HTTPAuthorizationCredentials): The HTTP authorization credentials 
         containing the token.
-        db (Session): The database session to interact with the database.
+        db (AsyncSession): The database session to interact with the database.
 
     Returns:
-        User: The user object corresponding to the authenticated user.
+        Principal: The principal of the authenticated user.
 
     Raises:
-        HTTPException: If the token is invalid or expired.
+        HTTPException: If the token is invalid or expired, or its user doesn't exist.
     """
     token = credentials.credentials
     payload = decode_token(token)
-    return db.query(User).filter_by(login=payload['sub']).first()
+    if payload.get('type') == 'refresh':
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if 'uid' in payload:
+        return Principal(id=payload['uid'], login=payload['sub'], username=payload.get('username'))
+
+    user = (await db.scalars(select(User).filter_by(login=payload['sub']))).first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return Principal(id=user.id, login=user.login, username=user.username)
+
+
+async def get_user(db: AsyncSession, principal: Principal):
+    """
+    Loads the user row of a principal, for handlers that need more than its claims.
+
+    Args:
+        db (AsyncSession): The database session to interact with the database.
+        principal (Principal): The principal of the authenticated user.
+
+    Returns:
+        User: The user object, or None if the user no longer exists.
+    """
+    return await db.get(User, principal.id)
+
+
+async def get_user_stats(db: AsyncSession, principal: Principal):
+    """
+    Retrieves the running totals of a user's receipts with a primary-key lookup.
+
+    Args:
+        db (AsyncSession): The database session to interact with the database.
+        principal (Principal): The principal of the authenticated user.
+
+    Returns:
+        UserStats: The totals, or None if the user hasn't created any receipts.
+    """
+    return await db.get(UserStats, principal.id)
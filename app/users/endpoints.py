@@ -1,23 +1,34 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.common.database import get_db
-from app.users.crud import authenticate_user, create_user
-from app.users.schemas import TokenResponse, UserAuth, UserCreate, UserResponse
+from app.common.database import ShardRouter, get_db, get_shard_router
+from app.common.dependencies import get_user_read_db, require_auth
+from app.users.crud import (add_user_to_shard, authenticate_user, create_user, get_user_stats,
+                            refresh_tokens)
+from app.users.schemas import (RefreshRequest, TokenResponse, UserAuth, UserCreate,
+                               UserResponse, UserStatsResponse)
 
 
 router = APIRouter()
 
 
 @router.post("/sign-up/", response_model=UserResponse)
-def registration(user_data: UserCreate, db: Session = Depends(get_db)):
+async def registration(
+    user_data: UserCreate,
+    db: AsyncSession = Depends(get_db),
+    shards: ShardRouter = Depends(get_shard_router)
+):
     """
     Endpoint to register a new user.
 
+    The user is created in the main database and copied to the shard that
+    will hold their receipts.
+
     Args:
         user_data (UserCreate): The data of the user to be created, 
         including username, login, and password.
-        db (Session): The database session to interact with the database.
+        db (AsyncSession): The database session to interact with the database.
+        shards (ShardRouter): The shards of the receipts.
 
     Returns:
         UserResponse: The created user object, serialized as a response.
@@ -25,24 +36,65 @@ def registration(user_data: UserCreate, db: Session = Depends(get_db)):
     Raises:
         HTTPException: If a user with the same login already exists.
     """
-    user = create_user(user_data.username, user_data.login, user_data.password, db)
+    user = await create_user(user_data.username, user_data.login, user_data.password, db)
+    async with shards.session(shards.shard_for_user(user.id)) as shard_db:
+        await add_user_to_shard(shard_db, user)
     return user  
 
 
 @router.post("/login/", response_model=TokenResponse)
-def authorize(user_data: UserAuth, db: Session = Depends(get_db)):
+async def authorize(user_data: UserAuth, db: AsyncSession = Depends(get_db)):
     """
-    Endpoint to authenticate a user and return an access token.
+    Endpoint to authenticate a user and return an access token and a refresh token.
 
     Args:
         user_data (UserAuth): The login and password credentials of the user.
-        db (Session): The database session to interact with the database.
+        db (AsyncSession): The database session to interact with the database.
 
     Returns:
-        TokenResponse: The generated JWT access token as a response.
+        TokenResponse: The generated JWT access and refresh tokens as a response.
     
     Raises:
         HTTPException: If the login or password is incorrect, or the user does not exist.
     """
-    access_token = authenticate_user(user_data.login, user_data.password, db)
-    return TokenResponse(token=access_token)
+    access_token, refresh_token = await authenticate_user(
+        user_data.login, user_data.password, db
+    )
+    return TokenResponse(token=access_token, refresh_token=refresh_token)
+
+
+@router.post("/refresh/", response_model=TokenResponse)
+async def refresh(refresh_data: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Endpoint to exchange a refresh token for new tokens without checking the password.
+
+    Args:
+        refresh_data (RefreshRequest): The refresh token issued at login or by a
+        previous refresh. It can only be used once.
+        db (AsyncSession): The database session to interact with the database.
+
+    Returns:
+        TokenResponse: A new JWT access token and refresh token as a response.
+
+    Raises:
+        HTTPException: If the refresh token is invalid, expired or already used.
+    """
+    access_token, refresh_token = await refresh_tokens(refresh_data.refresh_token, db)
+    return TokenResponse(token=access_token, refresh_token=refresh_token)
+
+
+@router.get("/me/stats", response_model=UserStatsResponse)
+async def my_stats(user=Depends(require_auth), db: AsyncSession = Depends(get_user_read_db)):
+    """
+    Endpoint to get the number and totals of the authenticated user's receipts.
+
+    Args:
+        user (Principal): The authenticated user.
+        db (AsyncSession): The database session to interact with the database.
+
+    Returns:
+        UserStatsResponse: The number of receipts and their lifetime total,
+        overall and per payment type.
+    """
+    stats = await get_user_stats(db, user)
+    return UserStatsResponse.model_validate(stats) if stats else UserStatsResponse()
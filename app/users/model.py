@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Index, Integer, String
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from app.common.database import Base
@@ -14,6 +14,26 @@ class User(Base):
 
     receipts = relationship("Receipt", back_populates='user')
 
+
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
     __table_args__ = (
-        Index('ix_user_login', 'login'),  
-    )
\ No newline at end of file
+        Index('ix_revoked_token_expires_at', 'expires_at'),
+    )
+
+
+class UserStats(Base):
+    __tablename__ = 'user_stats'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    receipts = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0)
+    cash_receipts = Column(Integer, nullable=False, default=0)
+    cash_total = Column(Float, nullable=False, default=0)
+    cashless_receipts = Column(Integer, nullable=False, default=0)
+    cashless_total = Column(Float, nullable=False, default=0)
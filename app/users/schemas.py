@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -16,8 +18,31 @@ class UserResponse(BaseModel):
 
 class TokenResponse(BaseModel):
     token: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class UserAuth(BaseModel):
     login: str
     password: str
+
+
+class Principal(BaseModel):
+    id: int
+    login: str
+    username: Optional[str] = None
+
+
+class UserStatsResponse(BaseModel):
+    receipts: int = 0
+    total: float = 0
+    cash_receipts: int = 0
+    cash_total: float = 0
+    cashless_receipts: int = 0
+    cashless_total: float = 0
+
+    class Config:
+        from_attributes = True
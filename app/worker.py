@@ -0,0 +1,68 @@
+"""
+Runs background report jobs:
+
+    python -m app.worker
+
+Jobs are claimed from the `report_jobs` table and run in a pool of
+`REPORT_WORKERS` processes. Jobs left running by a previous worker are
+resumed from their last recorded chunk on start, so only one worker should
+be started per database.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.common.database import async_engine, shard_router
+from app.reports.jobs import REPORTS_DIR, claim_next_job, requeue_interrupted_jobs, run_report_job
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 2))
+REPORT_POLL_INTERVAL = float(os.getenv("REPORT_POLL_INTERVAL", 1))
+
+
+def run_job(job_id: str):
+    """
+    Runs a report job inside a pool process.
+    """
+    async def run():
+        try:
+            await run_report_job(job_id)
+        finally:
+            # Pooled connections are bound to the event loop that is about to close.
+            await async_engine.dispose()
+            await shard_router.dispose()
+
+    asyncio.run(run())
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    requeued = requeue_interrupted_jobs()
+    if requeued:
+        logger.info("Resuming %s interrupted report jobs", requeued)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=context) as pool:
+        running = set()
+        while True:
+            while len(running) < REPORT_WORKERS:
+                job_id = claim_next_job()
+                if job_id is None:
+                    break
+                logger.info("Running report job %s", job_id)
+                running.add(pool.submit(run_job, job_id))
+            if running:
+                _, running = wait(
+                    running, timeout=REPORT_POLL_INTERVAL, return_when=FIRST_COMPLETED
+                )
+            else:
+                time.sleep(REPORT_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures receipt ingestion throughput of POST /receipts/ versus POST /receipts/bulk.
+
+Runs the crud layer against a temporary SQLite database, or against
+BENCH_DATABASE_URL when it is set:
+
+    python benchmarks/bench_bulk_ingest.py --receipts 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.common.database import Base, get_async_database_url  # noqa: E402
+from app.receipts.crud import create_receipt, create_receipts_bulk  # noqa: E402
+from app.receipts.schemas import ReceiptCreateSchema  # noqa: E402
+from app.users.model import User  # noqa: E402
+
+
+def make_receipt(products_per_receipt):
+    return ReceiptCreateSchema(
+        payment={"type": "cash", "amount": 10_000.0},
+        products=[
+            {"name": f"Product {i}", "price": 1.5, "quantity": 2}
+            for i in range(products_per_receipt)
+        ],
+    )
+
+
+async def run(receipts, products_per_receipt):
+    engine = create_engine(BENCH_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(get_async_database_url(BENCH_DATABASE_URL))
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        user = User(username="bench", login=f"bench-{time.time_ns()}", password="-")
+        db.add(user)
+        await db.commit()
+
+        payload = [make_receipt(products_per_receipt) for _ in range(receipts)]
+
+        started = time.perf_counter()
+        for receipt in payload:
+            await create_receipt(db, user, receipt)
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await create_receipts_bulk(db, user, payload)
+        bulk = time.perf_counter() - started
+
+    await async_engine.dispose()
+    print(f"{receipts} receipts x {products_per_receipt} products")
+    print(f"  one request per receipt: {receipts / single:10.0f} receipts/s")
+    print(f"  bulk:                    {receipts / bulk:10.0f} receipts/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.receipts, args.products))
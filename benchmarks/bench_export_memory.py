@@ -0,0 +1,98 @@
+"""
+Measures the peak memory used to export a user's receipts through the
+streaming exporter, compared with loading every receipt through the ORM:
+
+    python benchmarks/bench_export_memory.py --receipts 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import orjson  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.common.database import Base, get_async_database_url  # noqa: E402
+from app.receipts.crud import create_receipts_bulk, get_receipts, stream_receipts  # noqa: E402
+from app.receipts.export import EXPORT_FORMATS  # noqa: E402
+from app.receipts.filters import ReceiptFilter  # noqa: E402
+from app.receipts.schemas import ReceiptCreateSchema  # noqa: E402
+from app.users.model import User  # noqa: E402
+
+
+async def measure(export):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = await export()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+async def run(receipts, products_per_receipt):
+    engine = create_engine(BENCH_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(get_async_database_url(BENCH_DATABASE_URL))
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        user = User(username="bench", login=f"bench-{time.time_ns()}", password="-")
+        db.add(user)
+        await db.commit()
+        receipt = ReceiptCreateSchema(
+            payment={"type": "cash", "amount": 10_000.0},
+            products=[
+                {"name": f"Product {i}", "price": 1.5, "quantity": 2}
+                for i in range(products_per_receipt)
+            ],
+        )
+        await create_receipts_bulk(db, user, [receipt] * receipts)
+
+    async def export_loaded():
+        async with session_factory() as db:
+            loaded, _ = await get_receipts(db, user, ReceiptFilter(), receipts, 0)
+            return len(b"".join(orjson.dumps(r.to_dict()) + b"\n" for r in loaded))
+
+    def export_streamed(export_format):
+        async def export():
+            render, _ = EXPORT_FORMATS[export_format]
+            async with session_factory() as db:
+                size = 0
+                async for chunk in render(stream_receipts(db, user, ReceiptFilter())):
+                    size += len(chunk)
+                return size
+        return export
+
+    print(f"{receipts} receipts x {products_per_receipt} products")
+    for name, export in [
+        ("loaded ndjson", export_loaded),
+        ("streamed ndjson", export_streamed("ndjson")),
+        ("streamed csv", export_streamed("csv")),
+    ]:
+        size, elapsed, peak = await measure(export)
+        print(f"  {name:16} {size / 2 ** 20:8.1f} MiB out in {elapsed:6.2f}s, "
+              f"peak {peak / 2 ** 20:8.1f} MiB")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.receipts, args.products))
@@ -0,0 +1,103 @@
+"""
+Measures the throughput and latency of concurrent receipt creation with one
+commit per receipt, compared with group commit at several batch windows:
+
+    python benchmarks/bench_group_commit.py --receipts 2000 --concurrency 200
+
+Commits are only expensive when they reach the disk, so point
+BENCH_DATABASE_URL at the database you deploy on for meaningful numbers.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.common.database import Base, get_async_database_url  # noqa: E402
+from app.receipts.crud import create_receipt  # noqa: E402
+from app.receipts.schemas import ReceiptCreateSchema  # noqa: E402
+from app.receipts.writer import ReceiptWriter  # noqa: E402
+from app.users.model import User  # noqa: E402
+
+RECEIPT = ReceiptCreateSchema(
+    payment={"type": "cash", "amount": 100.0},
+    products=[{"name": f"Product {i}", "price": 1.5, "quantity": 2} for i in range(3)],
+)
+
+
+async def measure(session_factory, user, receipts, concurrency, writer):
+    """
+    Creates receipts from `concurrency` concurrent clients, each with its own
+    session like a request would have.
+    """
+    latencies = []
+    remaining = iter(range(receipts))
+
+    async def client():
+        for _ in remaining:
+            started = time.perf_counter()
+            async with session_factory() as db:
+                await create_receipt(db, user, RECEIPT, writer)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    if writer is not None:
+        await writer.stop()
+    return elapsed, latencies
+
+
+async def run(receipts, concurrency, windows, max_size):
+    engine = create_engine(BENCH_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    # SQLite allows one writer at a time, so clients queue for a single connection there.
+    pool_size = 1 if engine.dialect.name == "sqlite" else concurrency
+    async_engine = create_async_engine(
+        get_async_database_url(BENCH_DATABASE_URL), pool_size=pool_size, max_overflow=0
+    )
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        user = User(username="bench", login=f"bench-{time.time_ns()}", password="-")
+        db.add(user)
+        await db.commit()
+
+    print(f"{receipts} receipts from {concurrency} concurrent clients")
+    for window in [None, *windows]:
+        writer = None
+        name = "commit per receipt"
+        if window is not None:
+            writer = ReceiptWriter(session_factory, window / 1000, max_size)
+            name = f"group commit {window:g} ms"
+        elapsed, latencies = await measure(session_factory, user, receipts, concurrency, writer)
+        latencies.sort()
+        print(f"  {name:20} {receipts / elapsed:8.0f} receipts/s, "
+              f"median {statistics.median(latencies) * 1000:7.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} ms")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--windows", type=float, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--max-size", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.receipts, args.concurrency, args.windows, args.max_size))
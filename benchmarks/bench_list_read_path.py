@@ -0,0 +1,97 @@
+"""
+Measures the peak memory and CPU time of rendering a page of receipts through
+the ORM-free `get_receipt_rows`, compared with loading them through the ORM
+with `get_receipts`:
+
+    python benchmarks/bench_list_read_path.py --receipts 5000 --page-size 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import orjson  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.common.database import Base, get_async_database_url  # noqa: E402
+from app.receipts.crud import create_receipts_bulk, get_receipt_rows, get_receipts  # noqa: E402
+from app.receipts.filters import ReceiptFilter  # noqa: E402
+from app.receipts.schemas import ReceiptCreateSchema  # noqa: E402
+from app.users.model import User  # noqa: E402
+
+
+async def measure(session_factory, user, read_page, page_size):
+    """
+    Reads every page of the user's receipts with a fresh session per page,
+    like the list endpoint does, and renders each one to JSON.
+    """
+    tracemalloc.start()
+    peak = 0
+    pages = 0
+    started = time.process_time()
+    cursor = None
+    while True:
+        tracemalloc.reset_peak()
+        async with session_factory() as db:
+            receipts, cursor = await read_page(db, user, ReceiptFilter(), page_size, 0, cursor)
+            orjson.dumps([receipt.to_dict() for receipt in receipts])
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        pages += 1
+        if cursor is None:
+            break
+    elapsed = time.process_time() - started
+    tracemalloc.stop()
+    return pages, elapsed, peak
+
+
+async def run(receipts, products_per_receipt, page_size):
+    engine = create_engine(BENCH_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(get_async_database_url(BENCH_DATABASE_URL))
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        user = User(username="bench", login=f"bench-{time.time_ns()}", password="-")
+        db.add(user)
+        await db.commit()
+        receipt = ReceiptCreateSchema(
+            payment={"type": "cash", "amount": 10_000.0},
+            products=[
+                {"name": f"Product {i}", "price": 1.5, "quantity": 2}
+                for i in range(products_per_receipt)
+            ],
+        )
+        await create_receipts_bulk(db, user, [receipt] * receipts)
+
+    print(f"{receipts} receipts x {products_per_receipt} products, pages of {page_size}")
+    for name, read_page in [
+        ("ORM get_receipts", get_receipts),
+        ("Core get_receipt_rows", get_receipt_rows),
+    ]:
+        pages, elapsed, peak = await measure(session_factory, user, read_page, page_size)
+        print(f"  {name:22} {elapsed / pages * 1000:7.2f} ms CPU/page, "
+              f"peak {peak / 2 ** 10:8.1f} KiB/page")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.receipts, args.products, args.page_size))
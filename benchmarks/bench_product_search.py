@@ -0,0 +1,109 @@
+"""
+Measures how long it takes to find the receipts with a given product through
+the indexed `product_name` filter, compared with a LIKE over the catalog names:
+
+    python benchmarks/bench_product_search.py --line-items 10000000
+
+Line items are inserted directly through the Core, so seeding a large dataset
+takes a few minutes rather than hours. Point BENCH_DATABASE_URL at PostgreSQL
+to measure the pg_trgm index instead of the SQLite FTS5 one.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DATABASE_URL = os.getenv(
+    "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+os.environ.setdefault("DATABASE_URL", BENCH_DATABASE_URL)
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import create_engine, func, insert, select  # noqa: E402
+
+from app.common.database import Base  # noqa: E402
+from app.products.model import Product, ProductCatalog  # noqa: E402
+from app.receipts.filters import ReceiptFilter  # noqa: E402
+from app.receipts.model import Receipt  # noqa: E402
+from app.users.model import User  # noqa: E402
+
+WORDS = [
+    "Apple", "Banana", "Cherry", "Milk", "Bread", "Butter", "Cheese", "Coffee",
+    "Tea", "Sugar", "Salt", "Rice", "Pasta", "Tomato", "Potato", "Onion",
+]
+SEED_BATCH_SIZE = 50000
+SEARCHES = ["Banana", "Banana 1233", "Chee"]
+
+
+def seed(engine, line_items, products_per_receipt, names):
+    with engine.begin() as connection:
+        user_id = connection.execute(
+            insert(User).values(username="bench", login="bench", password="-")
+            .returning(User.id)
+        ).scalar_one()
+        connection.execute(insert(ProductCatalog), [
+            {"id": i + 1, "name": f"{WORDS[i % len(WORDS)]} {i}"} for i in range(names)
+        ])
+
+    receipts = line_items // products_per_receipt
+    created_at = datetime(2025, 3, 1)
+    for start in range(0, receipts, SEED_BATCH_SIZE):
+        batch = range(start + 1, min(start + SEED_BATCH_SIZE, receipts) + 1)
+        with engine.begin() as connection:
+            connection.execute(insert(Receipt), [
+                {"id": receipt_id, "user_id": user_id, "type": "cash", "amount": 100.0,
+                 "total": 10.0, "rest": 90.0, "created_at": created_at}
+                for receipt_id in batch
+            ])
+            items = []
+            for receipt_id in batch:
+                for position in range(products_per_receipt):
+                    catalog_index = (receipt_id * 7919 + position * 104729) % names
+                    items.append({
+                        "receipt_id": receipt_id, "catalog_id": catalog_index + 1,
+                        "price": 1.0, "quantity": 2, "total": 2.0,
+                    })
+            connection.execute(insert(Product), items)
+        print(f"  seeded {batch[-1] * products_per_receipt} line items", end="\r")
+    print()
+
+
+def measure(engine, query):
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        found = connection.execute(select(func.count()).select_from(query.subquery())).scalar()
+    return found, time.perf_counter() - started
+
+
+def run(line_items, products_per_receipt, names):
+    engine = create_engine(BENCH_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    print(f"{line_items} line items, {products_per_receipt} per receipt, {names} names")
+    seed(engine, line_items, products_per_receipt, names)
+
+    for term in SEARCHES:
+        scanned = select(Receipt.id).where(Receipt.id.in_(
+            select(Product.receipt_id)
+            .join(ProductCatalog, ProductCatalog.id == Product.catalog_id)
+            .where(ProductCatalog.name.ilike(f"%{term}%"))
+        ))
+        indexed = ReceiptFilter(product_name=term).filter(select(Receipt.id))
+        for name, query in [("LIKE catalog name", scanned), ("product_name filter", indexed)]:
+            found, elapsed = measure(engine, query)
+            print(f"  {term!r:14} {name:20} {found:9} receipts in {elapsed:8.3f}s")
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--line-items", type=int, default=10000000)
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--names", type=int, default=100000)
+    args = parser.parse_args()
+    run(args.line_items, args.products, args.names)
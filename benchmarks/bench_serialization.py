@@ -0,0 +1,81 @@
+"""
+Measures the CPU time spent serializing a page of receipts:
+
+    python benchmarks/bench_serialization.py --receipts 100 --products 20
+
+Compares the previous `to_dict` + stdlib `json` path with `to_dict` + orjson,
+which the API uses now, and with validating the ORM rows into `ReceiptSchema`
+and dumping them with pydantic-core.
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from typing import List  # noqa: E402
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.products.model import Product  # noqa: E402
+from app.receipts.model import Receipt  # noqa: E402
+from app.receipts.schemas import ReceiptSchema  # noqa: E402
+from app.users.model import User  # noqa: F401, E402
+
+
+def make_page(receipts, products_per_receipt):
+    return [
+        Receipt(
+            id=receipt_id, type="cash", amount=1000.0, total=600.0, rest=400.0,
+            created_at=datetime.now(), user_id=1,
+            products=[
+                Product(name=f"Product {i}", price=1.5, quantity=20, total=30.0)
+                for i in range(products_per_receipt)
+            ],
+        )
+        for receipt_id in range(receipts)
+    ]
+
+
+def run(receipts, products_per_receipt, repeat):
+    page = make_page(receipts, products_per_receipt)
+
+    adapter = TypeAdapter(List[ReceiptSchema])
+
+    def stdlib_json():
+        return JSONResponse([receipt.to_dict() for receipt in page]).body
+
+    def orjson():
+        return ORJSONResponse([receipt.to_dict() for receipt in page]).body
+
+    def pydantic_core():
+        return adapter.dump_json(adapter.validate_python(page, from_attributes=True))
+
+    print(f"{receipts} receipts x {products_per_receipt} products per page")
+    baseline = None
+    for name, serialize in (
+        ("to_dict + json", stdlib_json),
+        ("to_dict + orjson", orjson),
+        ("pydantic-core", pydantic_core),
+    ):
+        cpu_time = timeit.timeit(serialize, number=repeat, timer=time.process_time) / repeat
+        baseline = baseline or cpu_time
+        print(f"  {name:18} {cpu_time * 1000:8.2f} ms CPU/page"
+              f"  ({(baseline - cpu_time) * 1000:+.2f} ms saved)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--receipts", type=int, default=100)
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run(args.receipts, args.products, args.repeat)